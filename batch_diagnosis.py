@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:11
+
+@Author: Sun Jiahua
+
+@File  : batch_diagnosis.py
+
+@Desc  : 命令行批量诊断（不需要图形界面）：
+            对一个文件夹（或通配符匹配到的）所有 .mat 文件，用进程池并行诊断，每个进程只加载一次模型，
+            结果输出为 CSV 或 JSON 报告，包含每个文件的投票数、平均概率、置信度和耗时
+
+            可以按负载、采样频率、故障类型选择文件（由数据集目录 dataset_catalog 按文件名解析），
+            采样频率与模型不同的文件先重采样到模型的采样频率，不同采样频率的文件可以用同一个模型一起诊断
+
+            指定 --hop 时不再随机抽样，而是以 hop 为间隔取遍整个文件（diagnosis.diagnose_timeline），
+            每批 --batch-size 个窗口送入模型，报告中包含每个文件的诊断时间线（连续同一类别的窗口合并为一段）、
+            吞吐量、实时倍数和每批的延迟
+
+            用法示例：
+                python batch_diagnosis.py random_forest.m real_time_data/0HP --workers 4 --output report.csv
+                python batch_diagnosis.py random_forest.m 'real_time_data/**/*.mat' --load 0 1 --sample-rate 48000
+                python batch_diagnosis.py random_forest.m real_time_data/0HP --hop 432 --output timeline.json
+"""
+
+import os
+import sys
+import glob
+import json
+import csv
+import time
+import argparse
+from multiprocessing import Pool
+
+from data_preprocess import diagnosis_stage_prepro, load_rpm
+from dataset_catalog import scan_catalog
+from diagnosis import default_settings, diagnose, diagnose_timeline
+from model_bundle import model_type
+from model_registry import model_registry
+
+_worker_settings = {}  # 每个工作进程的设置
+
+
+def find_files(inputs):
+    '''
+    找到所有要诊断的 .mat 文件
+    :param inputs: 文件夹、文件 或 通配符 的列表
+    :return: file_paths：排好序的文件路径列表
+    '''
+    file_paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            file_paths.update(glob.glob(os.path.join(item, '*.mat')))
+        else:
+            file_paths.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(file_paths)
+
+
+def init_worker(model_file_path, signal_length, signal_number, normal, early_stop, n_jobs=1, hop=None,
+                batch_size=256):
+    '''
+    工作进程的初始化：加载模型（每个进程只加载一次），记录诊断设置
+    :return:
+    '''
+    bundle = model_registry.get_bundle(model_file_path)
+    if 'random_forest' == model_type(model_file_path):
+        bundle.model.n_jobs = n_jobs  # 每个进程的预测线程数，所有进程加起来不超过 CPU 核数
+    # 训练时保存的标准化参数，只有信号长度与训练时相同才能使用
+    scaler_stats = bundle.scaler_stats if signal_length == bundle.signal_length else None
+    _worker_settings.update(model_file_path=model_file_path, signal_length=signal_length,
+                            signal_number=signal_number, normal=normal, scaler_stats=scaler_stats,
+                            channels=bundle.channels, sample_rate=bundle.sample_rate, early_stop=early_stop,
+                            hop=hop, batch_size=batch_size)
+
+
+def diagnose_file(data_path):
+    '''
+    在工作进程中诊断一个文件
+    :param data_path: .mat 文件路径
+    :return: record：诊断结果字典
+    '''
+    model_file_path = _worker_settings['model_file_path']
+    record = {'file': data_path, 'pid': os.getpid()}
+    start = time.perf_counter()
+    try:
+        if _worker_settings['hop']:  # 取遍整个文件
+            timeline = diagnose_timeline(data_path, model_file_path, _worker_settings['hop'],
+                                         _worker_settings['batch_size'], _worker_settings['signal_length'],
+                                         _worker_settings['normal'])
+            record.update(timeline.result.to_dict())
+            record.update(timeline.summary())
+            record['timeline'] = timeline.segments()
+            record['total_time'] = time.perf_counter() - start
+            return record
+        diagnosis_samples = diagnosis_stage_prepro(data_path, _worker_settings['signal_length'],
+                                                   _worker_settings['signal_number'], _worker_settings['normal'],
+                                                   _worker_settings['scaler_stats'],
+                                                   channels=_worker_settings['channels'],
+                                                   sample_rate=_worker_settings['sample_rate'])
+        prepro_end = time.perf_counter()
+        result = diagnose(diagnosis_samples, model_file_path, early_stop=_worker_settings['early_stop'],
+                          rpm=load_rpm(data_path))
+        record.update(result.to_dict())
+        record.update(prepro_time=prepro_end - start, diagnosis_time=time.perf_counter() - prepro_end)
+    except Exception as e:  # 一个文件出错不影响其他文件
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    record['total_time'] = time.perf_counter() - start
+    return record
+
+
+def batch_diagnosis(model_file_path, file_paths, workers=None, signal_length=None, signal_number=500, normal=None,
+                    early_stop=True, n_jobs=None, hop=None, batch_size=256):
+    '''
+    用进程池并行诊断多个文件
+    :param model_file_path: 模型路径
+    :param file_paths: .mat 文件路径列表
+    :param workers: 工作进程数，默认为 CPU 核数
+    :param signal_length: 信号长度，默认与训练时一致
+    :param signal_number: 每个文件抽取的样本数
+    :param normal: 是否标准化，默认与训练时一致
+    :param early_stop: 诊断结果确定后是否提前结束
+    :param n_jobs: 每个工作进程中随机森林预测使用的线程数，默认为 CPU 核数 / 工作进程数
+    :param hop: 不为 None 时以 hop 为间隔取遍整个文件（不随机抽样），见 diagnose_timeline
+    :param batch_size: 取遍整个文件时每批送入模型的窗口数
+    :return: records：每个文件的诊断结果（与 file_paths 顺序相同）
+             elapsed：总耗时
+    '''
+    default_length, default_normal = default_settings(model_file_path)
+    signal_length = signal_length or default_length
+    normal = default_normal if normal is None else normal
+    workers = workers or os.cpu_count() or 1
+    n_jobs = n_jobs or max((os.cpu_count() or 1) // workers, 1)
+
+    start = time.perf_counter()
+    with Pool(processes=workers, initializer=init_worker,
+              initargs=(model_file_path, signal_length, signal_number, normal, early_stop, n_jobs, hop,
+                        batch_size)) as pool:
+        records = pool.map(diagnose_file, file_paths, chunksize=1)
+    return records, time.perf_counter() - start
+
+
+def write_report(records, output_path=None):
+    '''
+    输出诊断报告，后缀为 .csv 时输出 CSV，否则输出 JSON；output_path 为 None 时输出到标准输出（JSON）
+    :param records: 诊断结果
+    :param output_path: 报告路径
+    :return:
+    '''
+    if output_path is not None and output_path.endswith('.csv'):
+        num_classes = max([len(record.get('votes', [])) for record in records] + [0])  # 模型的分类数
+        fields = ['file', 'pred', 'pred_result', 'confidence', 'margin', 'window_number', 'total_number'] + \
+                 ['vote_%d' % i for i in range(num_classes)] + ['proba_%d' % i for i in range(num_classes)] + \
+                 ['prepro_time', 'diagnosis_time', 'total_time', 'pid', 'error']
+        if any('timeline' in record for record in records):  # 取遍整个文件的统计结果（时间线只在 JSON 报告中输出）
+            fields[-5:-5] = ['windows', 'duration', 'elapsed', 'windows_per_second', 'realtime_factor',
+                             'batch_latency_p50_ms', 'batch_latency_p95_ms', 'batch_latency_max_ms']
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for record in records:
+                row = dict(record)
+                for i, vote in enumerate(row.pop('votes', [])):
+                    row['vote_%d' % i] = vote
+                for i, probability in enumerate(row.pop('probabilities', [])):
+                    row['proba_%d' % i] = probability
+                writer.writerow(row)
+        return
+
+    text = json.dumps(records, ensure_ascii=False, indent=2)
+    if output_path is None:
+        print(text)
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='命令行批量故障诊断')
+    parser.add_argument('model', help='模型路径（.m 或 .h5）')
+    parser.add_argument('inputs', nargs='+', help='要诊断的 .mat 文件、文件夹 或 通配符')
+    parser.add_argument('--workers', type=int, help='工作进程数，默认为 CPU 核数')
+    parser.add_argument('--jobs', type=int, help='每个工作进程中随机森林预测使用的线程数，默认为 CPU 核数 / 工作进程数')
+    parser.add_argument('--signal-length', type=int, help='信号长度，默认与训练时一致')
+    parser.add_argument('--signal-number', type=int, default=500, help='每个文件抽取的样本数')
+    parser.add_argument('--output', help='报告路径（.csv 或 .json），默认输出到标准输出')
+    parser.add_argument('--no-early-stop', action='store_true', help='诊断所有样本，不提前结束')
+    parser.add_argument('--load', type=int, nargs='+', help='只诊断这些负载（马力）的文件')
+    parser.add_argument('--sample-rate', type=int, nargs='+', help='只诊断这些采样频率的文件')
+    parser.add_argument('--fault', nargs='+', help='只诊断这些故障类型的文件：B、IR、OR、normal')
+    parser.add_argument('--hop', type=int, help='以 hop 为间隔取遍整个文件（不随机抽样），输出诊断时间线')
+    parser.add_argument('--batch-size', type=int, default=256, help='取遍整个文件时每批送入模型的窗口数')
+    args = parser.parse_args(argv)
+
+    file_paths = find_files(args.inputs)
+    conditions = dict((key, value) for key, value in
+                      (('load', args.load), ('sample_rate', args.sample_rate), ('fault', args.fault)) if value)
+    if file_paths and conditions:  # 按文件名解析出的信息选择文件
+        file_paths = scan_catalog(file_paths).query(**conditions).paths()
+    if not file_paths:
+        print('没有找到 .mat 文件', file=sys.stderr)
+        return 1
+
+    records, elapsed = batch_diagnosis(args.model, file_paths, args.workers, args.signal_length, args.signal_number,
+                                       early_stop=not args.no_early_stop, n_jobs=args.jobs, hop=args.hop,
+                                       batch_size=args.batch_size)
+    write_report(records, args.output)
+    failed = sum(1 for record in records if 'error' in record)
+    print('诊断完成：%d 个文件，失败 %d 个，总耗时 %.2f s' % (len(records), failed, elapsed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
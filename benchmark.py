@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:07
+
+@Author: Sun Jiahua
+
+@File  : benchmark.py
+
+@Desc  : 性能测试：
+            对 信号缓存、训练阶段预处理、特征提取、随机森林训练、诊断 各个阶段分别计时，
+            统计 耗时、峰值内存（RSS）和 吞吐量（样本/秒），结果保存为 JSON，方便比较不同提交之间的性能变化。
+            每个阶段在单独的子进程中运行，峰值内存互不影响。
+            数据集使用自带的 real_time_data/0HP，以及按指定长度生成的模拟信号
+
+            用法示例：
+                python benchmark.py --output bench.json
+                python benchmark.py --output new.json --compare bench.json
+                python benchmark.py features --signal-number 10000     # 逐样本特征提取 与 批量特征提取 的对比，
+                                                                       # 以及数据流上在线（增量）特征提取 与 每个窗口重新提取 的对比
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from queue import Empty
+
+import numpy as np
+
+from feature_extraction import FEATURE_SETS, feature_extraction, batch_feature_extraction, extract_features
+from online_features import OnlineFeatures
+
+STAGES = ['signal_cache', 'preprocess', 'feature_extraction', 'feature_cache', 'training', 'diagnosis']
+
+
+def timeit(func, repeat=3):
+    '''
+    多次运行函数，取最短的一次耗时
+    :param func: 要计时的函数（无参数）
+    :param repeat: 运行次数
+    :return: best：最短耗时（秒）
+             result：函数最后一次的返回值
+    '''
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_feature_extraction(signal_number=10000, signal_length=500, repeat=3, seed=0):
+    '''
+    对比 feature_extraction 逐行循环 和 batch_feature_extraction 批量提取 的耗时，并检查两者结果是否一致
+    :param signal_number: 样本个数
+    :param signal_length: 每个样本的信号长度
+    :param repeat: 每种方法运行的次数
+    :param seed: 随机种子，用来生成模拟信号
+    :return: report：测试结果字典
+    '''
+    samples = np.random.RandomState(seed).randn(signal_number, signal_length)
+
+    def loop():
+        loader = np.empty(shape=[samples.shape[0], 16])
+        for i in range(samples.shape[0]):
+            loader[i] = feature_extraction(samples[i])
+        return loader
+
+    loop_time, loop_result = timeit(loop, repeat)
+    batch_time, batch_result = timeit(lambda: batch_feature_extraction(samples), repeat)
+
+    report = {'signal_number': signal_number,
+              'signal_length': signal_length,
+              'loop_time': loop_time,
+              'batch_time': batch_time,
+              'speedup': loop_time / batch_time,
+              'allclose': bool(np.allclose(loop_result, batch_result, rtol=1e-9, atol=0))}
+    return report
+
+
+def benchmark_online_features(window_number=10000, signal_length=500, hop=None, repeat=3, seed=0):
+    '''
+    数据流上每前进 hop 个数据提取一次特征：对比 OnlineFeatures 增量更新 和 每个窗口重新调用 batch_feature_extraction 的耗时
+    （流式诊断时窗口是一个一个到达的，不能一次批量提取），并检查两者结果是否一致
+    :param window_number: 窗口个数
+    :param signal_length: 窗口长度
+    :param hop: 相邻两个窗口的间隔，默认为窗口长度的一半
+    :param repeat: 每种方法运行的次数
+    :param seed: 随机种子，用来生成模拟信号
+    :return: report：测试结果字典
+    '''
+    hop = hop or max(signal_length // 2, 1)
+    signal = np.random.RandomState(seed).randn(signal_length + hop * (window_number - 1))
+    ends = range(signal_length, len(signal) + 1, hop)
+
+    def online():
+        engine = OnlineFeatures(signal_length)
+        loader = np.empty(shape=[len(ends), 16])
+        written = 0
+        for i, end in enumerate(ends):
+            engine.push(signal[written: end])
+            written = end
+            loader[i] = engine.features()
+        return loader
+
+    def recompute():
+        loader = np.empty(shape=[len(ends), 16])
+        for i, end in enumerate(ends):
+            loader[i] = batch_feature_extraction(signal[end - signal_length: end])[0]
+        return loader
+
+    online_time, online_result = timeit(online, repeat)
+    recompute_time, recompute_result = timeit(recompute, repeat)
+    return {'window_number': len(ends),
+            'hop': hop,
+            'online_time': online_time,
+            'recompute_time': recompute_time,
+            'online_speedup': recompute_time / online_time,
+            'online_allclose': bool(np.allclose(online_result, recompute_result, rtol=1e-9, atol=1e-12))}
+
+
+def peak_rss_mb():
+    '''
+    当前进程的峰值内存（MB），无法获得时返回 None
+    '''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024.0 ** 2 if 'darwin' == sys.platform else peak / 1024.0  # macOS 单位为字节，Linux 为 KB
+    except ImportError:  # Windows 没有 resource 模块
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024.0 ** 2
+    except (ImportError, AttributeError):
+        return None
+
+
+def git_commit():
+    '''
+    当前代码所在的提交，不是 git 仓库时返回 None
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_synthetic_dataset(data_path, file_number=10, length=480000, sample_rate=48000, seed=0):
+    '''
+    生成模拟的振动信号数据集，每个文件是一个类别（不同的冲击频率和噪声水平），格式与西储大学数据集相同
+    :param data_path: 保存的文件夹
+    :param file_number: 文件（类别）个数
+    :param length: 每个文件的信号长度
+    :param sample_rate: 采样频率
+    :param seed: 随机种子
+    :return:
+    '''
+    from scipy.io import savemat
+
+    os.makedirs(data_path, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    t = np.arange(length) / sample_rate
+    for i in range(file_number):
+        impulse_frequency = 60.0 + 25.0 * i  # 冲击频率
+        signal = 0.05 * (1 + i % 3) * rng.randn(length)  # 背景噪声
+        impulses = (np.mod(t * impulse_frequency, 1.0) < impulse_frequency / sample_rate).astype(np.float64)
+        ringing = np.exp(-np.arange(200) / 30.0) * np.sin(2 * np.pi * 3000 * np.arange(200) / sample_rate)
+        signal += 0.5 * np.convolve(impulses, ringing)[:length]
+        fan_end = 0.3 * signal + 0.05 * rng.randn(length)  # 风扇端离故障更远，冲击更弱
+        savemat(os.path.join(data_path, 'synthetic_%02d.mat' % i),
+                {'X%03d_DE_time' % i: signal[:, np.newaxis], 'X%03d_FE_time' % i: fan_end[:, np.newaxis],
+                 'X%03dRPM' % i: np.array([[1797]])})
+
+
+def stage_signal_cache(config):
+    '''
+    阶段：第一次读取 .mat 文件（解析并写入信号缓存，使用临时的缓存文件夹）
+    '''
+    from signal_cache import load_signals
+
+    cache_path = tempfile.mkdtemp(prefix='bench_signal_cache_')
+    try:
+        file_paths = [os.path.join(config['data_path'], name) for name in sorted(os.listdir(config['data_path']))]
+        start = time.perf_counter()
+        samples = sum(len(load_signals(path, cache_path)['DE']) for path in file_paths)
+        wall_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_path, ignore_errors=True)
+    return {'wall_time': wall_time, 'windows': None, 'samples': samples}
+
+
+def _prepro(config):
+    from data_preprocess import training_stage_prepro
+
+    return training_stage_prepro(config['data_path'], config['signal_length'], config['signal_number'], False,
+                                 config['rate'], enhance=False, seed=config['seed'], return_meta=True,
+                                 channels=config['channels'])
+
+
+def stage_preprocess(config):
+    '''
+    阶段：训练阶段预处理（抽样、取出样本、划分数据集）
+    '''
+    _prepro(config)  # 预热，保证信号缓存已经生成
+    start = time.perf_counter()
+    X_train, y_train, X_valid, y_valid, X_test, y_test, _ = _prepro(config)
+    wall_time = time.perf_counter() - start
+    return {'wall_time': wall_time, 'windows': len(X_train) + len(X_valid) + len(X_test)}
+
+
+def stage_feature_extraction(config):
+    '''
+    阶段：批量特征提取（使用 --feature-set 指定的特征组合）
+    '''
+    X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta = _prepro(config)
+    samples = np.vstack((X_train, X_valid, X_test))
+    start = time.perf_counter()
+    extract_features(samples, config['feature_set'], prepro_meta['sample_rate'], prepro_meta['rpm'])
+    wall_time = time.perf_counter() - start
+    return {'wall_time': wall_time, 'windows': len(samples)}
+
+
+def stage_feature_cache(config):
+    '''
+    阶段：从特征矩阵缓存中读取随机森林的训练数据（cold_time 为第一次生成缓存的耗时，使用临时的缓存文件夹）
+    '''
+    from feature_cache import random_forest_dataset
+
+    cache_path = tempfile.mkdtemp(prefix='bench_feature_cache_')
+    try:
+        def load():
+            return random_forest_dataset(config['data_path'], config['signal_length'], config['signal_number'], False,
+                                         config['rate'], enhance=False, seed=config['seed'],
+                                         channels=config['channels'], feature_set=config['feature_set'],
+                                         cache_path=cache_path)
+        _prepro(config)  # 预热，保证信号缓存已经生成
+        start = time.perf_counter()
+        load()
+        cold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        X_train, y_train, X_test, y_test, _ = load()
+        wall_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_path, ignore_errors=True)
+    return {'wall_time': wall_time, 'windows': len(X_train) + len(X_test), 'cold_time': cold_time}
+
+
+def stage_training(config):
+    '''
+    阶段：随机森林训练（包括特征提取），训练好的模型保存下来给诊断阶段使用
+    '''
+    from random_forest_model import training_with_random_forest
+    from model_bundle import ModelBundle
+
+    X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta = _prepro(config)
+    start = time.perf_counter()
+    model, score, _, _ = training_with_random_forest(X_train, y_train, X_valid, y_valid, X_test, y_test,
+                                                     config['feature_set'], sample_rate=prepro_meta['sample_rate'],
+                                                     rpms=(prepro_meta['rpm'],) * 3)  # 合成数据集只有一个转速
+    wall_time = time.perf_counter() - start
+    ModelBundle(model, **prepro_meta).save(config['model_path'])
+    return {'wall_time': wall_time, 'windows': len(X_train) + len(X_valid) + len(X_test), 'score': float(score)}
+
+
+def stage_diagnosis(config):
+    '''
+    阶段：对数据集中每个文件进行诊断（预处理 + 诊断，诊断所有样本，不提前结束）
+    '''
+    from data_preprocess import diagnosis_stage_prepro, load_rpm
+    from diagnosis import diagnose
+    from model_registry import model_registry
+
+    bundle = model_registry.get_bundle(config['model_path'])  # 模型加载不计入诊断时间
+    file_paths = [os.path.join(config['data_path'], name) for name in sorted(os.listdir(config['data_path']))]
+    start = time.perf_counter()
+    for path in file_paths:
+        samples = diagnosis_stage_prepro(path, bundle.signal_length, config['diagnosis_number'], bundle.normal,
+                                         bundle.scaler_stats, seed=config['seed'], channels=bundle.channels,
+                                         sample_rate=bundle.sample_rate)
+        diagnose(samples, config['model_path'], early_stop=False, rpm=load_rpm(path))
+    wall_time = time.perf_counter() - start
+    return {'wall_time': wall_time, 'windows': len(file_paths) * config['diagnosis_number']}
+
+
+def _run_stage(name, config, queue):
+    '''
+    在子进程中运行一个阶段，结果（或异常信息）放入 queue
+    '''
+    try:
+        result = globals()['stage_' + name](config)
+        result['peak_rss_mb'] = peak_rss_mb()
+        queue.put(('ok', result))
+    except BaseException as e:
+        queue.put(('error', '%s: %s' % (type(e).__name__, e)))
+        raise
+
+
+def run_stage(name, config):
+    '''
+    在一个新的子进程中运行一个阶段，返回测试结果
+    :param name: 阶段名
+    :param config: 配置
+    :return: result：测试结果字典
+    '''
+    # 新的进程，峰值内存只包括这一个阶段。不使用进程池：进程池的工作进程是守护进程，
+    # joblib 在守护进程中会把随机森林的 n_jobs 强制设为 1，测出来的就不是实际使用 N_JOBS 时的性能了
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(name, config, queue))
+    process.start()
+    try:
+        while True:  # 先取结果再 join，结果较大时子进程要等队列被读取后才能退出
+            try:
+                status, result = queue.get(timeout=1)
+                break
+            except Empty:
+                if not process.is_alive():  # 子进程异常退出，没有放入结果
+                    status, result = 'error', '子进程退出，退出码 %s' % process.exitcode
+                    break
+    finally:
+        process.join()
+    if 'ok' != status:
+        raise RuntimeError('阶段 %s 运行失败：%s' % (name, result))
+    windows = result.get('windows')
+    result['windows_per_second'] = windows / result['wall_time'] if windows and result['wall_time'] > 0 else None
+    return result
+
+
+def run_suite(datasets, stages, config):
+    '''
+    对每个数据集运行所有阶段
+    :param datasets: 数据集名称 --> 文件夹
+    :param stages: 要运行的阶段
+    :param config: 配置
+    :return: results：测试结果列表
+    '''
+    results = []
+    model_dir = tempfile.mkdtemp(prefix='bench_model_')
+    try:
+        for dataset, data_path in datasets.items():
+            stage_config = dict(config, data_path=data_path, model_path=os.path.join(model_dir, dataset + '.m'))
+            for stage in stages:
+                if 'diagnosis' == stage and not os.path.exists(stage_config['model_path']):
+                    run_stage('training', stage_config)  # 诊断需要先训练一个模型
+                result = run_stage(stage, stage_config)
+                result.update(dataset=dataset, stage=stage)
+                results.append(result)
+                print_result(result)
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+    return results
+
+
+def print_result(result, baseline=None):
+    '''
+    打印一个阶段的测试结果，有基准结果时同时打印耗时的变化
+    '''
+    text = '%-10s %-20s %9.3f s' % (result['dataset'], result['stage'], result['wall_time'])
+    text += '  %9.1f MB' % result['peak_rss_mb'] if result.get('peak_rss_mb') is not None else '  %12s' % '-'
+    text += '  %12.0f 样本/s' % result['windows_per_second'] if result.get('windows_per_second') else '  %17s' % '-'
+    if baseline is not None:
+        text += '  耗时为基准的 %.2f 倍' % (result['wall_time'] / baseline['wall_time'])
+    print(text)
+
+
+def compare(report, baseline_report):
+    '''
+    与基准结果比较
+    :param report: 本次的测试结果
+    :param baseline_report: 基准测试结果
+    :return:
+    '''
+    baseline = {(r['dataset'], r['stage']): r for r in baseline_report['results']}
+    print('\n与基准（提交 %s）比较：' % baseline_report.get('commit'))
+    for result in report['results']:
+        print_result(result, baseline.get((result['dataset'], result['stage'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='性能测试')
+    parser.add_argument('mode', nargs='?', default='suite', choices=['suite', 'features'],
+                        help='suite：各阶段的性能测试（默认）；features：逐样本特征提取 与 批量特征提取 的对比')
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'real_time_data', '0HP'),
+                        help='数据集文件夹')
+    parser.add_argument('--synthetic-length', type=int, default=480000, help='模拟信号的长度，0 表示不使用模拟信号')
+    parser.add_argument('--synthetic-files', type=int, default=10, help='模拟信号的文件（类别）个数')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help='要运行的阶段')
+    parser.add_argument('--signal-length', type=int, default=500, help='每个样本的信号长度')
+    parser.add_argument('--signal-number', type=int, default=1000, help='训练时每个文件抽取的样本数；features 模式下为样本总数')
+    parser.add_argument('--diagnosis-number', type=int, default=500, help='诊断时每个文件抽取的样本数')
+    parser.add_argument('--channels', nargs='+', default=['DE'], choices=['DE', 'FE', 'BA'], help='使用的通道')
+    parser.add_argument('--feature-set', default='time', choices=FEATURE_SETS, help='随机森林使用的特征组合')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=3, help='features 模式下每种方法运行的次数')
+    parser.add_argument('--hop', type=int, help='features 模式下数据流上相邻两个窗口的间隔，默认为信号长度的一半')
+    parser.add_argument('--output', help='保存测试结果的 JSON 文件')
+    parser.add_argument('--compare', help='作为基准的 JSON 测试结果')
+    args = parser.parse_args(argv)
+
+    if 'features' == args.mode:
+        report = benchmark_feature_extraction(args.signal_number, args.signal_length, args.repeat, args.seed)
+        print('样本数：%d，信号长度：%d' % (report['signal_number'], report['signal_length']))
+        print('逐样本提取：%.4f s' % report['loop_time'])
+        print('批量提取：  %.4f s' % report['batch_time'])
+        print('加速比：    %.1fx' % report['speedup'])
+        print('结果一致：  %s' % report['allclose'])
+        report = benchmark_online_features(args.signal_number, args.signal_length, args.hop, args.repeat, args.seed)
+        print('数据流：%d 个窗口，间隔：%d' % (report['window_number'], report['hop']))
+        print('每个窗口重新提取：%.4f s' % report['recompute_time'])
+        print('在线增量提取：    %.4f s' % report['online_time'])
+        print('加速比：          %.1fx' % report['online_speedup'])
+        print('结果一致：        %s' % report['online_allclose'])
+        return 0
+
+    config = {'signal_length': args.signal_length, 'signal_number': args.signal_number,
+              'diagnosis_number': args.diagnosis_number, 'rate': [0.6, 0.2, 0.2], 'seed': args.seed,
+              'channels': args.channels, 'feature_set': args.feature_set}
+    datasets = {os.path.basename(os.path.normpath(args.data)): args.data}
+    synthetic_path = None
+    if args.synthetic_length > 0:
+        synthetic_path = tempfile.mkdtemp(prefix='bench_synthetic_')
+        make_synthetic_dataset(synthetic_path, args.synthetic_files, args.synthetic_length, seed=args.seed)
+        datasets['synthetic'] = synthetic_path
+
+    try:
+        results = run_suite(datasets, args.stages, config)
+    finally:
+        if synthetic_path is not None:
+            shutil.rmtree(synthetic_path, ignore_errors=True)
+
+    report = {'commit': git_commit(),
+              'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'config': dict(config, synthetic_length=args.synthetic_length, synthetic_files=args.synthetic_files),
+              'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
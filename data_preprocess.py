@@ -10,284 +10,499 @@ Created on 2021/2/2 11:30
 @Desc  : 数据处理的相关函数
 """
 
-from scipy.io import loadmat
 import numpy as np
-import os
+from numpy.lib.stride_tricks import as_strided
 
-from sklearn import preprocessing  # 0-1编码
-from sklearn.model_selection import StratifiedShuffleSplit  # 随机划分，保证每一类比例相同
+from dataset_catalog import DEFAULT_SAMPLE_RATE, DatasetCatalog, parse_file_name, scan_catalog
+from signal_cache import load_signal, load_channels, load_resampled, signal_metadata
+from spectral_features import RPM
+from window_sampler import WindowSampler
 
 
-def training_stage_prepro(data_path, signal_length=864, signal_number=1000, normal=True, rate=[0.7, 0.2, 0.1], enhance=True,
-                          enhance_step=28):
+def window_view(signal, signal_length):
     """
-    函数说明：训练阶段对数据进行预处理,返回train_X, train_Y, valid_X, valid_Y, test_X, test_Y样本
+    函数说明：为信号构造零拷贝的滑动窗口视图。一维信号的第 i 行就是 signal[i: i + signal_length]，
+             (通道数, 数据长度) 的多通道信号的第 i 个元素就是 signal[:, i: i + signal_length]
 
-    Parameters：
-        data_path : string，数据集路径
-        signal_length : int, 每次处理的信号长度，默认2个信号周期，864
-        signal_number : int, 每个文件（类别）要抽取的信号个数。默认每个类别抽取1000个数据
-        normal : bool, 是否标准化。默认True
-        rate : list, 训练集/验证集/测试集比例. 默认[0.5,0.25,0.25]
-        enhance : bool, 训练集是否采用数据增强. 默认True
-        enhance_step : int, 增强数据集采样顺延间隔
+    Parameters:
+        signal : 一维信号 或 多通道信号（连续数组，或者内存映射数组）
+        signal_length : int, 窗口长度
     Returns:
-        X_train : 训练集
-        y_train : 训练集标签
-        X_valid : 验证集
-        y_valid : 验证集标签
-        X_test : 测试集
-        y_test : 测试集标签
+        view : (len - signal_length + 1, signal_length) 或 (len - signal_length + 1, 通道数, signal_length) 的只读视图，
+               信号比窗口短时没有窗口（第一维为 0）
+    """
+    signal = np.ascontiguousarray(signal)
+    window_number = max(signal.shape[-1] - signal_length + 1, 0)
+    if 1 == signal.ndim:
+        stride = signal.strides[0]
+        return as_strided(signal, shape=(window_number, signal_length), strides=(stride, stride), writeable=False)
+    channel_stride, stride = signal.strides
+    return as_strided(signal, shape=(window_number, signal.shape[0], signal_length),
+                      strides=(stride, channel_stride, stride), writeable=False)
+
+
+def load_data(data_path, channels=('DE',), sample_rate=None, source_rate=None):
+    """
+    函数说明：读取一个 .mat 文件中指定通道的数据（经过信号缓存，以内存映射的方式读取）。
+             给出 sample_rate 且文件的采样频率与它不同时，重采样到 sample_rate（重采样的结果也有缓存）
+
+    Parameters:
+        data_path : .mat 文件路径
+        channels : 通道名列表。只有一个通道时返回一维信号（与原来的单通道模型兼容），否则返回 (通道数, 数据长度) 的数组
+        sample_rate : 需要的采样频率（模型的采样频率），为None时不重采样
+        source_rate : 文件的采样频率，为None时由文件名解析；无法解析时认为与 sample_rate 相同
+    Returns:
+        signal : 信号
+    """
+    if sample_rate is not None and source_rate is None:
+        info = parse_file_name(data_path)
+        source_rate = None if info is None else info['sample_rate']
+    if sample_rate is not None and source_rate is not None and source_rate != sample_rate:
+        signal = load_resampled(data_path, channels, source_rate, sample_rate)
+        return signal[0] if 1 == len(channels) else signal
+    if 1 == len(channels):
+        return load_signal(data_path, channels[0])
+    return load_channels(data_path, channels)
+
+
+def load_rpm(data_path):
+    """
+    函数说明：读取 .mat 文件中记录的转速（西储大学数据集中的 XxxRPM 变量，经过信号缓存），没有记录时返回None
+    """
+    return signal_metadata(data_path)['rpm']
+
+
+def channels_last(samples):
+    """
+    函数说明：转换为 1D_CNN 的输入，(N, signal_length, 通道数)
+    """
+    if 2 == samples.ndim:
+        return samples[:, :, np.newaxis]  # 单通道，添加一个新的维度
+    return samples.transpose(0, 2, 1)
+
+
+def channels_first(samples):
+    """
+    函数说明：转换为 LSTM、GRU 的输入，(N, 通道数, signal_length)
+    """
+    if 2 == samples.ndim:
+        return samples[:, np.newaxis, :]  # 单通道，添加一个新的维度
+    return samples
+
+
+class SampleStore(object):
+    """
+    样本仓库：每个文件的信号只保存一份（连续数组或内存映射数组），
+    样本用 (文件序号, 起始位置) 的索引来表示，需要时再从滑动窗口视图中取出，切分数据集时不复制数据。
+    每个文件有一个标签（同一类别可以有多个文件，例如不同负载的数据），没有给出时标签就是文件序号。
+    信号可以是一维的，也可以是 (通道数, 数据长度) 的多通道信号（所有文件的通道数必须相同）
+    """
+
+    def __init__(self, signal_length):
+        self.signal_length = signal_length
+        self.keys = []  # 文件路径，顺序即文件序号
+        self.labels = []  # 每个文件的标签
+        self._classes = None
+        self.sample_rate = None  # 所有信号的采样频率（重采样之后），None 表示未知
+        self.rpms = []  # 每个文件的转速（频域特征的故障特征频率由转速决定）
+        self.signals = []  # 每个文件的信号
+        self.views = []  # 每个文件信号的滑动窗口视图
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def classes(self):
+        """
+        函数说明：各标签对应的类别（第 i 个元素是标签 i 对应的类别），没有设置时每个文件是一类
+        """
+        return list(self.keys) if self._classes is None else self._classes
+
+    @classes.setter
+    def classes(self, classes):
+        self._classes = list(classes)
+
+    @property
+    def sample_shape(self):
+        """
+        函数说明：一个样本的形状，单通道为 (signal_length,)，多通道为 (通道数, signal_length)
+        """
+        return self.views[0].shape[1:]
+
+    @property
+    def rpm(self):
+        """
+        函数说明：各文件转速的中位数，记录在模型包中，作为诊断没有记录转速的数据时使用的转速
+        """
+        return float(np.median(self.rpms)) if self.rpms else float(RPM)
+
+    def add(self, key, signal, label=None, rpm=None):
+        """
+        函数说明：加入一个文件的信号，返回该文件的序号。label 为 None 时标签为文件序号；
+                 rpm 为 None 时（文件中没有记录转速）使用 spectral_features.RPM
+        """
+        signal = np.ascontiguousarray(signal)
+        self.labels.append(len(self.keys) if label is None else label)
+        self.rpms.append(float(RPM if rpm is None else rpm))
+        self.keys.append(key)
+        self.signals.append(signal)
+        self.views.append(window_view(signal, self.signal_length))
+        return len(self.keys) - 1
+
+    def length(self, file_index):
+        """
+        函数说明：获得某个文件的信号长度
+        """
+        return self.signals[file_index].shape[-1]
+
+    def label_of(self, index):
+        """
+        函数说明：样本的标签
+
+        Parameters:
+            index : (N, 2) 的索引数组，每一行为 (文件序号, 起始位置)
+        Returns:
+            labels : (N,) 的标签数组
+        """
+        index = np.asarray(index, dtype=np.int64).reshape([-1, 2])
+        return np.asarray(self.labels, dtype=np.int64)[index[:, 0]]
+
+    def rpm_of(self, index):
+        """
+        函数说明：样本的转速（所在文件的转速）
+
+        Parameters:
+            index : (N, 2) 的索引数组，每一行为 (文件序号, 起始位置)
+        Returns:
+            rpms : (N,) 的转速数组
+        """
+        index = np.asarray(index, dtype=np.int64).reshape([-1, 2])
+        return np.asarray(self.rpms, dtype=np.float64)[index[:, 0]]
+
+    def window(self, file_index, start):
+        """
+        函数说明：取出一个样本（视图，不复制）
+        """
+        return self.views[file_index][start]
+
+    def gather(self, index, out=None, mean=None, scale=None):
+        """
+        函数说明：按索引把样本一次性取到一个 (N, signal_length) 或 (N, 通道数, signal_length) 的矩阵中，可以同时进行标准化
+
+        Parameters:
+            index : (N, 2) 的索引数组，每一行为 (文件序号, 起始位置)
+            out : 存放结果的矩阵，为None时新建
+            mean : 标准化使用的均值（形状与一个样本相同），为None时不标准化
+            scale : 标准化使用的标准差
+        Returns:
+            out : 样本矩阵
+        """
+        index = np.asarray(index, dtype=np.int64).reshape([-1, 2])
+        if out is None:
+            out = np.empty(shape=(index.shape[0],) + self.sample_shape)
+        for file_index in np.unique(index[:, 0]):
+            rows = np.flatnonzero(index[:, 0] == file_index)
+            block = self.views[file_index][index[rows, 1]]
+            if mean is not None:  # 取出样本后立即标准化，数据还在缓存中，不需要再遍历一遍
+                np.subtract(block, mean, out=block)
+                np.divide(block, scale, out=block)
+            out[rows] = block
+        return out
+
+
+def streaming_scaler(store, index, chunk_size=4096):
+    """
+    函数说明：按块计算样本每个位置的均值和标准差（分块合并方差），与在全部样本上拟合 StandardScaler 的结果相同，
+             但每次只取出 chunk_size 个样本
+
+    Parameters:
+        store : SampleStore
+        index : 样本索引
+        chunk_size : 每块的样本数
+    Returns:
+        mean : 均值，形状与一个样本相同
+        scale : 标准差，标准差为 0 的位置置为 1（同 StandardScaler）
+    """
+    count = 0
+    mean = np.zeros(shape=store.sample_shape)
+    m2 = np.zeros(shape=store.sample_shape)  # 与均值之差的平方和
+    for start in range(0, len(index), chunk_size):
+        block = store.gather(index[start: start + chunk_size])
+        block_count = len(block)
+        block_mean = np.mean(block, axis=0)
+        block_m2 = np.sum(np.square(block - block_mean), axis=0)
+        delta = block_mean - mean
+        total = count + block_count
+        mean += delta * block_count / total
+        m2 += block_m2 + np.square(delta) * count * block_count / total
+        count = total
+    scale = np.sqrt(m2 / max(count, 1))
+    scale[scale == 0] = 1.0
+    return mean, scale
+
+
+def training_stage_index(data_path, signal_length=864, signal_number=1000, rate=[0.7, 0.2, 0.1], enhance=True,
+                         enhance_step=28, seed=None, channels=('DE',), sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    函数说明：训练阶段的数据抽样。只记录每个样本在信号中的位置，不复制数据。参数含义同 training_stage_prepro
+
+    Returns:
+        store : SampleStore, 所有文件的信号，store.classes 为各标签对应的类别
+        train_index : 训练集索引，(N, 2) 数组，每一行为 (文件序号, 起始位置)，标签为 store.label_of(train_index)
+        valid_index : 验证集索引
+        test_index : 测试集索引
     """
-    # 获得该文件夹下所有.mat文件名
-    file_names = os.listdir(data_path)
+    # 数据集目录：文件夹下所有的.mat文件（不包括子文件夹，需要时传入 scan_catalog(data_path, recursive=True)），及其类别
+    catalog = data_path if isinstance(data_path, DatasetCatalog) else scan_catalog(data_path)
 
     def capture():
         """
-        函数说明：读取mat文件，并将数据以字典返回（文件名作为key，数据作为value）
+        函数说明：读取mat文件（经过信号缓存），将每个文件指定通道的数据放入样本仓库。
+                 标签由文件的类别决定（类别的顺序固定，与文件的顺序无关）
 
         Parameters:
             无
         Returns:
-            data_dict : 数据字典
+            store : 样本仓库
         """
-        data_dict = {}
-
-        for file_name in file_names:
-            file_path = os.path.join(data_path, file_name)  # 文件路径
-            file = loadmat(file_path)  # 读取 .mat 文件，返回的是一个 字典
-            file_keys = file.keys()  # 获得该字典所有的key
-            for key in file_keys:  # 遍历key, 获得 DE 的数据
-                if 'DE' in key:  # DE: 驱动端加速度数据
-                    data_dict[file_name] = file[key].ravel()
-        return data_dict
-
-    def slice_enhance(data_dict, slice_rate=rate[1] + rate[2]):
+        store = SampleStore(signal_length)
+        store.classes = catalog.classes()
+        store.sample_rate = sample_rate
+        if not store.classes:
+            raise ValueError('%s 中没有 .mat 文件' % data_path)
+
+        for record in catalog:
+            # 所有通道一次读取，从缓存中以内存映射的方式读取；采样频率不同的文件重采样到 sample_rate
+            signal = load_data(record['path'], channels, sample_rate, record['sample_rate'])
+            store.add(record['path'], signal, store.classes.index(record['class']), record['rpm'])
+        return store
+
+    def slice_enhance(store, slice_rate=rate[1] + rate[2]):
         """
-        函数说明：将数据分为 训练集 和 <验证及测试集>，并对 训练集 数据进行增强
+        函数说明：将数据分为 训练集 和 <验证及测试集>，并对 训练集 数据进行增强。所有文件的样本位置一次性抽取
 
         Parameters：
-            data_dict : dict, 要进行划分的数据
+            store : SampleStore, 要进行划分的数据
             slice_rate: <验证集以及测试集>所占的比例
         Returns:
-            train_samples : 切分后的 训练样本
-            valid_test_samples : 切分后的 <验证及测试>样本
+            train_index : 训练样本 的索引，文件序号即标签
+            valid_test_index : <验证及测试>样本 的索引
         """
-        train_samples = {}  # 训练集 样本
-        valid_test_samples = {}  # 验证及测试集 样本
-
-        keys = data_dict.keys()
-        for key in keys:  # 遍历 数据字典，即每一个文件
-            slice_data = data_dict[key]  # 获得value，即取得该文件里的 DE 数据
-            all_lenght = len(slice_data)  # 获得数据长度
-            end_index = int(all_lenght * (1 - slice_rate))  # 得到 训练集 结束的位置（索引）
-            train_samples_num = int(signal_number * (1 - slice_rate))  # 训练集信号 个数
-            train_sample = []  # 该文件中的 训练集 样本
-            valid_test_sample = []  # 该文件中的 验证及测试集 样本
-            if enhance:  # 使用数据增强
-                enc_time = signal_length // enhance_step
-                samp_step = 0  # 用来计数Train采样次数
-                for j in range(train_samples_num):
-                    random_start = np.random.randint(low=0, high=(end_index - 2 * signal_length))
-                    label = 0
-                    for h in range(enc_time):
-                        samp_step += 1
-                        random_start += enhance_step
-                        sample = slice_data[random_start: random_start + signal_length]
-                        train_sample.append(sample)
-                        if samp_step == train_samples_num:
-                            label = 1
-                            break
-                    if label:
-                        break
-            else:
-                for j in range(train_samples_num):  # 在该文件中 抽取 训练集 的 信号，共抽取train_samples_num个（随机抽取）
-                    random_start = np.random.randint(low=0, high=(
-                                end_index - signal_length))  # high=(end_index - signal_length)：保证从任何一个位置开始都可以取到完整的数据长度
-                    sample = slice_data[random_start: random_start + signal_length]  # 抽取信号
-                    train_sample.append(sample)  # 将抽取到的信号加入 train_samples
-
-            # 抓取测试数据
-            for h in range(signal_number - train_samples_num):  # signal_number - train_samples_num：验证和测试集信号个数
-                random_start = np.random.randint(low=end_index, high=(all_lenght - signal_length))
-                sample = slice_data[random_start: random_start + signal_length]
-                valid_test_sample.append(sample)
-            train_samples[key] = train_sample  # 字典存储---文件名：对应的信号
-            valid_test_samples[key] = valid_test_sample
-        return train_samples, valid_test_samples
-
-    def add_labels(data_set_dict):
+        sampler = WindowSampler(signal_length, seed)
+        lengths = np.array([store.length(i) for i in range(len(store))], dtype=np.int64)  # 获得每个文件的数据长度
+        end_indexes = (lengths * (1 - slice_rate)).astype(np.int64)  # 得到 训练集 结束的位置（索引）
+        starts = np.zeros(len(store), dtype=np.int64)
+        train_samples_num = int(signal_number * (1 - slice_rate))  # 训练集信号 个数
+
+        if enhance:  # 使用数据增强
+            train_index = sampler.enhance(starts, end_indexes, train_samples_num, enhance_step)
+        else:  # 在每个文件的训练集区间中 随机抽取 train_samples_num 个信号
+            train_index = sampler.random(starts, end_indexes, train_samples_num)
+        # 抓取测试数据，signal_number - train_samples_num：验证和测试集信号个数
+        valid_test_index = sampler.random(end_indexes, lengths, signal_number - train_samples_num)
+        return train_index, valid_test_index
+
+    def valid_test_slice(valid_test_index):
         '''
-        函数说明：为抽样完成的数据添加标签。（这里将字典里每个key的value都append到了一个list里，也就是变成了 一维 数据)
+        函数说明：划分 验证集 和 测试集
 
         Parameters:
-            data_set_dict : dict, 抽样完成的数据，类型为字典（文件名作为key，数据作为value）
+            valid_test_index : <验证及测试集>索引
         Returns:
-            X : 数据
-            Y : 标签
-
+            valid_index : 验证集索引
+            test_index : 测试集索引
+        '''
+        from sklearn.model_selection import StratifiedShuffleSplit  # 随机划分，保证每一类比例相同（用到时才导入，诊断时不需要）
+        test_size = rate[2] / (rate[1] + rate[2])
+        ss = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=1)  # 分层抽样，随机的按比例选取 验证集 和 测试集
         '''
-        X = []  # 数据
-        Y = []  # 标签
-        label = 0
-        for file_name in file_names:
-            x = data_set_dict[file_name]  # 取得对应文件中样本的数据
-            X += x  # 将其放到 数据表 X 中。这里的 += 等价于 append
-            lenx = len(x)
-            Y += [label] * lenx  # 在列表 Y 中 加入 列表 X 中对应样本的 标签---[label] * lenx：将标签 label 在 Y 中重复 lenx 次
-            label += 1
-        return X, Y
-
-    def one_hot(y_train, y_valid_test):
+        因为 StratifiedShuffleSplit()函数只能将数据一分为二，不能将数据一分为三，所以需要在前面先将数据分为 训练集 和 验证以及测试集，
+        然后再使用该函数进一步的将 验证以及测试集 分为 验证集 和 训练集。这里只需要划分索引，所以不需要传入真正的数据
+        '''
+        y_valid_test = valid_test_index[:, 0]  # 按文件分层，每个文件（同一类别不同负载的文件也一样）的比例都相同
+        for valid_index, test_index in ss.split(np.zeros(len(y_valid_test)), y_valid_test):
+            return valid_test_index[valid_index], valid_test_index[test_index]
+
+    # 从所有.mat文件中读取出数据
+    store = capture()
+    # 将数据切分为训练集、验证集及测试集
+    train_index, valid_test_index = slice_enhance(store)
+    # 将 验证及测试集 切分为 验证集 和 测试集
+    valid_index, test_index = valid_test_slice(valid_test_index)
+
+    return store, train_index, valid_index, test_index
+
+
+def training_stage_gather(store, train_index, valid_index, test_index, normal=True, channels=('DE',)):
+    """
+    函数说明：按 training_stage_index 得到的索引取出样本，并进行 one-hot编码 和 标准化
+
+    Parameters：
+        store : SampleStore, 所有文件的信号
+        train_index : 训练集索引
+        valid_index : 验证集索引
+        test_index : 测试集索引
+        normal : bool, 是否标准化。默认True
+        channels : 使用的通道，记录到预处理信息中
+    Returns:
+        X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta : 同 training_stage_prepro
+    """
+
+    def one_hot(y_train, y_valid, y_test):
         '''
         函数说明：one-hot编码
                     将样本标签编码为 含有 10个 元素的列表：[1，0，0，0，0，0，0，0，0，0]
-                    分别对应文件夹中的十个文件，如，第一个文件是一个 故障数据 的文件，其故障对应到列表的第一个元素（第一个元素为1）
+                    分别对应十个类别（类别的顺序见 dataset_catalog.class_map），如，第一类是滚动体故障0.1778mm，对应到列表的第一个元素（第一个元素为1）
                     所以，这就是一个10分类问题，即最终要找出故障的位置
 
         Parameters:
             y_train : 训练集标签
-            y_valid_test : <验证和测试集>标签
+            y_valid : 验证集标签
+            y_test : 测试集标签
         Returns:
             y_train : 编码后的训练集标签
-            y_valid_test : 编码后的<验证和测试集>标签
+            y_valid : 编码后的验证集标签
+            y_test : 编码后的测试集标签
         '''
+        from sklearn import preprocessing  # 0-1编码（用到时才导入，诊断时不需要）
         y_train = np.array(y_train).reshape([-1, 1])
-        y_valid_test = np.array(y_valid_test).reshape([-1, 1])
 
         Encoder = preprocessing.OneHotEncoder()
-        Encoder.fit(y_train)  # 因为 y_train 和 y_valid_test 的类别相同，所以在其中一个上面fit就可以了
+        Encoder.fit(y_train)  # 因为 训练集 和 验证集、测试集 的类别相同，所以在其中一个上面fit就可以了
 
-        y_train = Encoder.transform(y_train).toarray()
-        y_valid_test = Encoder.transform(y_valid_test).toarray()
+        y_train, y_valid, y_test = [np.asarray(Encoder.transform(np.array(y).reshape([-1, 1])).toarray(), dtype=np.int32)
+                                    for y in (y_train, y_valid, y_test)]
+        return y_train, y_valid, y_test
 
-        y_train = np.asarray(y_train, dtype=np.int32)
-        y_valid_test = np.asarray(y_valid_test, dtype=np.int32)
-        return y_train, y_valid_test
-
-    def scalar_stand(X_train, X_valid_test):
+    def scalar_stand(X_train, X_valid, X_test):
         '''
-        函数说明：用训练集标准差标准化训练集以及测试集
+        函数说明：用训练集标准差标准化训练集以及测试集（原地进行，不再复制数据）。多通道样本展平后标准化，每个通道的每个位置分别计算
 
         Parameters:
             X_train : 训练集
-            X_valid_test : 验证和测试集
-        Returns:
-            X_train : 标准化后的训练集
-            X_valid_test : 标准化后的<验证和测试集>
-        '''
-        # TODO: 这里要将每个模型训练时的标准化数据跟着模型一起储存下来，否则，当实时诊断时，新输入的数据重新进行标准化，会造成标准化尺度不相同，
-        #  使得诊断结果不准确，以后解决。或者换个标准化方法
-        scalar = preprocessing.StandardScaler().fit(X_train)
-        X_train = scalar.transform(X_train)
-        X_valid_test = scalar.transform(X_valid_test)
-        return X_train, X_valid_test
-
-    def valid_test_slice(X_valid_test, y_valid_test):
-        '''
-        函数说明：划分 验证集 和 测试集
-
-        Parameters:
-            X_valid_test : <验证及测试集>
-            y_valid_test : <验证及测试集>标签
-        Returns:
             X_valid : 验证集
-            y_valid : 验证集标签
             X_test : 测试集
-            y_test : 测试集标签
-        '''
-        test_size = rate[2] / (rate[1] + rate[2])
-        ss = StratifiedShuffleSplit(n_splits=1, test_size=test_size, random_state=1)  # 分层抽样，随机的按比例选取 验证集 和 测试集
-        '''
-        因为 StratifiedShuffleSplit()函数只能将数据一分为二，不能将数据一分为三，所以需要在前面先将数据分为 训练集 和 验证以及测试集，
-        然后再使用该函数进一步的将 验证以及测试集 分为 验证集 和 训练集
+        Returns:
+            X_train : 标准化后的训练集
+            X_valid : 标准化后的验证集
+            X_test : 标准化后的测试集
+            scalar : 在训练集上拟合的 StandardScaler，要跟着模型一起保存下来，诊断时使用同样的标准化尺度
         '''
-        for valid_index, test_index in ss.split(X_valid_test, y_valid_test):
-            X_valid, X_test = X_valid_test[valid_index], X_valid_test[test_index]
-            y_valid, y_test = y_valid_test[valid_index], y_valid_test[test_index]
-            return X_valid, y_valid, X_test, y_test
-
-    # 从所有.mat文件中读取出数据的字典
-    data_dict = capture()
-    # 将数据切分为训练集、验证集及测试集
-    train, valid_test = slice_enhance(data_dict)
-    # 为训练集制作标签
-    X_train, y_train = add_labels(train)
-    # 为验证集及测试集制作标签
-    X_valid_test, y_valid_test = add_labels(valid_test)
-    '''
-    print(y_train)
-    print(y_valid_test)
-    这两句程序的结果及分析见下方图片
-    '''
+        from sklearn import preprocessing
+        sample_shape = X_train.shape[1:]
+        X_train, X_valid, X_test = [X.reshape([len(X), -1]) for X in (X_train, X_valid, X_test)]  # 连续数组，reshape 不复制
+        scalar = preprocessing.StandardScaler(copy=False).fit(X_train)
+        X_train, X_valid, X_test = [scalar.transform(X).reshape((len(X),) + sample_shape) for X in (X_train, X_valid, X_test)]
+        return X_train, X_valid, X_test, scalar
+
+    # 按索引一次性取出样本，文件序号即标签
+    X_train, X_valid, X_test = [store.gather(index) for index in (train_index, valid_index, test_index)]
     # 为所有数据集One-hot标签
-    y_train, y_valid_test = one_hot(y_train, y_valid_test)
+    y_train, y_valid, y_test = one_hot(*[store.label_of(index) for index in (train_index, valid_index, test_index)])
     # 数据 是否标准化.
+    prepro_meta = {'signal_length': store.signal_length, 'normal': normal, 'scaler_mean': None, 'scaler_scale': None,
+                   'classes': list(store.classes), 'channels': list(channels), 'sample_rate': store.sample_rate,
+                   'rpm': store.rpm}
     if normal:
-        X_train, X_valid_test = scalar_stand(X_train, X_valid_test)
-    else:  # 需要做一个数据转换，转换成np格式.
-        X_train = np.asarray(X_train)
-        X_valid_test = np.asarray(X_valid_test)
-    # 将 验证及测试集 切分为 验证集 和 测试集
-    X_valid, y_valid, X_test, y_test = valid_test_slice(X_valid_test, y_valid_test)
+        X_train, X_valid, X_test, scalar = scalar_stand(X_train, X_valid, X_test)
+        prepro_meta['scaler_mean'] = scalar.mean_.reshape(store.sample_shape)  # 形状与一个样本相同，诊断时直接广播
+        prepro_meta['scaler_scale'] = scalar.scale_.reshape(store.sample_shape)
+
+    return X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta
 
+
+def training_stage_prepro(data_path, signal_length=864, signal_number=1000, normal=True, rate=[0.7, 0.2, 0.1], enhance=True,
+                          enhance_step=28, seed=None, return_meta=False, channels=('DE',),
+                          sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    函数说明：训练阶段对数据进行预处理,返回train_X, train_Y, valid_X, valid_Y, test_X, test_Y样本
+
+    Parameters：
+        data_path : string，数据集路径（文件夹或文件，也可以是它们的列表），或 DatasetCatalog（按条件选择过的数据集）
+        signal_length : int, 每次处理的信号长度，默认2个信号周期，864
+        signal_number : int, 每个文件要抽取的信号个数。默认每个类别抽取1000个数据
+        normal : bool, 是否标准化。默认True
+        rate : list, 训练集/验证集/测试集比例. 默认[0.5,0.25,0.25]
+        enhance : bool, 训练集是否采用数据增强. 默认True
+        enhance_step : int, 增强数据集采样顺延间隔
+        seed : int, 抽样的随机种子，相同的种子得到相同的数据集。默认None，每次不同
+        return_meta : bool, 是否同时返回预处理信息（保存模型包时使用）
+        channels : 使用的通道（DE: 驱动端，FE: 风扇端，BA: 基座）。默认只用 DE，样本为 (N, signal_length)；
+                   多个通道时样本为 (N, 通道数, signal_length)
+        sample_rate : 模型的采样频率，采样频率不同的文件（例如 12kHz）先重采样到这个频率。默认 48kHz
+    Returns:
+        X_train : 训练集
+        y_train : 训练集标签
+        X_valid : 验证集
+        y_valid : 验证集标签
+        X_test : 测试集
+        y_test : 测试集标签
+        prepro_meta : 预处理信息，包括 信号长度、是否标准化、标准化参数、各标签对应的类别、通道、采样频率、转速。
+                      只有 return_meta 为 True 时返回
+    """
+
+    # 抽样，得到各个数据集的索引
+    store, train_index, valid_index, test_index = training_stage_index(data_path, signal_length, signal_number, rate,
+                                                                       enhance, enhance_step, seed, channels,
+                                                                       sample_rate)
+    # 按索引取出样本，编码标签，标准化
+    X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta = training_stage_gather(
+        store, train_index, valid_index, test_index, normal, channels)
+
+    if return_meta:
+        return X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta
     return X_train, y_train, X_valid, y_valid, X_test, y_test
 
 
-def diagnosis_stage_prepro(data_path, signal_length=864, signal_number=500, normal=True):
+def diagnosis_stage_prepro(data_path, signal_length=864, signal_number=500, normal=True, scaler_stats=None, seed=None,
+                           hop=None, channels=('DE',), sample_rate=None):
     '''
     诊断阶段对数据的预处理
     :param data_path: 数据路径
     :param signal_length: 信号长度
     :param signal_number: 信号数量
     :param normal: 是否标准化
+    :param scaler_stats: 训练时保存的标准化参数 (均值, 标准差)。为None时（旧模型）在诊断样本上重新拟合
+    :param seed: 随机抽样的种子，默认None，每次不同
+    :param hop: 不为None时不再随机抽样，而是以 hop 为间隔取遍整个信号（此时 signal_number 无效）
+    :param channels: 使用的通道，与训练时一致
+    :param sample_rate: 模型的采样频率，文件的采样频率（由文件名解析）与它不同时先重采样。为None时不重采样
     :return:
     '''
     file_name = data_path.split('/')[-1].split('.')[0]  # 获得文件名
 
     def capture():
         """
-        函数说明：读取mat文件，并将数据以字典返回（文件名作为key，数据作为value）
+        函数说明：读取mat文件（经过信号缓存），将指定通道的数据放入样本仓库
 
         Parameters:
             无
         Returns:
-            data_dict : 数据字典
+            store : 样本仓库
         """
-        data_dict = {}
+        store = SampleStore(signal_length)
 
-        file = loadmat(data_path)  # 读取 .mat 文件，返回的是一个 字典
-        file_keys = file.keys()  # 获得该字典所有的key
-        for key in file_keys:  # 遍历key, 获得 DE 的数据
-            if 'DE' in key:  # DE: 驱动端 振动数据
-                data_dict[file_name] = file[key].ravel()
-        return data_dict
+        # 所有通道一次读取，从缓存中以内存映射的方式读取；采样频率与模型不同时读取重采样后的缓存
+        store.add(file_name, load_data(data_path, channels, sample_rate))
+        if store.length(0) < signal_length:  # 一个完整的样本都取不出来
+            raise ValueError('%s 的数据长度为 %d，比信号长度 %d 短，无法诊断' % (data_path, store.length(0), signal_length))
+        return store
 
-    def slice(data_dict):
+    def slice(store):
         """
-        函数说明：切取数据样本
+        函数说明：切取数据样本，只记录样本的起始位置
 
         Parameters：
-            data_dict : dict, 要进行划分的数据
+            store : SampleStore, 要进行划分的数据
         Returns:
-            diagnosis_samples_dict : 切分后的 诊断样本
+            index : 诊断样本的索引
         """
-        diagnosis_samples_dict = {}  # 训练集 样本
-
-        keys = data_dict.keys()
-        for key in keys:
-            slice_data = data_dict[key]  # 获得value，即取得该文件里的 DE 数据
-        all_lenght = len(slice_data)  # 获得数据长度
+        sampler = WindowSampler(signal_length, seed)
+        lows, highs = [0], [store.length(0)]  # 只有一个文件，在整个信号中抽取
+        if hop is not None:  # 以 hop 为间隔取遍整个信号
+            return sampler.strided(lows, highs, hop)
         sample_number = int(signal_number)  # 需要采集的信号 个数，防止输入小数，所以将其转为int
-
-        samples = []  # 该文件中抽取的样本
-        for j in range(sample_number):  # 在该文件中 抽取 信号，共抽取sample_number个（随机抽取）
-            random_start = np.random.randint(low=0, high=(all_lenght - signal_length))  # high=(all_lenght - signal_length)：保证从任何一个位置开始都可以取到完整的数据长度
-            sample = slice_data[random_start: random_start + signal_length]  # 抽取信号
-            samples.append(sample)
-
-        diagnosis_samples_dict[key] = samples  # 字典存储---文件名：对应的信号
-        return diagnosis_samples_dict
+        return sampler.random(lows, highs, sample_number)  # 在该文件中 随机抽取 sample_number 个信号
 
     def scalar_stand(X_train):
         '''
@@ -295,26 +510,27 @@ def diagnosis_stage_prepro(data_path, signal_length=864, signal_number=500, norm
 
         Parameters:
             X_train : 训练集
-            X_valid_test : 验证和测试集
         Returns:
             X_train : 标准化后的训练集
         '''
-        scalar = preprocessing.StandardScaler().fit(X_train)
-        X_train = scalar.transform(X_train)
+        from sklearn import preprocessing  # 只有旧模型没有保存标准化参数时才需要
+        sample_shape = X_train.shape[1:]
+        X_train = X_train.reshape([len(X_train), -1])  # 多通道样本展平后标准化
+        scalar = preprocessing.StandardScaler(copy=False).fit(X_train)
+        X_train = scalar.transform(X_train).reshape((len(X_train),) + sample_shape)
         return X_train
 
-    # 从.mat文件中读取出数据的字典
-    data_dict = capture()
-    # 将数据按样本要求切分
-    diagnosis_samples_dict = slice(data_dict)
-    # diagnosis_samples = []
-    diagnosis_samples = diagnosis_samples_dict[file_name]  # 取得对应文件中样本的数据
-    # diagnosis_samples += x
-
-    # 数据 是否标准化.
-    if normal:
-        diagnosis_samples = scalar_stand(diagnosis_samples)
-    else:  # 需要做一个数据转换，转换成np格式.
-        diagnosis_samples = np.asarray(diagnosis_samples)
+    # 从.mat文件中读取出数据
+    store = capture()
+    index = slice(store)
+
+    if normal and scaler_stats is not None:  # 使用训练时的标准化参数，取出样本的同时进行标准化
+        diagnosis_samples = store.gather(index, mean=scaler_stats[0], scale=scaler_stats[1])
+    else:
+        # 将数据按样本要求切分，并一次性取出样本
+        diagnosis_samples = store.gather(index)
+        # 数据 是否标准化.
+        if normal:
+            diagnosis_samples = scalar_stand(diagnosis_samples)
 
     return diagnosis_samples
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:42
+
+@Author: Sun Jiahua
+
+@File  : dataset_catalog.py
+
+@Desc  : 数据集目录：
+            按西储大学数据集的文件名（例如 48k_Drive_End_IR014_0_174.mat、normal_0_97.mat）解析出
+            故障类型、故障尺寸、故障位置、负载（马力）、采样频率，再加上每个文件各通道的长度、均值、标准差等统计量，
+            保存在索引文件中（以 文件路径 + 修改时间 + 文件大小 判断是否需要更新），以后列举很多文件夹的数据时不需要再打开 .mat 文件。
+            多个进程同时列举数据集时，新的记录在文件锁中合并到最新的索引里，不会互相覆盖。
+            类别由故障类型、尺寸、位置决定（不同负载的同一种故障是同一类），类别的顺序固定（标准的 10 类在前），
+            与文件夹中文件的顺序无关；文件名不符合命名规则的文件（例如现场采集的数据）以文件名作为类别。
+            训练和诊断时可以按条件选择数据，例如 scan_catalog('real_time_data', recursive=True).query(load=[0, 1], sample_rate=48000)
+            默认只列举文件夹下的文件（与界面上“选择文件夹”训练时一样），recursive=True 时包括子文件夹
+
+            用法示例：
+                python dataset_catalog.py real_time_data --recursive --load 0 --sample-rate 48000
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from signal_cache import SIGNAL_CACHE_PATH, file_lock, load_signals, signal_metadata, temp_path
+
+CATALOG_PATH = os.path.join(SIGNAL_CACHE_PATH, 'catalog.json')  # 索引文件
+CATALOG_VERSION = 1  # 索引内容发生变化时加 1，旧的索引会重新生成
+# 故障文件，例如 48k_Drive_End_OR007@6_0_135.mat
+FAULT_PATTERN = re.compile(r'^(?P<rate>\d+)k_(?P<end>Drive|Fan)_End_(?P<fault>B|IR|OR)(?P<size>\d{3})'
+                           r'(?:@(?P<position>\d+))?_(?P<load>\d+)(?:_(?P<number>\d+))?\.mat$', re.IGNORECASE)
+# 正常数据，例如 normal_0_97.mat（正常数据的采样频率为 48kHz）
+NORMAL_PATTERN = re.compile(r'^normal_(?P<load>\d+)(?:_(?P<number>\d+))?\.mat$', re.IGNORECASE)
+# 类别，例如 B007、IR014、OR021@6、FE_IR007（风扇端轴承的故障）、normal
+CLASS_PATTERN = re.compile(r'^(?P<end>FE_)?(?P<fault>B|IR|OR)(?P<size>\d{3})(?:@(?P<position>\d+))?$')
+NORMAL_SAMPLE_RATE = 48000
+DEFAULT_SAMPLE_RATE = 48000  # 模型默认的采样频率，没有记录采样频率的旧模型都是用 48kHz 的数据训练的
+FAULT_NAMES = {'B': '滚动体故障', 'IR': '内圈故障', 'OR': '外圈故障'}
+# 标准的 10 类（0马力、48kHz 的驱动端数据），顺序与原来 result_decode 的编码相同，没有记录类别的旧模型也按这个顺序解码
+CLASS_KEYS = ('B007', 'B014', 'B021', 'IR007', 'IR014', 'IR021', 'OR007@6', 'OR014@6', 'OR021@6', 'normal')
+
+
+def parse_file_name(file_name):
+    '''
+    解析西储大学数据集的文件名
+    :param file_name: 文件名（可以带路径）
+    :return: info：字典（故障类型 fault、尺寸 size（千分之一英寸）、位置 position、负载 load、采样频率 sample_rate、
+                   轴承 end、类别 class），文件名不符合命名规则时返回 None
+    '''
+    file_name = os.path.basename(file_name)
+    match = FAULT_PATTERN.match(file_name)
+    if match is not None:
+        fault = match.group('fault').upper()
+        end = 'DE' if 'drive' == match.group('end').lower() else 'FE'
+        key = ('' if 'DE' == end else 'FE_') + fault + match.group('size')
+        if match.group('position') is not None:
+            key += '@' + match.group('position')
+        return {'fault': fault, 'size': int(match.group('size')), 'position': match.group('position'),
+                'load': int(match.group('load')), 'sample_rate': int(match.group('rate')) * 1000, 'end': end,
+                'class': key}
+    match = NORMAL_PATTERN.match(file_name)
+    if match is not None:
+        return {'fault': 'normal', 'size': 0, 'position': None, 'load': int(match.group('load')),
+                'sample_rate': NORMAL_SAMPLE_RATE, 'end': None, 'class': 'normal'}
+    return None
+
+
+def class_name(key):
+    '''
+    类别的文字说明，例如 'IR014' --> '内圈故障：0.3556mm'
+    :param key: 类别；也可以是文件名（旧模型记录的是训练文件名）
+    :return: name：字符串
+    '''
+    if key.lower().endswith('.mat'):
+        info = parse_file_name(key)
+        key = os.path.splitext(os.path.basename(key))[0] if info is None else info['class']
+    if 'normal' == key:
+        return '正常'
+    match = CLASS_PATTERN.match(key)
+    if match is None:  # 不符合命名规则的类别
+        return key
+    name = FAULT_NAMES[match.group('fault')]
+    if match.group('position') is not None:
+        name += '（%s点方向）' % match.group('position')
+    if match.group('end') is not None:
+        name = '风扇端' + name
+    return '%s：%.4fmm' % (name, int(match.group('size')) * 0.0254)  # 千分之一英寸 --> 毫米
+
+
+def class_map(keys):
+    '''
+    类别的顺序（即标签）：标准的 10 类按 CLASS_KEYS 的顺序在前，其余的按名字排序在后
+    :param keys: 类别（可以重复）
+    :return: classes：类别列表，第 i 个元素是标签 i 对应的类别
+    '''
+    keys = set(keys)
+    return [key for key in CLASS_KEYS if key in keys] + sorted(keys.difference(CLASS_KEYS))
+
+
+def describe_file(data_path, stat):
+    '''
+    生成一个文件的索引记录（第一次需要解析 .mat 文件，之后从信号缓存中读取）
+    :param data_path: .mat 文件路径（绝对路径）
+    :param stat: 文件的 os.stat 结果
+    :return: record：字典
+    '''
+    info = parse_file_name(data_path)
+    if info is None:  # 不符合命名规则，以文件名作为类别
+        info = {'fault': None, 'size': None, 'position': None, 'load': None, 'sample_rate': None, 'end': None,
+                'class': os.path.splitext(os.path.basename(data_path))[0]}
+    channels = {}
+    for channel, signal in load_signals(data_path).items():
+        channels[channel] = {'length': int(signal.shape[0]), 'mean': float(np.mean(signal)),
+                             'std': float(np.std(signal)), 'peak': float(np.max(np.abs(signal)))}
+    record = {'path': data_path, 'mtime_ns': stat.st_mtime_ns, 'size_bytes': stat.st_size,
+              'rpm': signal_metadata(data_path)['rpm'], 'channels': channels}
+    record.update(info)
+    return record
+
+
+def find_mat_files(roots, recursive=False):
+    '''
+    找到所有的 .mat 文件
+    :param roots: 文件夹 或 文件，也可以是它们的列表
+    :param recursive: 是否包括子文件夹中的文件，默认只包括文件夹下的文件
+    :return: file_paths：排好序的绝对路径列表
+    '''
+    if isinstance(roots, str):
+        roots = [roots]
+    file_paths = set()
+    for root in roots:
+        if os.path.isfile(root):
+            file_paths.add(os.path.abspath(root))
+            continue
+        if not recursive:
+            file_paths.update(os.path.abspath(os.path.join(root, file_name)) for file_name in os.listdir(root)
+                              if file_name.lower().endswith('.mat') and os.path.isfile(os.path.join(root, file_name)))
+            continue
+        for dir_path, _, file_names in os.walk(root):
+            file_paths.update(os.path.abspath(os.path.join(dir_path, file_name)) for file_name in file_names
+                              if file_name.lower().endswith('.mat'))
+    return sorted(file_paths)
+
+
+def load_index(index_path):
+    '''
+    读取索引文件，没有或版本不同时返回空索引
+    :param index_path: 索引文件路径
+    :return: index：文件路径 --> 记录
+    '''
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except ValueError:  # 文件损坏，重新生成
+        return {}
+    if index.get('version') != CATALOG_VERSION:
+        return {}
+    return index['files']
+
+
+def save_index(index, index_path):
+    '''
+    保存索引文件（先写临时文件再替换，多个进程同时保存时不会读到写了一半的文件）
+    :param index: 文件路径 --> 记录
+    :param index_path: 索引文件路径
+    :return:
+    '''
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = temp_path(index_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CATALOG_VERSION, 'files': index}, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def update_index(records, index_path):
+    '''
+    把新的记录合并到索引文件中：在文件锁中重新读取最新的索引再写回，
+    其他进程在这期间保存的记录不会被覆盖掉
+    :param records: 新的或发生了变化的记录
+    :param index_path: 索引文件路径
+    :return:
+    '''
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    with file_lock(index_path):
+        index = load_index(index_path)
+        index.update((record['path'], record) for record in records)
+        save_index(index, index_path)
+
+
+def scan_catalog(roots, index_path=None, recursive=False):
+    '''
+    列举数据集：只有新的或发生了变化的文件才需要读取，其余的直接使用索引中的记录
+    :param roots: 文件夹 或 文件，也可以是它们的列表
+    :param index_path: 索引文件路径，默认为 CATALOG_PATH
+    :param recursive: 是否包括子文件夹中的文件，默认只包括文件夹下的文件
+    :return: catalog：DatasetCatalog
+    '''
+    index_path = index_path or CATALOG_PATH
+    index = load_index(index_path)
+    records = []
+    changed = []
+    for data_path in find_mat_files(roots, recursive):
+        stat = os.stat(data_path)
+        record = index.get(data_path)
+        if record is None or record['mtime_ns'] != stat.st_mtime_ns or record['size_bytes'] != stat.st_size:
+            record = describe_file(data_path, stat)  # 读取 .mat 文件比较慢，在文件锁之外进行
+            changed.append(record)
+        records.append(record)
+    if changed:
+        update_index(changed, index_path)
+    return DatasetCatalog(records)
+
+
+class DatasetCatalog(object):
+    """
+    数据集目录：文件的记录列表，可以按条件选择
+    """
+
+    def __init__(self, records):
+        self.records = sorted(records, key=lambda record: record['path'])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def query(self, *predicates, **conditions):
+        '''
+        按条件选择文件，例如 query(load=[0, 1], sample_rate=48000, fault=('IR', 'OR'))
+        :param predicates: 函数，参数为记录，返回 True 的记录被选中，例如 lambda record: 'FE' in record['channels']
+        :param conditions: 字段 = 值：值为 list/tuple/set 时字段在其中即可，为函数时以字段的值调用
+        :return: catalog：新的 DatasetCatalog
+        '''
+        def matched(record):
+            for key, value in conditions.items():
+                field = record.get(key)
+                if callable(value):
+                    if not value(field):
+                        return False
+                elif isinstance(value, (list, tuple, set)):
+                    if field not in value:
+                        return False
+                elif field != value:
+                    return False
+            return all(predicate(record) for predicate in predicates)
+
+        return DatasetCatalog([record for record in self.records if matched(record)])
+
+    def paths(self):
+        return [record['path'] for record in self.records]
+
+    def classes(self):
+        '''
+        类别的顺序（即标签），见 class_map
+        :return: classes：类别列表
+        '''
+        return class_map(record['class'] for record in self.records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='列举数据集并按条件选择')
+    parser.add_argument('roots', nargs='+', help='数据集的文件夹或文件')
+    parser.add_argument('--recursive', action='store_true', help='包括子文件夹中的文件')
+    parser.add_argument('--load', type=int, nargs='+', help='负载（马力）')
+    parser.add_argument('--sample-rate', type=int, nargs='+', help='采样频率')
+    parser.add_argument('--fault', nargs='+', help='故障类型：B、IR、OR、normal')
+    parser.add_argument('--index', help='索引文件路径，默认为 %s' % CATALOG_PATH)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    catalog = scan_catalog(args.roots, args.index, args.recursive)
+    conditions = {'load': args.load, 'sample_rate': args.sample_rate, 'fault': args.fault}
+    catalog = catalog.query(**dict((key, value) for key, value in conditions.items() if value is not None))
+    elapsed = time.perf_counter() - start
+
+    for label, key in enumerate(catalog.classes()):
+        records = [record for record in catalog if record['class'] == key]
+        print('%d  %-12s %-28s %d 个文件' % (label, key, class_name(key), len(records)))
+        for record in records:
+            print('       %s（负载 %s，采样频率 %s）' % (record['path'], record['load'], record['sample_rate']))
+    print('共 %d 个文件，%d 类，耗时 %.1f ms' % (len(catalog), len(catalog.classes()), elapsed * 1000), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,81 +8,340 @@ Created on 2021/2/3 14:06
 @File  : diagnosis.py
 
 @Desc  : 故障诊断的相关函数
+            随机抽样诊断（diagnose）之外，还可以用 diagnose_timeline 以固定间隔取遍整个文件，得到每个窗口的诊断结果（时间线）
 """
 
+import time
+
 import numpy as np
-import joblib
-from keras.utils import CustomObjectScope
-from keras.initializers import glorot_uniform
-from keras.models import load_model
+from joblib import parallel_backend
+from scipy.special import bdtrc  # 二项分布的上尾概率，与 scipy.stats.binom.sf 相同，导入快得多
+
+from data_preprocess import SampleStore, channels_first, channels_last, load_data, load_rpm, streaming_scaler
+from dataset_catalog import CLASS_KEYS, class_name
+from feature_extraction import extract_features
+from model_registry import model_registry
+from window_sampler import WindowSampler
+
+NUM_CLASSES = len(CLASS_KEYS)  # 没有记录类别的旧模型的分类数
+
+
+def default_settings(model_file_path):
+    '''
+    获得诊断时使用的 信号长度 和 是否标准化（从模型包中读取，与训练时的设置一致）
+    :param model_file_path: 模型路径
+    :return: signal_length：信号长度
+             normal：是否标准化
+    '''
+    bundle = model_registry.get_meta(model_file_path)  # 只读取模型包文件，不加载模型
+    return bundle.signal_length, bundle.normal
+
+
+def model_classes(model_file_path):
+    '''
+    模型的类别（从模型包中读取），没有记录类别的旧模型为标准的 10 类
+    :param model_file_path: 模型路径
+    :return: classes：第 i 个元素是标签 i 对应的类别
+    '''
+    classes = model_registry.get_meta(model_file_path).classes
+    return list(CLASS_KEYS) if not classes else list(classes)
+
+
+def predict_probabilities(model, model_file_path, diagnosis_samples, chunk_size=1024, rpm=None):
+    '''
+    使用模型预测每个样本属于各个类别的概率。样本按块送入模型，特征等中间结果占用的内存只与 chunk_size 有关
+    :param model: 模型
+    :param model_file_path: 模型路径，用来判断模型的类型
+    :param diagnosis_samples: 数据样本，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)
+    :param chunk_size: 每块的样本数
+    :param rpm: 数据的转速（频域特征使用），为None时使用模型包中记录的训练数据的转速
+    :return: y_probas：(N, 分类数) 的概率矩阵（样本的采样频率应当是模型包中记录的采样频率，见 load_data）
+    '''
+    if diagnosis_samples.shape[0] > chunk_size:
+        return np.vstack([predict_probabilities(model, model_file_path, diagnosis_samples[start: start + chunk_size],
+                                                chunk_size, rpm)
+                          for start in range(0, diagnosis_samples.shape[0], chunk_size)])
+
+    suffix = model_file_path.split('/')[-1].split('.')[-1]  # 获得所选模型的后缀名
+    if 'm' == suffix:  # 说明是随机森林
+        # 提取与训练时相同的特征（旧模型没有记录特征组合，只使用时域特征）
+        # 频域特征按模型的采样频率（诊断数据已经重采样到这个频率）计算，与训练时相同
+        feature_set = getattr(model, 'feature_set', 'time')
+        bundle = model_registry.get_meta(model_file_path)
+        rpm = bundle.rpm if rpm is None else rpm
+        diagnosis_samples_feature_extraction = extract_features(diagnosis_samples, feature_set, bundle.sample_rate, rpm)
+        return predict_feature_probabilities(model, model_file_path, diagnosis_samples_feature_extraction)
 
-from feature_extraction import feature_extraction
+    # 对于CNN模型和LSTM,GRU模型，两者的输入不相同，所以捕捉一下异常，如果上面那种维度错了，那就换一个维度
+    try:
+        return model.predict(channels_last(diagnosis_samples))  # (N, signal_length, 通道数)
+    except ValueError:
+        return model.predict(channels_first(diagnosis_samples))  # (N, 通道数, signal_length)
 
 
-def diagnosis(diagnosis_samples, model_file_path):
+def predict_feature_probabilities(model, model_file_path, features):
+    '''
+    随机森林模型：由已经提取好的特征（例如 online_features 增量计算的特征）预测每个样本属于各个类别的概率
+    :param model: 随机森林模型
+    :param model_file_path: 模型路径
+    :param features: (N, 特征数) 的特征矩阵
+    :return: y_probas：(N, 分类数) 的概率矩阵
+    '''
+    # 使用模型进行诊断（多线程，线程数为模型的 n_jobs）。predict_proba 的列只对应训练时出现过的类别，这里把它放到对应的位置上
+    y_probas = np.zeros(shape=[features.shape[0], len(model_classes(model_file_path))])
+    # 明确使用线程后端：在进程池的工作进程（守护进程）中，joblib 默认的 loky 后端会把 n_jobs 强制设为 1，
+    # 批量诊断时每个工作进程就只能用一个线程预测了
+    with parallel_backend('threading', n_jobs=model.n_jobs):
+        y_probas[:, model.classes_.astype(np.int64)] = model.predict_proba(features)
+    return y_probas
+
+
+def predict_classes(model, model_file_path, diagnosis_samples, rpm=None):
+    '''
+    使用模型预测每个样本的类别（概率最大的类别，与 predict / predict_classes 的结果相同）
+    :param model: 模型
+    :param model_file_path: 模型路径，用来判断模型的类型
+    :param diagnosis_samples: 数据样本，(N, signal_length)
+    :param rpm: 数据的转速，为None时使用训练数据的转速
+    :return: y_preds：每个样本的预测类别
+    '''
+    return np.argmax(predict_probabilities(model, model_file_path, diagnosis_samples, rpm=rpm), axis=1)
+
+
+class DiagnosisResult(object):
+    """
+    诊断结果：各类别的投票数、平均概率，以及由此得到的诊断结论和置信度
+    """
+
+    def __init__(self, votes, probability_sum, total_number, classes=None):
+        self.votes = votes  # 各类别的票数（每个样本投一票）
+        self.window_number = int(np.sum(votes))  # 实际诊断了的样本数（提前结束时小于 total_number）
+        self.total_number = total_number  # 样本总数
+        self.probabilities = probability_sum / max(self.window_number, 1)  # 各类别的平均概率
+        self.classes = classes  # 模型的类别，为 None 时是标准的 10 类
+
+    @property
+    def pred(self):
+        return int(np.argmax(self.votes))
+
+    @property
+    def pred_result(self):
+        return result_decode(self.pred, self.classes)
+
+    @property
+    def confidence(self):
+        '''得票最多的类别所占的比例'''
+        return float(self.votes[self.pred]) / max(self.window_number, 1)
+
+    @property
+    def margin(self):
+        '''平均概率最大的两个类别的概率之差'''
+        top2 = np.sort(self.probabilities)[-2:]
+        return float(top2[1] - top2[0])
+
+    @property
+    def early_stopped(self):
+        return self.window_number < self.total_number
+
+    def to_dict(self):
+        return {'pred': self.pred,
+                'pred_result': self.pred_result,
+                'votes': self.votes.tolist(),
+                'probabilities': self.probabilities.tolist(),
+                'confidence': self.confidence,
+                'margin': self.margin,
+                'window_number': self.window_number,
+                'total_number': self.total_number}
+
+    def __str__(self):
+        return self.pred_result
+
+
+def decided(votes, remaining, alpha):
+    '''
+    判断得票最多的类别是否已经确定
+        1. 剩下的样本全部投给第二名也追不上；
+        2. 或者 符号检验：假设前两名的得票概率相同，前两名之间出现这样悬殊的票数的概率小于 alpha
+    :param votes: 各类别目前的票数
+    :param remaining: 还没有诊断的样本数
+    :param alpha: 这一次检验的显著性水平
+    :return: bool
+    '''
+    second, first = np.sort(votes)[-2:]
+    if first - second > remaining:
+        return True
+    return bdtrc(first - 1, first + second, 0.5) < alpha
+
+
+def diagnose(diagnosis_samples, model_file_path, batch_size=50, early_stop=True, alpha=1e-3, min_windows=50,
+             rpm=None):
+    '''
+    故障诊断，返回结构化的诊断结果。样本按批次送入模型，得票最多的类别在统计上已经确定时提前结束
+    :param diagnosis_samples: 数据样本
+    :param model_file_path: 模型路径
+    :param batch_size: 每批送入模型的样本数（允许提前结束时，每批之后判断一次）
+    :param early_stop: 是否允许提前结束，不允许时所有样本按块一次送入模型
+    :param alpha: 提前结束时选错类别的概率上限。每批之后都要检验一次，是多次检验，
+                  所以每次检验使用 alpha / 检验次数（Bonferroni 校正），所有检验合计犯错的概率不超过 alpha
+    :param min_windows: 至少要诊断的样本数
+    :param rpm: 数据的转速（见 data_preprocess.load_rpm），为None时使用训练数据的转速
+    :return: result：DiagnosisResult
+    '''
+    total_number = diagnosis_samples.shape[0]
+    if 0 == total_number:  # 没有样本时所有类别都是 0 票，不能给出诊断结论
+        raise ValueError('没有可以诊断的样本')
+    # 从模型注册表中取得模型（只有第一次使用时才会加载）
+    model = model_registry.get(model_file_path)
+    classes = model_classes(model_file_path)
+
+    votes = np.zeros(len(classes), dtype=np.int64)
+    probability_sum = np.zeros(len(classes))
+    if not early_stop:
+        batch_size = max(total_number, 1)  # 不需要每批判断，predict_probabilities 内部会分块
+    # 计划的检验次数：诊断到的样本数达到 min_windows 之后，每批检验一次
+    ends = np.minimum(np.arange(batch_size, total_number + batch_size, batch_size), total_number)
+    look_alpha = alpha / max(np.count_nonzero(ends >= min_windows), 1)
+    for start in range(0, total_number, batch_size):
+        y_probas = predict_probabilities(model, model_file_path, diagnosis_samples[start: start + batch_size], rpm=rpm)
+        votes += np.bincount(np.argmax(y_probas, axis=1), minlength=len(classes))
+        probability_sum += np.sum(y_probas, axis=0)
+
+        end = min(start + batch_size, total_number)
+        if early_stop and end >= min_windows and decided(votes, total_number - end, look_alpha):
+            break
+
+    return DiagnosisResult(votes, probability_sum, total_number, classes)
+
+
+def diagnosis(diagnosis_samples, model_file_path, rpm=None):
     '''
     故障诊断
     :param diagnosis_samples: 数据样本
     :param model_file_path: 模型路径
+    :param rpm: 数据的转速，为None时使用训练数据的转速
     :return: pred_result：诊断结果
     '''
-    suffix = model_file_path.split('/')[-1].split('.')[-1]  # 获得所选模型的后缀名
-    if 'm' == suffix:  # 说明是随机森林
-        # 提取特征
-        loader = np.empty(shape=[diagnosis_samples.shape[0], 16])
-        for i in range(diagnosis_samples.shape[0]):
-            loader[i] = feature_extraction(diagnosis_samples[i])
-        diagnosis_samples_feature_extraction = loader
-
-        # 加载模型
-        model = joblib.load(model_file_path)
-        # 使用模型进行诊断
-        y_preds = model.predict(diagnosis_samples_feature_extraction)
-    else:
-        diagnosis_samples_new = diagnosis_samples[:, :, np.newaxis]  # 添加一个新维度
-        # 加载模型 --- 这里要用这种方法加载，不然加载有的模型会报错，我也不知道为什么
-        with CustomObjectScope({'GlorotUniform': glorot_uniform()}):
-            model = load_model(model_file_path)
-        # 对于CNN模型和LSTM,GRU模型，两者的输入不相同，所以捕捉一下异常，如果上面那种维度错了，那就换一个维度
-        try:
-            y_preds = model.predict_classes(diagnosis_samples_new)
-        except ValueError:
-            diagnosis_samples_new = diagnosis_samples[:, np.newaxis, :]  # 添加一个新维度
-            y_preds = model.predict_classes(diagnosis_samples_new)
-
-    y_preds = list(y_preds)
-    # 计算这些样本诊断结果中出现次数最多的结果作为最后结果
-    y_pred = max(y_preds, key=y_preds.count)
-    pred_result = result_decode(y_pred)
-
-    return pred_result
-
-
-def result_decode(y_pred):
+    # 这些样本诊断结果中出现次数最多的结果作为最后结果
+    return diagnose(diagnosis_samples, model_file_path, rpm=rpm).pred_result
+
+
+class DiagnosisTimeline(object):
+    """
+    整个文件的诊断时间线：每个窗口的起始位置、预测类别、最大概率，以及诊断的耗时
+    """
+
+    def __init__(self, starts, preds, confidences, probability_sum, classes, signal_length, sample_rate, elapsed,
+                 batch_latencies):
+        self.starts = starts  # 每个窗口的起始位置（重采样之后的数据中的位置）
+        self.preds = preds  # 每个窗口的预测类别
+        self.confidences = confidences  # 每个窗口预测类别的概率
+        self.probability_sum = probability_sum
+        self.classes = classes
+        self.signal_length = signal_length
+        self.sample_rate = sample_rate
+        self.elapsed = elapsed  # 总耗时（秒），包括读取数据
+        self.batch_latencies = batch_latencies  # 每批的耗时（秒）
+
+    @property
+    def result(self):
+        '''所有窗口投票的诊断结果'''
+        votes = np.bincount(self.preds, minlength=len(self.classes))
+        return DiagnosisResult(votes, self.probability_sum, len(self.preds), self.classes)
+
+    def segments(self):
+        '''
+        把连续预测为同一类别的窗口合并为一段
+        :return: segments：列表，每一段为 {'start': 起始位置, 'end': 结束位置, 'start_time'/'end_time': 秒,
+                                           'pred': 类别, 'pred_result': 文字, 'windows': 窗口数, 'confidence': 平均概率}
+        '''
+        if 0 == len(self.preds):
+            return []
+        bounds = np.flatnonzero(np.diff(self.preds)) + 1  # 类别发生变化的窗口
+        segments = []
+        for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(self.preds)]):
+            start, end = int(self.starts[first]), int(self.starts[last - 1]) + self.signal_length
+            pred = int(self.preds[first])
+            segments.append({'start': start, 'end': end,
+                             'start_time': float(start) / self.sample_rate, 'end_time': float(end) / self.sample_rate,
+                             'pred': pred, 'pred_result': result_decode(pred, self.classes),
+                             'windows': int(last - first),
+                             'confidence': float(np.mean(self.confidences[first: last]))})
+        return segments
+
+    def summary(self):
+        '''
+        耗时统计：吞吐量、实时倍数（数据时长 / 诊断耗时）、每批的延迟
+        :return: 统计结果字典
+        '''
+        duration = float(self.starts[-1] + self.signal_length) / self.sample_rate if len(self.starts) else 0.0
+        latencies = np.asarray(self.batch_latencies) * 1000
+        report = {'windows': len(self.preds), 'duration': duration, 'elapsed': self.elapsed,
+                  'windows_per_second': len(self.preds) / self.elapsed if self.elapsed > 0 else 0.0,
+                  'realtime_factor': duration / self.elapsed if self.elapsed > 0 else 0.0}
+        if len(latencies):
+            report.update({'batch_latency_p50_ms': float(np.percentile(latencies, 50)),
+                           'batch_latency_p95_ms': float(np.percentile(latencies, 95)),
+                           'batch_latency_max_ms': float(np.max(latencies))})
+        return report
+
+
+def diagnose_timeline(data_path, model_file_path, hop=None, batch_size=256, signal_length=None, normal=None):
+    '''
+    以 hop 为间隔取遍整个文件进行诊断（结果是确定的，不会漏掉短暂的故障冲击）。
+    窗口是信号的零拷贝滑动窗口视图，每批只把 batch_size 个窗口取到一个固定的缓冲区中送入模型，
+    占用的内存只与 batch_size 有关（另外每个窗口只保存类别和概率），几分钟的 48kHz 数据也可以全部诊断
+    :param data_path: .mat 文件路径
+    :param model_file_path: 模型路径
+    :param hop: 相邻两个窗口起始位置的间隔，默认为信号长度的一半
+    :param batch_size: 每批送入模型的窗口数
+    :param signal_length: 信号长度，默认与训练时一致
+    :param normal: 是否标准化，默认与训练时一致
+    :return: timeline：DiagnosisTimeline
+    '''
+    start_time = time.perf_counter()
+    bundle = model_registry.get_bundle(model_file_path)
+    model = bundle.model
+    classes = model_classes(model_file_path)
+    signal_length = signal_length or bundle.signal_length
+    hop = hop or max(signal_length // 2, 1)
+    normal = bundle.normal if normal is None else normal
+    # 训练时保存的标准化参数，只有信号长度与训练时相同才能使用
+    scaler_stats = bundle.scaler_stats if signal_length == bundle.signal_length else None
+
+    store = SampleStore(signal_length)
+    store.add(data_path, load_data(data_path, bundle.channels, bundle.sample_rate))  # 采样频率不同时读取重采样后的缓存
+    rpm = load_rpm(data_path)  # 文件中记录的转速，没有记录时（为None）使用训练数据的转速
+    index = WindowSampler(signal_length).strided([0], [store.length(0)], hop)
+    if 0 == len(index):  # 数据比一个窗口还短。不能返回结果，否则所有类别都是 0 票，会被当作第 0 类
+        raise ValueError('%s 的数据长度为 %d，比信号长度 %d 短，无法诊断' % (data_path, store.length(0), signal_length))
+    if normal and scaler_stats is None:  # 旧模型：在所有窗口上计算标准化参数（按块计算，不取出所有窗口）
+        scaler_stats = streaming_scaler(store, index)
+    mean, scale = scaler_stats if normal else (None, None)
+
+    buffer = np.empty(shape=(batch_size,) + store.sample_shape)
+    preds = np.empty(len(index), dtype=np.int64)
+    confidences = np.empty(len(index))
+    probability_sum = np.zeros(len(classes))
+    batch_latencies = []
+    for start in range(0, len(index), batch_size):
+        batch_start = time.perf_counter()
+        batch_index = index[start: start + batch_size]
+        samples = store.gather(batch_index, out=buffer[:len(batch_index)], mean=mean, scale=scale)
+        y_probas = predict_probabilities(model, model_file_path, samples, rpm=rpm)
+        preds[start: start + len(batch_index)] = np.argmax(y_probas, axis=1)
+        confidences[start: start + len(batch_index)] = np.max(y_probas, axis=1)
+        probability_sum += np.sum(y_probas, axis=0)
+        batch_latencies.append(time.perf_counter() - batch_start)
+
+    return DiagnosisTimeline(index[:, 1], preds, confidences, probability_sum, classes, signal_length,
+                             bundle.sample_rate, time.perf_counter() - start_time, batch_latencies)
+
+
+def result_decode(y_pred, classes=None):
     '''
     将数字表示的诊断结果解码为文字
-    :param y_pred:
-    :return:
-    '''
-    if 0 == y_pred:
-        pred_result = '滚动体故障：0.1778mm'
-    elif 1 == y_pred:
-        pred_result = '滚动体故障：0.3556mm'
-    elif 2 == y_pred:
-        pred_result = '滚动体故障：0.5334mm'
-    elif 3 == y_pred:
-        pred_result = '内圈故障：0.1778mm'
-    elif 4 == y_pred:
-        pred_result = '内圈故障：0.3556mm'
-    elif 5 == y_pred:
-        pred_result = '内圈故障：0.5334mm'
-    elif 6 == y_pred:
-        pred_result = '外圈故障（6点方向）：0.1778mm'
-    elif 7 == y_pred:
-        pred_result = '外圈故障（6点方向）：0.3556mm'
-    elif 8 == y_pred:
-        pred_result = '外圈故障（6点方向）：0.5334mm'
-    elif 9 == y_pred:
-        pred_result = '正常'
-
-    return pred_result
\ No newline at end of file
+    :param y_pred: 预测的类别（标签）
+    :param classes: 模型的类别（第 i 个元素是标签 i 对应的类别），为 None 时按标准的 10 类解码
+    :return: pred_result：诊断结果的文字
+    '''
+    return class_name((CLASS_KEYS if classes is None else classes)[y_pred])
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:24
+
+@Author: Sun Jiahua
+
+@File  : feature_cache.py
+
+@Desc  : 随机森林训练数据的特征矩阵缓存：
+            提取好的特征矩阵（以及标签、标准化参数等预处理信息）保存到磁盘，
+            以 数据集指纹 为键：各源文件的 路径、修改时间、大小，每个样本的位置（文件序号、起始位置），
+            信号长度、是否标准化、通道、特征组合及其版本号。
+            只调整随机森林的参数时，不需要再取出样本、标准化和提取特征
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from data_preprocess import training_stage_index, training_stage_gather
+from dataset_catalog import DEFAULT_SAMPLE_RATE
+from feature_extraction import FEATURE_VERSIONS
+from random_forest_model import random_forest_features
+from signal_cache import temp_path
+
+FEATURE_CACHE_PATH = os.environ.get('BEARING_FEATURE_CACHE',
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_cache'))
+
+
+def dataset_fingerprint(store, indexes, normal, channels, feature_set):
+    '''
+    计算数据集指纹
+    :param store: SampleStore
+    :param indexes: 各个数据集的索引 (train_index, valid_index, test_index)
+    :param normal: 是否标准化
+    :param channels: 通道
+    :param feature_set: 特征组合
+    :return: fingerprint：字符串
+    '''
+    sha1 = hashlib.sha1()
+    for file_path, label in zip(store.keys, store.labels):  # 每个文件的标签也要算进去
+        stat = os.stat(file_path)
+        sha1.update(('%s|%d|%d|%d\n' % (file_path, stat.st_mtime_ns, stat.st_size, label)).encode('utf-8'))
+    sha1.update(json.dumps(store.classes, ensure_ascii=False).encode('utf-8'))
+    for index in indexes:
+        sha1.update(np.ascontiguousarray(index, dtype=np.int64).tobytes())
+        sha1.update(b'|')
+    versions = [(name, FEATURE_VERSIONS[name]) for name in sorted(FEATURE_VERSIONS) if name in feature_set]
+    settings = {'signal_length': store.signal_length, 'normal': bool(normal), 'channels': list(channels),
+                'feature_set': feature_set, 'versions': versions, 'sample_rate': store.sample_rate}
+    sha1.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def load_features(fingerprint, cache_path=None):
+    '''
+    读取缓存的特征矩阵
+    :param fingerprint: 数据集指纹
+    :param cache_path: 缓存文件夹，默认为 FEATURE_CACHE_PATH
+    :return: (X_train_feature_extraction, y_train, X_test_feature_extraction, y_test, prepro_meta)，没有缓存时返回 None
+    '''
+    path = os.path.join(cache_path or FEATURE_CACHE_PATH, fingerprint + '.npz')
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        prepro_meta = json.loads(str(f['meta']))
+        prepro_meta['scaler_mean'] = f['scaler_mean'] if 'scaler_mean' in f.files else None
+        prepro_meta['scaler_scale'] = f['scaler_scale'] if 'scaler_scale' in f.files else None
+        return f['X_train'], f['y_train'], f['X_test'], f['y_test'], prepro_meta
+
+
+def save_features(fingerprint, X_train_feature_extraction, y_train, X_test_feature_extraction, y_test, prepro_meta,
+                  cache_path=None):
+    '''
+    保存特征矩阵（先写临时文件再替换，防止读到写了一半的文件）
+    :return:
+    '''
+    cache_path = cache_path or FEATURE_CACHE_PATH
+    os.makedirs(cache_path, exist_ok=True)
+    meta = {key: value for key, value in prepro_meta.items() if key not in ('scaler_mean', 'scaler_scale')}
+    arrays = {'meta': np.array(json.dumps(meta, ensure_ascii=False)),
+              'X_train': X_train_feature_extraction, 'y_train': y_train,
+              'X_test': X_test_feature_extraction, 'y_test': y_test}
+    if prepro_meta.get('scaler_mean') is not None:
+        arrays['scaler_mean'] = prepro_meta['scaler_mean']
+        arrays['scaler_scale'] = prepro_meta['scaler_scale']
+    path = os.path.join(cache_path, fingerprint + '.npz')
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def random_forest_dataset(data_path, signal_length=864, signal_number=1000, normal=True, rate=[0.7, 0.2, 0.1],
+                          enhance=True, enhance_step=28, seed=None, channels=('DE',), feature_set='time',
+                          cache_path=None, sample_rate=DEFAULT_SAMPLE_RATE):
+    '''
+    获得随机森林的训练数据（特征矩阵）。先抽样得到样本位置并计算指纹，有缓存时直接读取，否则取出样本、提取特征后保存。
+    seed 为 None 时每次抽到的样本不同，缓存不会命中，调参时应当指定 seed
+    :param data_path: 数据集路径
+    :param signal_length: 信号长度
+    :param signal_number: 每个文件抽取的信号个数
+    :param normal: 是否标准化
+    :param rate: 训练集/验证集/测试集比例
+    :param enhance: 训练集是否采用数据增强
+    :param enhance_step: 增强数据集采样顺延间隔
+    :param seed: 抽样的随机种子
+    :param channels: 通道
+    :param feature_set: 特征组合
+    :param cache_path: 缓存文件夹，默认为 FEATURE_CACHE_PATH
+    :param sample_rate: 模型的采样频率，采样频率不同的文件先重采样
+    :return:
+            X_train_feature_extraction：训练集特征（包括验证集）
+            y_train：训练集标签（one-hot编码）
+            X_test_feature_extraction：测试集特征
+            y_test：测试集标签（one-hot编码）
+            prepro_meta：预处理信息
+    '''
+    store, train_index, valid_index, test_index = training_stage_index(data_path, signal_length, signal_number, rate,
+                                                                       enhance, enhance_step, seed, channels,
+                                                                       sample_rate)
+    fingerprint = dataset_fingerprint(store, (train_index, valid_index, test_index), normal, channels, feature_set)
+    cached = load_features(fingerprint, cache_path)
+    if cached is not None:
+        return cached
+
+    X_train, y_train, X_valid, y_valid, X_test, y_test, prepro_meta = training_stage_gather(
+        store, train_index, valid_index, test_index, normal, channels)
+    # 频域特征按模型的采样频率、每个样本所在文件的转速计算
+    rpms = [store.rpm_of(index) for index in (train_index, valid_index, test_index)]
+    X_train_feature_extraction, y_train, X_test_feature_extraction, y_test = random_forest_features(
+        X_train, y_train, X_valid, y_valid, X_test, y_test, feature_set, store.sample_rate, rpms)
+    save_features(fingerprint, X_train_feature_extraction, y_train, X_test_feature_extraction, y_test, prepro_meta,
+                  cache_path)
+    return X_train_feature_extraction, y_train, X_test_feature_extraction, y_test, prepro_meta
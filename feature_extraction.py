@@ -7,11 +7,17 @@ Created on 2021/2/2 18:43
 
 @File  : feature_extraction.py
 
-@Desc  : 特征提取，提取16个特征
+@Desc  : 特征提取，提取16个特征（多通道样本每个通道分别提取16个特征），可以与 spectral_features.py 中的频域特征组合使用
 """
 
 import numpy as np
 
+from spectral_features import RPM, SAMPLE_RATE, spectral_feature_extraction
+
+FEATURE_SETS = ('time', 'spectral', 'time+spectral')  # 可选的特征组合
+# 特征的版本号，特征的计算方法改变时加 1，之前缓存的特征矩阵（见 feature_cache.py）就会失效
+FEATURE_VERSIONS = {'time': 1, 'spectral': 2}
+
 
 def feature_extraction(data):
     li = []
@@ -82,4 +88,79 @@ def feature_extraction(data):
     Xr = np.square(np.mean(np.sqrt(np.abs(data))))
     li.append(Xr)
 
-    return li
\ No newline at end of file
+    return li
+
+
+def batch_feature_extraction(samples, chunk_size=1024):
+    '''
+    批量特征提取：对 (N, L) 的样本矩阵一次性向量化地提取16个特征，结果与逐个调用 feature_extraction 相同
+    :param samples: 样本矩阵，每一行是一个信号样本。一维数组会被当作单个样本；
+                    (N, 通道数, L) 的多通道样本每个通道分别提取特征
+    :param chunk_size: 每次处理的样本行数，用来限制中间结果占用的内存
+    :return: features：(N, 16) 的特征矩阵，列的顺序与 feature_extraction 返回的列表一致；
+                       多通道时为 (N, 通道数 * 16)，按通道依次排列
+    '''
+    samples = np.asarray(samples, dtype=np.float64)
+    if 1 == samples.ndim:
+        samples = samples[np.newaxis, :]
+    elif 3 == samples.ndim:  # 多通道：把每个通道当作一个样本，提取完再按样本合并
+        sample_number, channel_number, size = samples.shape
+        features = batch_feature_extraction(samples.reshape([sample_number * channel_number, size]), chunk_size)
+        return features.reshape([sample_number, channel_number * 16])
+    sample_number, size = samples.shape
+
+    features = np.empty(shape=[sample_number, 16])
+    for start in range(0, sample_number, chunk_size):
+        data = samples[start: start + chunk_size]
+        out = features[start: start + chunk_size]
+
+        # 各个特征共用的中间结果，只计算一次
+        abs_data = np.abs(data)
+        square_data = np.square(data)
+        sqrt_abs_data = np.sqrt(abs_data)
+
+        max1 = np.max(data, axis=1)
+        min1 = np.min(data, axis=1)
+        absolute_mean_value = np.sum(abs_data, axis=1) / size  # 绝对平均值
+        root_mean_score = np.sqrt(np.sum(square_data, axis=1) / size)  # 均方根值
+        Kurtosis_value = np.sum(np.square(square_data), axis=1) / size  # 峭度值
+        sqrt_abs_mean = np.sum(sqrt_abs_data, axis=1) / size
+
+        out[:, 0] = max1  # 最大值
+        out[:, 1] = np.mean(data, axis=1)  # 平均值
+        out[:, 2] = min1  # 最小值
+        out[:, 3] = np.std(data, axis=1)  # 标准差
+        out[:, 4] = max1 - min1  # 峰峰值
+        out[:, 5] = np.mean(abs_data, axis=1)  # 平均幅值
+        out[:, 6] = root_mean_score  # 均方根值
+        out[:, 7] = np.sum(square_data * data, axis=1) / size  # 歪度值
+        out[:, 8] = Kurtosis_value  # 峭度值
+        out[:, 9] = root_mean_score / absolute_mean_value  # 波形指标
+        out[:, 10] = max1 / absolute_mean_value  # 脉冲指标
+        out[:, 11] = Kurtosis_value / root_mean_score  # 歪度指标
+        out[:, 12] = max1 / root_mean_score  # 峰值指标
+        out[:, 13] = max1 / np.square(sqrt_abs_mean)  # 裕度指标
+        out[:, 14] = Kurtosis_value / np.power(root_mean_score, 4)  # 峭度指标
+        out[:, 15] = np.square(np.mean(sqrt_abs_data, axis=1))  # 方根幅值
+
+    return features
+
+
+def extract_features(samples, feature_set='time', sample_rate=SAMPLE_RATE, rpm=RPM):
+    '''
+    按特征组合批量提取特征
+    :param samples: 样本矩阵 (N, L) 或 多通道的 (N, 通道数, L)
+    :param feature_set: 特征组合，FEATURE_SETS 中的一个：
+                        'time'：16个时域特征；'spectral'：16个频域特征；'time+spectral'：时域特征在前，频域特征在后
+    :param sample_rate: 样本的采样频率（频域特征使用）。默认值只用于没有记录采样频率的旧模型
+    :param rpm: 转速，或 (N,) 的每个样本的转速（频域特征使用）。默认值只用于没有记录转速的旧模型和数据
+    :return: features：特征矩阵
+    '''
+    if feature_set not in FEATURE_SETS:
+        raise ValueError('未知的特征组合：%s，可选：%s' % (feature_set, '、'.join(FEATURE_SETS)))
+    features = []
+    if 'time' in feature_set:
+        features.append(batch_feature_extraction(samples))
+    if 'spectral' in feature_set:
+        features.append(spectral_feature_extraction(samples, sample_rate, rpm))
+    return features[0] if 1 == len(features) else np.hstack(features)
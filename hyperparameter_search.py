@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:27
+
+@Author: Sun Jiahua
+
+@File  : hyperparameter_search.py
+
+@Desc  : 超参数搜索：
+            在搜索空间中随机抽取若干组超参数（试验），用 successive halving（逐次减半）的方式筛选：
+            先用很少的资源（随机森林的树的个数、神经网络的训练轮数）训练所有试验，只保留验证集正确率最高的 1/eta，
+            再用 eta 倍的资源继续训练，直到达到最大资源。保留下来的试验接着上一轮训练，不从头开始：
+            随机森林保留已有的树，只训练新增的树（warm_start）；神经网络从上一轮保存的检查点继续训练。
+            每一轮的试验在多个工作进程中并行训练，所有试验共用一份预处理好的数据集（只预处理一次，保存为 .npy，
+            工作进程以内存映射的方式读取），随机森林的数据集直接保存提取好的特征。
+            最后输出排行榜：验证集正确率、训练时间、推理延迟
+
+            用法示例：
+                python hyperparameter_search.py random_forest real_time_data/0HP --trials 27 --workers 4 --output leaderboard.csv
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+
+import joblib
+import numpy as np
+
+from data_preprocess import channels_first, channels_last, training_stage_index, training_stage_gather
+from feature_extraction import FEATURE_SETS, extract_features
+
+MODEL_NAMES = ['random_forest', '1D_CNN', 'LSTM', 'GRU']
+# 各模型的搜索空间
+SEARCH_SPACES = {
+    'random_forest': {'max_depth': [8, 13, 21, 34, None],
+                      'max_features': [3, 5, 9, 12, 16],
+                      'min_samples_split': [2, 4, 8],
+                      'criterion': ['gini', 'entropy']},
+    '1D_CNN': {'filters': [16, 32, 64],
+               'kernel_size': [10, 20, 40],
+               'strides': [4, 8, 16],
+               'dense_units': [50, 100, 200],
+               'batch_size': [64, 128, 256]},
+    'LSTM': {'units': [[32, 64, 128], [64, 128, 256], [64, 128]],
+             'dropout': [0.2, 0.5],
+             'batch_size': [64, 128]},
+    'GRU': {'units': [[32, 64], [64, 128], [128, 256]],
+            'dropout': [0.2, 0.5],
+            'batch_size': [64, 128]},
+}
+# 各模型在逐次减半中使用的资源：(参数名, 最小资源, 最大资源)
+RESOURCES = {'random_forest': ('n_estimators', 8, 72),
+             '1D_CNN': ('epochs', 2, 20),
+             'LSTM': ('epochs', 6, 60),
+             'GRU': ('epochs', 6, 60)}
+DATASET_NAMES = ['X_train', 'y_train', 'X_valid', 'y_valid', 'X_test', 'y_test']
+# 限制线程数的环境变量：工作进程已经在并行，每个进程里 TensorFlow / OpenMP 再按 CPU 核数开线程会严重超额
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']
+
+_dataset = {}  # 每个工作进程中的数据集（内存映射）
+
+
+def sample_configs(model_name, trial_number, seed=None):
+    '''
+    在搜索空间中随机抽取若干组不重复的超参数
+    :param model_name: 模型名称
+    :param trial_number: 试验个数（搜索空间比较小时可能少于这个数）
+    :param seed: 随机种子
+    :return: configs：超参数字典的列表
+    '''
+    space = SEARCH_SPACES[model_name]
+    rng = np.random.RandomState(seed)
+    configs = []
+    seen = set()
+    for _ in range(trial_number * 20):  # 重复的组合直接丢弃，最多尝试这么多次
+        config = {name: values[rng.randint(len(values))] for name, values in sorted(space.items())}
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+        if len(configs) >= trial_number:
+            break
+    return configs
+
+
+def prepare_dataset(model_name, data_path, dataset_path, signal_length, signal_number, normal, rate, seed=0,
+                    channels=('DE',), feature_set='time'):
+    '''
+    预处理一次数据集，保存为 .npy 文件，所有试验共用。随机森林的数据集保存提取好的特征
+    :param model_name: 模型名称
+    :param data_path: 数据集路径
+    :param dataset_path: 保存的文件夹
+    :return: prepro_meta：预处理信息
+    '''
+    store, train_index, valid_index, test_index = training_stage_index(data_path, signal_length, signal_number, rate,
+                                                                       enhance=False, seed=seed, channels=channels)
+    arrays = training_stage_gather(store, train_index, valid_index, test_index, normal, channels)
+    prepro_meta = arrays[-1]
+    arrays = list(arrays[:-1])
+    if 'random_forest' == model_name:  # 频域特征按模型的采样频率、每个样本所在文件的转速计算
+        for i, index in zip((0, 2, 4), (train_index, valid_index, test_index)):  # X_train, X_valid, X_test
+            arrays[i] = extract_features(arrays[i], feature_set, store.sample_rate, store.rpm_of(index))
+    os.makedirs(dataset_path, exist_ok=True)
+    for name, array in zip(DATASET_NAMES, arrays):
+        np.save(os.path.join(dataset_path, name + '.npy'), array)
+    return prepro_meta
+
+
+def init_worker(dataset_path, feature_set, threads=1):
+    '''
+    工作进程的初始化：以内存映射的方式打开共用的数据集，限制 TensorFlow 的线程数
+    :param dataset_path: 数据集文件夹，各试验上一轮的模型也保存在这里
+    :param feature_set: 随机森林的特征组合
+    :param threads: 每个工作进程使用的线程数（TensorFlow 的 intra-op、inter-op 线程数）
+    :return:
+    '''
+    # 必须在导入 TensorFlow 之前设置（工作进程是 spawn 启动的，只有训练神经网络的试验才会导入）
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    for name in DATASET_NAMES:
+        _dataset[name] = np.load(os.path.join(dataset_path, name + '.npy'), mmap_mode='r')
+    _dataset['feature_set'] = feature_set
+    _dataset['path'] = dataset_path
+
+
+def inference_latency(predict, X, repeat=10):
+    '''
+    测量推理延迟
+    :param predict: 预测函数
+    :param X: 样本
+    :param repeat: 单个样本预测的次数
+    :return: latency_ms：单个样本的预测延迟（中位数，毫秒）
+             throughput：批量预测的吞吐量（样本/s）
+    '''
+    single = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        predict(X[i % len(X): i % len(X) + 1])
+        single.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    predict(X)
+    batch_time = time.perf_counter() - start
+    return float(np.median(single)) * 1000, len(X) / batch_time if batch_time > 0 else None
+
+
+def run_trial(trial):
+    '''
+    在工作进程中运行一个试验：用给定的超参数和资源训练模型，在验证集上评估。
+    试验在上一轮训练过时接着训练：随机森林读取上一轮保存的模型，只训练新增的树；神经网络从保留的检查点继续训练
+    :param trial: {'trial': 试验编号, 'model': 模型名称, 'params': 超参数, 'budget': 资源}
+    :return: record：试验结果
+    '''
+    record = dict(trial)
+    model_name, params, budget = trial['model'], dict(trial['params']), trial['budget']
+    X_train, y_train = np.asarray(_dataset['X_train']), np.asarray(_dataset['y_train'])
+    X_valid, y_valid = np.asarray(_dataset['X_valid']), np.asarray(_dataset['y_valid'])
+    try:
+        start = time.perf_counter()
+        if 'random_forest' == model_name:
+            from random_forest_model import fit_random_forest  # 不需要导入 keras、TensorFlow
+
+            # 下一轮可能在另一个工作进程中运行，上一轮的模型保存在共用的文件夹中
+            model_path = os.path.join(_dataset['path'], 'trial_%d.m' % trial['trial'])
+            model = joblib.load(model_path) if os.path.exists(model_path) else None
+            params['n_estimators'] = budget
+            # 各个试验已经在不同的进程中并行，每个试验只用一个线程
+            model, accuracy = fit_random_forest(X_train, y_train, X_valid, y_valid, _dataset['feature_set'], n_jobs=1,
+                                                params=params, model=model)
+            train_time = time.perf_counter() - start
+            joblib.dump(model, model_path)
+            predict = model.predict_proba
+        else:
+            import training_model
+
+            train = {'1D_CNN': training_model.training_with_1D_CNN,
+                     'LSTM': training_model.training_with_LSTM,
+                     'GRU': training_model.training_with_GRU}[model_name]
+            # 每个试验的检查点保存在自己的文件夹中，训练完成后保留，下一轮接着训练
+            checkpoint_dir = os.path.join(_dataset['path'], 'trial_%d' % trial['trial'])
+            model, history, score = train(X_train, y_train, X_valid, y_valid, X_valid, y_valid, epochs=budget,
+                                          num_classes=y_train.shape[1], verbose=0, checkpoint_dir=checkpoint_dir,
+                                          keep_checkpoints=True, **params)
+            train_time = time.perf_counter() - start
+            accuracy = score[1]
+            to_input = channels_last if '1D_CNN' == model_name else channels_first
+            predict = lambda X: model.predict(to_input(X))
+        latency_ms, throughput = inference_latency(predict, X_valid)
+        record.update(val_accuracy=float(accuracy), train_time=train_time, latency_ms=latency_ms,
+                      throughput=throughput)
+    except Exception as e:  # 一个试验出错不影响其他试验
+        record.update(val_accuracy=None, error='%s: %s' % (type(e).__name__, e))
+    return record
+
+
+def successive_halving(pool, model_name, configs, min_budget, max_budget, eta=3, progress=None):
+    '''
+    逐次减半：每一轮并行地把所有剩下的试验训练到当前资源，保留验证集正确率最高的 1/eta，资源乘以 eta。
+    保留下来的试验接着上一轮训练（见 run_trial），记录中的 train_time 是各轮训练时间的累计
+    :param pool: 进程池
+    :param model_name: 模型名称
+    :param configs: 超参数列表
+    :param min_budget: 第一轮的资源
+    :param max_budget: 最大资源
+    :param eta: 每一轮保留 1/eta 的试验
+    :param progress: 每一轮结束后的回调函数 progress(budget, records)
+    :return: records：所有轮次的试验结果
+    '''
+    trials = list(enumerate(configs))
+    budget = min_budget
+    records = []
+    train_times = {}  # 每个试验累计的训练时间
+    while True:
+        round_records = pool.map(run_trial, [{'trial': i, 'model': model_name, 'params': params, 'budget': budget}
+                                             for i, params in trials], chunksize=1)
+        for record in round_records:
+            if record['val_accuracy'] is not None:
+                train_times[record['trial']] = train_times.get(record['trial'], 0) + record['train_time']
+                record['train_time'] = train_times[record['trial']]
+        records.extend(round_records)
+        if progress is not None:
+            progress(budget, round_records)
+        if budget >= max_budget or len(trials) <= 1:
+            return records
+
+        # 出错的试验直接淘汰
+        ranked = sorted((r for r in round_records if r['val_accuracy'] is not None),
+                        key=lambda r: (-r['val_accuracy'], r['train_time']))
+        keep = set(r['trial'] for r in ranked[:max(len(trials) // eta, 1)])
+        trials = [(i, params) for i, params in trials if i in keep]
+        if not trials:
+            return records
+        budget = min(budget * eta, max_budget)
+
+
+def leaderboard(records):
+    '''
+    排行榜：每个试验取资源最多的一次结果，按 资源、验证集正确率 从高到低排序
+    :param records: 所有轮次的试验结果
+    :return: board：排好序的试验结果
+    '''
+    best = {}
+    for record in records:
+        if record['trial'] not in best or record['budget'] > best[record['trial']]['budget']:
+            best[record['trial']] = record
+    return sorted(best.values(), key=lambda r: (-r['budget'], -(r['val_accuracy'] if r['val_accuracy'] is not None
+                                                                 else -1), r.get('train_time', 0)))
+
+
+def print_leaderboard(board, top=None):
+    '''
+    打印排行榜
+    '''
+    print('%-4s %-6s %-8s %-10s %-12s %-14s %s' % ('排名', '试验', '资源', '验证正确率', '训练时间(s)', '单样本延迟(ms)', '超参数'))
+    for rank, record in enumerate(board[:top], 1):
+        if record['val_accuracy'] is None:
+            print('%-4d %-6d %-8d 出错：%s' % (rank, record['trial'], record['budget'], record.get('error')))
+            continue
+        print('%-4d %-6d %-8d %-10.4f %-12.2f %-14.3f %s' % (rank, record['trial'], record['budget'],
+                                                            record['val_accuracy'], record['train_time'],
+                                                            record['latency_ms'], json.dumps(record['params'])))
+
+
+def write_leaderboard(board, output_path):
+    '''
+    保存排行榜，后缀为 .csv 时输出 CSV，否则输出 JSON
+    '''
+    if output_path.endswith('.csv'):
+        fields = ['rank', 'trial', 'model', 'budget', 'val_accuracy', 'train_time', 'latency_ms', 'throughput',
+                  'params', 'error']
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for rank, record in enumerate(board, 1):
+                writer.writerow(dict(record, rank=rank, params=json.dumps(record['params'])))
+        return
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(board, f, ensure_ascii=False, indent=2)
+
+
+def hyperparameter_search(model_name, data_path, trial_number=27, workers=None, eta=3, signal_length=None,
+                          signal_number=1000, normal=None, rate=[0.7, 0.2, 0.1], seed=0, channels=('DE',),
+                          feature_set='time', min_budget=None, max_budget=None, progress=None):
+    '''
+    超参数搜索
+    :param model_name: 模型名称：random_forest、1D_CNN、LSTM、GRU
+    :param data_path: 数据集路径
+    :param trial_number: 试验个数
+    :param workers: 工作进程数，默认为 CPU 核数
+    :param eta: 逐次减半每一轮保留 1/eta 的试验
+    :param signal_length: 信号长度，默认随机森林 500，神经网络 2048（与界面一致）
+    :param signal_number: 每个文件抽取的样本数
+    :param normal: 是否标准化，默认随机森林不标准化，神经网络标准化（与界面一致）
+    :param rate: 训练集/验证集/测试集比例
+    :param seed: 抽样和抽取超参数的随机种子
+    :param channels: 通道
+    :param feature_set: 随机森林的特征组合
+    :param min_budget: 第一轮的资源，默认见 RESOURCES
+    :param max_budget: 最大资源，默认见 RESOURCES
+    :param progress: 每一轮结束后的回调函数
+    :return: board：排行榜
+    '''
+    is_forest = 'random_forest' == model_name
+    signal_length = signal_length or (500 if is_forest else 2048)
+    normal = (not is_forest) if normal is None else normal
+    _, default_min, default_max = RESOURCES[model_name]
+    min_budget = min_budget or default_min
+    max_budget = max_budget or default_max
+    workers = workers or os.cpu_count() or 1
+    threads = max((os.cpu_count() or 1) // workers, 1)  # 每个工作进程的线程数，合计不超过 CPU 核数
+
+    configs = sample_configs(model_name, trial_number, seed)
+    dataset_path = tempfile.mkdtemp(prefix='search_dataset_')
+    try:
+        prepare_dataset(model_name, data_path, dataset_path, signal_length, signal_number, normal, rate, seed, channels,
+                        feature_set)
+        # keras/TensorFlow 不能在 fork 出来的进程中使用，这里用 spawn 启动工作进程
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes=workers, initializer=init_worker,
+                          initargs=(dataset_path, feature_set, threads)) as pool:
+            records = successive_halving(pool, model_name, configs, min_budget, max_budget, eta, progress)
+    finally:
+        shutil.rmtree(dataset_path, ignore_errors=True)
+    return leaderboard(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='超参数搜索（逐次减半，多进程并行）')
+    parser.add_argument('model', choices=MODEL_NAMES, help='模型名称')
+    parser.add_argument('data', help='数据集文件夹')
+    parser.add_argument('--trials', type=int, default=27, help='试验个数')
+    parser.add_argument('--workers', type=int, help='工作进程数，默认为 CPU 核数')
+    parser.add_argument('--eta', type=int, default=3, help='每一轮保留 1/eta 的试验，资源乘以 eta')
+    parser.add_argument('--min-budget', type=int, help='第一轮的资源（随机森林为树的个数，神经网络为训练轮数）')
+    parser.add_argument('--max-budget', type=int, help='最大资源')
+    parser.add_argument('--signal-length', type=int, help='信号长度')
+    parser.add_argument('--signal-number', type=int, default=1000, help='每个文件抽取的样本数')
+    parser.add_argument('--channels', nargs='+', default=['DE'], choices=['DE', 'FE', 'BA'], help='使用的通道')
+    parser.add_argument('--feature-set', default='time', choices=FEATURE_SETS, help='随机森林使用的特征组合')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--top', type=int, help='只打印排行榜的前几名')
+    parser.add_argument('--output', help='保存排行榜（.csv 或 .json）')
+    args = parser.parse_args(argv)
+
+    def progress(budget, records):
+        finished = [r for r in records if r['val_accuracy'] is not None]
+        best = max(r['val_accuracy'] for r in finished) if finished else float('nan')
+        print('资源 %d：%d 个试验，最高验证正确率 %.4f' % (budget, len(records), best), file=sys.stderr)
+
+    start = time.perf_counter()
+    board = hyperparameter_search(args.model, args.data, args.trials, args.workers, args.eta, args.signal_length,
+                                  args.signal_number, seed=args.seed, channels=args.channels,
+                                  feature_set=args.feature_set, min_budget=args.min_budget,
+                                  max_budget=args.max_budget, progress=progress)
+    print_leaderboard(board, args.top)
+    print('搜索完成，总耗时 %.2f s' % (time.perf_counter() - start), file=sys.stderr)
+    if args.output:
+        write_leaderboard(board, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
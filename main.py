@@ -12,31 +12,40 @@ Created on 2021/2/1 20:43
 
 import sys
 import os
-from scipy.io import loadmat
-from tensorflow import test
-import joblib  # 这个库在安装sklearn时好像会一起安装
 import threading
+import traceback
 
-import matplotlib.pyplot as plt
+from matplotlib import rcParams
+import numpy as np
 from PySide2.QtWidgets import QApplication, QMainWindow, QMessageBox, QFileDialog
 from PySide2.QtGui import QPixmap, QImage
 from PySide2.QtCore import Qt
 from UI.main_window import Ui_MainWindow
 
-from data_preprocess import training_stage_prepro, diagnosis_stage_prepro
-from training_model import training_with_1D_CNN, training_with_LSTM, training_with_GRU, training_with_random_forest
-from preprocess_train_result import plot_history_curcvs, plot_confusion_matrix, brief_classification_report, plot_metrics
+from data_preprocess import diagnosis_stage_prepro, load_rpm
 from message_signal import MyMessageSignal
 from diagnosis import diagnosis
+from model_bundle import copy_bundle, load_evaluation
+from model_registry import model_registry
+from signal_cache import CHANNELS, load_channels, signal_metadata
+from stream_diagnosis import StreamingDiagnoser, file_replay_source
+from training_job import TrainingJob, model_suffix
+from visualization import RenderCache, render_signal
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 # 定义一些全局变量
 global training_end_signal  # 定义一个信号，用于当模型训练完成之后通知主线程进行弹窗提示
 training_end_signal = MyMessageSignal()
 
+global training_progress_signal  # 训练进度信号，每个阶段 / 每轮发送一次
+training_progress_signal = MyMessageSignal()
+
 global diagnosis_end_signal  # 诊断结束信号
 diagnosis_end_signal = MyMessageSignal()
 
+global real_time_diagnosis_signal  # 实时诊断过程中的滚动诊断结果信号
+real_time_diagnosis_signal = MyMessageSignal()
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -48,9 +57,13 @@ class MainWindow(QMainWindow):
         self.cache_path = os.getcwd() + '/cache'  # 所有图片等的缓存路径
         self.training_flag = False  # 是否有模型在训练的标志位
         self.model_name = ''  # 初始化一个模型名字
-        self.model = ''  # 训练得到的模型
+        self.model = ''  # 训练得到的模型（子进程保存的模型文件路径）
         self.classification_report = ''  # 初始化一个 分类报告
         self.score = ''  # 初始化一个模型得分
+        self.prepro_meta = {}  # 训练时的预处理信息（标准化参数等），与模型一起保存
+        self.figures = {}  # 训练结果的各种图（RGBA 数组）
+        self.render_cache = RenderCache()  # 已经缩放好的图片，切换显示时不需要重新绘制
+        self.training_job = TrainingJob(training_progress_signal, training_end_signal)  # 在子进程中训练
 
 
     def init_UI(self):
@@ -65,6 +78,11 @@ class MainWindow(QMainWindow):
         self.ui.pb_select_model.clicked.connect(self.select_model)
         self.ui.pb_real_time_diagnosis.clicked.connect(self.real_time_diagnosis)
         self.ui.pb_local_diagnosis.clicked.connect(self.local_diagnosis)
+        real_time_diagnosis_signal.send_msg.connect(self.real_time_diagnosis_slot)  # 信号与槽连接
+        training_progress_signal.send_msg.connect(self.training_progress_slot)
+        training_end_signal.send_msg.connect(self.training_end_slot)
+        # 只连接一次，每次诊断都连接的话，诊断几次之后结束时槽函数会被调用几次（出错时弹出几次提示）
+        diagnosis_end_signal.send_msg.connect(self.diagnosis_end_slot)
 
     def select_file(self):
         self.ui.pb_select_file.setEnabled(False)
@@ -87,21 +105,30 @@ class MainWindow(QMainWindow):
                 self.ui.pb_visual_data.setEnabled(True)
                 return  # 直接退出
 
-        visual_data_pic_path = visual_data(self.data_file_path, self.cache_path)
-        # 读取图片文件，进行显示
-        img = QImage(visual_data_pic_path)
-        img_result = img.scaled(self.ui.l_visual_data.width(), self.ui.l_visual_data.height(),  # 裁剪图片将图片大小
-                                Qt.IgnoreAspectRatio,  # 保持长宽比例
-                                Qt.SmoothTransformation  # 平滑处理，使图片不失真
-                                )
-        self.ui.l_visual_data.setPixmap(QPixmap.fromImage(img_result))
+        self.show_data(self.data_file_path, self.ui.l_visual_data)
         self.ui.pb_visual_data.setEnabled(True)
 
+    def show_data(self, data_path, label):
+        '''
+        在内存中绘制数据，直接按 label 的大小绘制，显示到 label 上
+        :param data_path: 数据路径
+        :param label: 用来显示的 QLabel
+        :return:
+        '''
+        width, height = label.width(), label.height()
+        stat = os.stat(data_path)
+        key = ('data', os.path.abspath(data_path), stat.st_mtime_ns, width, height)  # 文件被修改后重新绘制
+        pixmap = self.render_cache.get(key, lambda: to_pixmap(visual_data(data_path, width, height)))
+        label.setPixmap(pixmap)
+
     def start_training(self):
-        if self.training_flag:  # 有模型在训练
-            reply = QMessageBox.information(self, '提示', '正在训练模型，请等待...', QMessageBox.Yes, QMessageBox.Yes)
+        if self.training_flag:  # 有模型在训练，可以取消训练
+            reply = QMessageBox.information(self, '提示', '正在训练模型，是否取消训练？', QMessageBox.Yes | QMessageBox.No,
+                                            QMessageBox.No)
             if reply == QMessageBox.Yes:
-                return  # 退出函数
+                self.training_job.cancel()
+                self.ui.statusbar.showMessage('正在取消训练...')
+            return  # 退出函数
 
         if '' == self.data_file_path:  # 没有选择过文件
             reply = QMessageBox.information(self, '提示', '请先选择文件！', QMessageBox.Yes, QMessageBox.Yes)
@@ -135,95 +162,66 @@ class MainWindow(QMainWindow):
         data_path = self.data_file_path.split('/')[-1]  # 先获得文件名
         data_path = self.data_file_path.split(data_path)[0]  # 再去掉文件路径中的文件名
 
-        if '1D_CNN' == select_model:
-            self.model_name = '1D_CNN'
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            if test.is_gpu_available():
-                self.ui.tb_train_result.setText(text + '\n模型选择：1D_CNN\n检测到GPU可用\n--------------')
-            else:
-                self.ui.tb_train_result.setText(text + '\n模型选择：1D_CNN\n未检测到可用GPU\n--------------')
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            self.ui.tb_train_result.setText(text + '\n正在训练模型...\n--------------')
-
-            # 创建子线程，训练模型
-            training_thread = threading.Thread(target=CNN_1D_training,
-                                               args=(data_path, signal_length, signal_number, normal, rate,
-                                                     self.cache_path, self.model_name)
-                                               )
-            # training_thread.setDaemon(True)  # 守护线程
-            training_thread.start()
-            training_end_signal.send_msg.connect(self.training_end_slot)  # 信号与槽连接
-
-        elif 'LSTM' == select_model:
-            self.model_name = 'LSTM'
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            if test.is_gpu_available():
-                self.ui.tb_train_result.setText(text + '\n模型选择：LSTM\n检测到GPU可用\n--------------')
-            else:
-                self.ui.tb_train_result.setText(text + '\n模型选择：LSTM\n未检测到可用GPU\n--------------')
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            self.ui.tb_train_result.setText(text + '\n正在训练模型...\n--------------')
-
-            # 创建子线程，训练模型
-            training_thread = threading.Thread(target=LSTM_training,
-                                               args=(data_path, signal_length, signal_number, normal, rate,
-                                                     self.cache_path, self.model_name)
-                                               )
-            # training_thread.setDaemon(True)  # 守护线程
-            training_thread.start()
-            training_end_signal.send_msg.connect(self.training_end_slot)  # 信号与槽连接
-
-        elif 'GRU' == select_model:
-            self.model_name = 'GRU'
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            if test.is_gpu_available():
-                self.ui.tb_train_result.setText(text + '\n模型选择：GRU\n检测到GPU可用\n--------------')
-            else:
-                self.ui.tb_train_result.setText(text + '\n模型选择：GRU\n未检测到可用GPU\n--------------')
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            self.ui.tb_train_result.setText(text + '\n正在训练模型...\n--------------')
-
-            # 创建子线程，训练模型
-            training_thread = threading.Thread(target=GRU_training,
-                                               args=(data_path, signal_length, signal_number, normal, rate,
-                                                     self.cache_path, self.model_name)
-                                               )
-            # training_thread.setDaemon(True)  # 守护线程
-            training_thread.start()
-            training_end_signal.send_msg.connect(self.training_end_slot)  # 信号与槽连接
-
-        elif '随机森林' == select_model:
-            self.model_name = 'random_forest'
-            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
-            self.ui.tb_train_result.setText(text + '\n模型选择：随机森林\n正在训练模型...\n--------------')
+        model_name = 'random_forest' if '随机森林' == select_model else select_model  # 训练完成后才更新 self.model_name
+        text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
+        # 是否检测到GPU 由训练子进程发送过来（主进程不导入 TensorFlow，界面启动更快）
+        self.ui.tb_train_result.setText(text + '\n模型选择：' + select_model + '\n正在训练模型...\n--------------')
 
-            # 创建子线程，训练模型
-            training_thread = threading.Thread(target=random_forest_training,
-                                               args=(data_path, signal_length, signal_number, normal, rate,
-                                                     self.cache_path, self.model_name)
-                                               )
-            # training_thread.setDaemon(True)  # 守护线程
-            training_thread.start()
-            training_end_signal.send_msg.connect(self.training_end_slot)  # 信号与槽连接
+        # 创建子进程，训练模型。训练好的模型先保存到缓存文件夹，点击 保存模型 时再复制过去
+        os.makedirs(self.cache_path, exist_ok=True)
+        model_file_path = self.cache_path + '/' + model_name + model_suffix(model_name)
+        self.training_job.start(model_name, data_path, signal_length, signal_number, normal, rate,
+                                model_file_path)
+
+    def training_progress_slot(self, msg):
+        text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
+        self.ui.tb_train_result.setText(text + '\n' + msg['text'])
+        self.ui.statusbar.showMessage(msg['text'])
 
     def training_end_slot(self, msg):
-        self.model = msg['model']
+        self.training_flag = False
+        if 'end' != msg['type']:  # 取消或出错
+            if 'cancelled' == msg['type']:
+                info = '训练已取消'
+            else:
+                info = '训练出错：\n' + msg['error']
+            QMessageBox.information(self, '提示', info.split('\n')[0], QMessageBox.Yes, QMessageBox.Yes)
+            self.ui.statusbar.clearMessage()
+            text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
+            self.ui.tb_train_result.setText(text + '\n' + info + '\n--------------')
+            return
+
+        self.model_name = msg['model_name']
+        self.model = msg['model_file_path']
         self.classification_report = msg['classification_report']
         self.score = msg['score']
+        self.prepro_meta = msg['prepro_meta']
+        self.figures = msg['figures']
+        self.render_cache.clear()  # 上一个模型的图已经没用了
 
         QMessageBox.information(self, '提示', '训练完成！', QMessageBox.Yes, QMessageBox.Yes)
         self.ui.statusbar.close()
         text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
         self.ui.tb_train_result.setText(text + '\n训练完成，模型得分：' + self.score + '\n--------------')
         self.ui.l_train_result.setText(self.classification_report)
-        self.training_flag = False
 
     def diagnosis_end_slot(self, msg):
-        pred_result = msg['pred_result']
+        try:
+            text = self.ui.tb_diagnosis_result.toPlainText()
+            if 'error' == msg['type']:  # 诊断出错：弹窗显示异常信息，完整的错误信息显示在诊断结果中
+                info = '诊断出错：' + msg['error'].strip().split('\n')[-1]
+                QMessageBox.information(self, '提示', info, QMessageBox.Yes, QMessageBox.Yes)
+                self.ui.tb_diagnosis_result.setText(text + '\n诊断出错：\n' + msg['error'] + '\n--------------')
+            else:
+                self.ui.tb_diagnosis_result.setText(text + '\n诊断结果：' + msg['pred_result'] + '\n--------------')
+        finally:
+            self.ui.pb_real_time_diagnosis.setEnabled(True)
+            self.ui.pb_local_diagnosis.setEnabled(True)
+
+    def real_time_diagnosis_slot(self, msg):
         text = self.ui.tb_diagnosis_result.toPlainText()
-        self.ui.tb_diagnosis_result.setText(text + '\n诊断结果：' + pred_result + '\n--------------')
-        self.ui.pb_real_time_diagnosis.setEnabled(True)
-        self.ui.pb_local_diagnosis.setEnabled(True)
+        self.ui.tb_diagnosis_result.setText(text + '\n实时诊断（第' + str(msg['index']) + '个窗口）：' + msg['pred_result'] +
+                                            '，延迟 %.1f ms' % (msg['latency'] * 1000))
 
     def show_result(self):
         if '' == self.model_name:  # 说明还没有训练过模型
@@ -237,41 +235,33 @@ class MainWindow(QMainWindow):
         if -2 == show_mode:  # 展示 分类报告
             self.ui.l_train_result.setText(self.classification_report)
         elif -3 == show_mode:  # 展示 混淆矩阵
-            # 读取图片文件，进行显示
-            img = QImage(self.cache_path + '/' + self.model_name + '_confusion_matrix.png')
-            img_result = img.scaled(self.ui.l_train_result.width(), self.ui.l_train_result.height(),  # 裁剪图片将图片大小
-                                    Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            self.ui.l_train_result.setPixmap(QPixmap.fromImage(img_result))
+            self.show_figure('confusion_matrix')
         elif -4 == show_mode:  # 展示 ROC曲线
-            # 读取图片文件，进行显示
-            img = QImage(self.cache_path + '/' + self.model_name + '_ROC_Curves.png')
-            img_result = img.scaled(self.ui.l_train_result.width(), self.ui.l_train_result.height(),  # 裁剪图片将图片大小
-                                    Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            self.ui.l_train_result.setPixmap(QPixmap.fromImage(img_result))
+            self.show_figure('ROC_Curves')
         elif -5 == show_mode:  # 展示 精度召回曲线
-            # 读取图片文件，进行显示
-            img = QImage(self.cache_path + '/' + self.model_name + '_Precision_Recall_Curves.png')
-            img_result = img.scaled(self.ui.l_train_result.width(), self.ui.l_train_result.height(),  # 裁剪图片将图片大小
-                                    Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-            self.ui.l_train_result.setPixmap(QPixmap.fromImage(img_result))
+            self.show_figure('Precision_Recall_Curves')
         elif -6 == show_mode:  # 展示 损失曲线
             if 'random_forest' == self.model_name:  # 随机森林没有损失曲线
                 QMessageBox.information(self, '提示', '随机森林模型没有损失曲线哦！', QMessageBox.Yes, QMessageBox.Yes)
             else:
-                # 读取图片文件，进行显示
-                img = QImage(self.cache_path + '/' + self.model_name + '_train_valid_loss.png')
-                img_result = img.scaled(self.ui.l_train_result.width(), self.ui.l_train_result.height(),  # 裁剪图片将图片大小
-                                        Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-                self.ui.l_train_result.setPixmap(QPixmap.fromImage(img_result))
+                self.show_figure('train_valid_loss')
         elif -7 == show_mode:  # 展示 正确率曲线
             if 'random_forest' == self.model_name:  # 随机森林没有正确率曲线
                 QMessageBox.information(self, '提示', '随机森林模型没有正确率曲线哦！', QMessageBox.Yes, QMessageBox.Yes)
             else:
-                # 读取图片文件，进行显示
-                img = QImage(self.cache_path + '/' + self.model_name + '_train_valid_acc.png')
-                img_result = img.scaled(self.ui.l_train_result.width(), self.ui.l_train_result.height(),  # 裁剪图片将图片大小
-                                        Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-                self.ui.l_train_result.setPixmap(QPixmap.fromImage(img_result))
+                self.show_figure('train_valid_acc')
+
+    def show_figure(self, figure_name):
+        '''
+        显示训练结果的图。缩放后的图片按 (模型, 图, 大小) 缓存，来回切换时直接显示
+        :param figure_name: 图的名字
+        :return:
+        '''
+        width, height = self.ui.l_train_result.width(), self.ui.l_train_result.height()
+        key = ('figure', self.model_name, figure_name, width, height)
+        pixmap = self.render_cache.get(key, lambda: to_pixmap(self.figures[figure_name]).scaled(
+            width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        self.ui.l_train_result.setPixmap(pixmap)
 
     def save_model(self):
         if '' == self.model_name:  # 说明还没有训练过模型
@@ -288,21 +278,30 @@ class MainWindow(QMainWindow):
             if '' == save_path:  # 没有确定保存。这里也可以通过 变量 _ 来判断
                 return
             # print(save_path)
-            joblib.dump(self.model, save_path)  # 存储
         else:
             save_path, _ = QFileDialog.getSaveFileName(self, '保存文件', './' + self.model_name + '.h5', '(*.h5)')
             if '' == save_path:  # 没有确定保存。这里也可以通过 变量 _ 来判断
                 return
-            self.model.save(save_path)
+        # 模型和标准化参数等已经在训练子进程中一起保存，这里直接复制，诊断时使用与训练时相同的预处理
+        copy_bundle(self.model, save_path)
         text = self.ui.tb_train_result.toPlainText()  # 获得原本显示的文字
         self.ui.tb_train_result.setText(text + "\n模型保存成功\n--------------")
 
     def select_model(self):
         self.ui.pb_select_model.setEnabled(False)
-        file_path, _ = QFileDialog.getOpenFileName(self, '选择模型', '.', '(*.m *.h5)')
+        file_path, _ = QFileDialog.getOpenFileName(self, '选择模型', '.', '(*.m *.h5 *.npz)')
         if '' != file_path:  # 选择了文件, 则将路径更新，否则，保留原路径
             self.model_file_path = file_path
             self.ui.tb_diagnosis_result.setText('选择文件：' + self.model_file_path + '\n--------------')
+            evaluation = load_evaluation(self.model_file_path)  # 训练时保存的测试集预测结果，不需要重新预测
+            if evaluation is not None:
+                accuracy = np.mean(evaluation['y_true'] == evaluation['y_preds'])
+                text = self.ui.tb_diagnosis_result.toPlainText()
+                self.ui.tb_diagnosis_result.setText(text + '\n模型在测试集上的正确率：%.4f（%d 个样本）\n--------------' % (
+                    accuracy, len(evaluation['y_true'])))
+            # 在子线程中预先加载模型，这样诊断时可以直接使用
+            preload_thread = threading.Thread(target=model_registry.preload, args=([self.model_file_path],))
+            preload_thread.start()
         self.ui.pb_select_model.setEnabled(True)
 
     def real_time_diagnosis(self):
@@ -319,22 +318,17 @@ class MainWindow(QMainWindow):
         text = self.ui.tb_diagnosis_result.toPlainText()
         self.ui.tb_diagnosis_result.setText(text + '\n实时诊断：正在采集数据...\n--------------')
 
-        # TODO: 这里通过读取指定的文件夹数据来模拟实时采集数据
+        # TODO: 这里通过按采样频率回放指定的文件来模拟实时采集数据，接入真实的采集设备时换成 stream_diagnosis.socket_source
         real_time_data_path = os.getcwd() + '/real_time_data/0HP/48k_Drive_End_B007_0_122.mat'
 
         # 读取完数据后，自动可视化数据
-        visual_data_pic_path = visual_data(real_time_data_path, self.cache_path)
-        # 读取图片文件，进行显示
-        img = QImage(visual_data_pic_path)
-        img_result = img.scaled(self.ui.l_visual_diagnosis_data.width(), self.ui.l_visual_diagnosis_data.height(),  # 裁剪图片将图片大小
-                                Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-        self.ui.l_visual_diagnosis_data.setPixmap(QPixmap.fromImage(img_result))
+        self.show_data(real_time_data_path, self.ui.l_visual_diagnosis_data)
         text = self.ui.tb_diagnosis_result.toPlainText()
         self.ui.tb_diagnosis_result.setText(text + '\n实时诊断：正在诊断..\n--------------')
 
-        # 开个子线程进行故障诊断
-        diagnosis_end_signal.send_msg.connect(self.diagnosis_end_slot)  # 信号与槽连接
-        diagnosis_thread = threading.Thread(target=fault_diagnosis, args=(self.model_file_path, real_time_data_path))
+        # 开个子线程，按采样频率回放数据，进行流式诊断
+        diagnosis_thread = threading.Thread(target=real_time_fault_diagnosis,
+                                            args=(self.model_file_path, real_time_data_path))
         diagnosis_thread.start()
 
     def local_diagnosis(self):
@@ -361,201 +355,111 @@ class MainWindow(QMainWindow):
         self.ui.tb_diagnosis_result.setText(text + '\n本地诊断：正在读取数据...\n--------------')
 
         # 读取完数据后，自动可视化数据
-        visual_data_pic_path = visual_data(file_path, self.cache_path)
-        # 读取图片文件，进行显示
-        img = QImage(visual_data_pic_path)
-        img_result = img.scaled(self.ui.l_visual_diagnosis_data.width(), self.ui.l_visual_diagnosis_data.height(),  # 裁剪图片将图片大小
-                                Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
-        self.ui.l_visual_diagnosis_data.setPixmap(QPixmap.fromImage(img_result))
+        self.show_data(file_path, self.ui.l_visual_diagnosis_data)
 
         text = self.ui.tb_diagnosis_result.toPlainText()
         self.ui.tb_diagnosis_result.setText(text + '\n实时诊断：正在诊断..\n--------------')
 
         # 开个子线程进行故障诊断
-        diagnosis_end_signal.send_msg.connect(self.diagnosis_end_slot)  # 信号与槽连接
         diagnosis_thread = threading.Thread(target=fault_diagnosis,
                                             args=(self.model_file_path, file_path))
         diagnosis_thread.start()
 
     def closeEvent(self, event):
         '''
-        重写关闭窗口函数：在点击关闭窗口后，将缓存文件夹下的文件全部删除
+        重写关闭窗口函数：在点击关闭窗口后，结束训练子进程，将缓存文件夹下的文件全部删除
         :param event:
         :return:
         '''
-        file_names = os.listdir(self.cache_path)
-        for file_name in file_names:
-            os.remove(self.cache_path + '/' + file_name)
+        self.training_job.terminate()
+        if os.path.isdir(self.cache_path):  # 现在的图都在内存中绘制，缓存文件夹可能不存在
+            file_names = os.listdir(self.cache_path)
+            for file_name in file_names:
+                os.remove(self.cache_path + '/' + file_name)
 
         sys.exit()
 
 
-def visual_data(data_path, cache_path):
+def visual_data(data_path, width, height):
     '''
-    可视化数据
+    可视化数据：在内存中绘制完整的数据（按像素列抽取最小值、最大值，绘制的点数只与图片宽度有关）
     :param data_path: 数据路径
-    :param cache_path: 可视化的图缓存的路径
-    :return:
+    :param width: 图片宽度（像素）
+    :param height: 图片高度（像素）
+    :return: image：RGBA 数组
     '''
-    file = loadmat(data_path)  # 加载文件，这里得到的文件是一个 字典
-    file_keys = file.keys()
-    for key in file_keys:
-        if 'DE' in key:  # DE: 驱动端测得的振动数据
-            global data  # 定义一个全局变量
-            data = file[key][:2500]  # 截取数据的前2500个数据点进行绘图
+    # 从信号缓存中读取，诊断时再次读取同一个文件不需要重新解析。文件中有的通道（DE/FE/BA）全部显示，每个通道一行
+    channels = [channel for channel in CHANNELS if channel in signal_metadata(data_path)['channels']]
+    data = load_channels(data_path, channels)
 
     # 解决无法显示中文问题
-    plt.rcParams['font.sans-serif'] = ['SimHei']
-    plt.rcParams['axes.unicode_minus'] = False
-    plt.figure(figsize=(15, 7))
-    plt.plot(data)
-    # plt.title('驱动端测得的振动数据')
-
-    # TODO: 这里预想的是，直接在内存中画图，直接显示到页面上，但暂时不会。所以采用 先将图片保存到本地，再读取文件显示
-    # 获取图片的保存路径 --- 先获得文件名，在与路径拼接
-    visual_data_pic_name = data_path.split('/')[-1].split('.')[0]  # 先按 / 切割，获得最后的文件名，然后按 . 切割，去掉后缀名
-    visual_data_pic_path = cache_path + '/' + visual_data_pic_name + '.png'
-    # 保存图片
-    plt.savefig(visual_data_pic_path,
-                dpi=150, bbox_inches='tight'  # 去除输出图片四周的空白，使图片更加紧凑
-                )
-    # plt.show()  # 要先保存图片，再show。先show的话，plt在show完就没了，保存的就是一张空白
-    plt.close()  # 保存完图片后，要将plt关掉，不然，后面画图可能都会画在一张画布上
-
-    return visual_data_pic_path
-
-
-def CNN_1D_training(data_path, signal_length, signal_number, normal, rate, save_path, model_name):
-    '''
-    训练 1D_CNN 模型
-    :param data_path: 数据路径
-    :param signal_length: 信号长度
-    :param signal_number: 型号个数
-    :param normal: 是否标准化
-    :param rate: 训练集，验证集，测试集 划分比例
-    :param save_path: 训练完后各种图的保存路径
-    :param model_name: 模型名字
-    :return:
-    '''
-    X_train, y_train, X_valid, y_valid, X_test, y_test = training_stage_prepro(data_path, signal_length, signal_number,
-                                                                               normal, rate, enhance=False)
-    model, history, score = training_with_1D_CNN(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128,
-                                                 epochs=20, num_classes=10)
-    plot_history_curcvs(history, save_path, model_name)  # 绘制 训练集合验证集 损失曲线和正确率曲线
-    plot_confusion_matrix(model, model_name, save_path, X_test, y_test)  # 绘制混淆矩阵
-    classification_report = brief_classification_report(model, model_name, X_test, y_test)  # 计算分类报告
-    plot_metrics(model, model_name, save_path, X_test, y_test)  # 绘制 召回率曲线和精确度曲线
-    # sleep(3)
-
-    # 发送信号通知主线程训练完成，让主线程发个弹窗，通知用户, 同时将模型得分发送过去以便显示
-    # training_end_signal.run()
-    msg = {'model': model, 'classification_report': classification_report, 'score': str(score)}
-    training_end_signal.send_msg.emit(msg)
-
-
-def LSTM_training(data_path, signal_length, signal_number, normal, rate, save_path, model_name):
-    '''
-    训练 LSTM 模型
-    :param data_path: 数据路径
-    :param signal_length: 信号长度
-    :param signal_number: 型号个数
-    :param normal: 是否标准化
-    :param rate: 训练集，验证集，测试集 划分比例
-    :param save_path: 训练完后各种图的保存路径
-    :param model_name: 模型名字
-    :return:
-    '''
-    X_train, y_train, X_valid, y_valid, X_test, y_test = training_stage_prepro(data_path, signal_length, signal_number,
-                                                                               normal, rate, enhance=False)
-    model, history, score = training_with_LSTM(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128,
-                                               epochs=60, num_classes=10)
-    plot_history_curcvs(history, save_path, model_name)  # 绘制 训练集合验证集 损失曲线和正确率曲线
-    plot_confusion_matrix(model, model_name, save_path, X_test, y_test)  # 绘制混淆矩阵
-    classification_report = brief_classification_report(model, model_name, X_test, y_test)  # 计算分类报告
-    plot_metrics(model, model_name, save_path, X_test, y_test)  # 绘制 召回率曲线和精确度曲线
-    # sleep(3)
-
-    # 发送信号通知主线程训练完成，让主线程发个弹窗，通知用户
-    # training_end_signal.run()
-    msg = {'model': model, 'classification_report': classification_report, 'score': str(score)}
-    training_end_signal.send_msg.emit(msg)
-
-
-def GRU_training(data_path, signal_length, signal_number, normal, rate, save_path, model_name):
-    '''
-    训练 GRU 模型
-    :param data_path: 数据路径
-    :param signal_length: 信号长度
-    :param signal_number: 型号个数
-    :param normal: 是否标准化
-    :param rate: 训练集，验证集，测试集 划分比例
-    :param save_path: 训练完后各种图的保存路径
-    :param model_name: 模型名字
-    :return:
-    '''
-    X_train, y_train, X_valid, y_valid, X_test, y_test = training_stage_prepro(data_path, signal_length, signal_number,
-                                                                               normal, rate, enhance=False)
-    model, history, score = training_with_GRU(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128,
-                                              epochs=60, num_classes=10)
-    plot_history_curcvs(history, save_path, model_name)  # 绘制 训练集合验证集 损失曲线和正确率曲线
-    plot_confusion_matrix(model, model_name, save_path, X_test, y_test)  # 绘制混淆矩阵
-    classification_report = brief_classification_report(model, model_name, X_test, y_test)  # 计算分类报告
-    plot_metrics(model, model_name, save_path, X_test, y_test)  # 绘制 召回率曲线和精确度曲线
-    # sleep(3)
-
-    # 发送信号通知主线程训练完成，让主线程发个弹窗，通知用户
-    # training_end_signal.run()
-    msg = {'model': model, 'classification_report': classification_report, 'score': str(score)}
-    training_end_signal.send_msg.emit(msg)
-
-
-def random_forest_training(data_path, signal_length, signal_number, normal, rate, save_path, model_name):
+    rcParams['font.sans-serif'] = ['SimHei']
+    rcParams['axes.unicode_minus'] = False
+    return render_signal(data, width, height)
+
+
+def to_pixmap(image):
     '''
-    训练 随机森林 模型
-    :param data_path: 数据路径
-    :param signal_length: 信号长度
-    :param signal_number: 型号个数
-    :param normal: 是否标准化
-    :param rate: 训练集，验证集，测试集 划分比例
-    :param save_path: 训练完后各种图的保存路径
-    :param model_name: 模型名字
-    :return:
+    把 RGBA 数组转换为 QPixmap
+    :param image: (高, 宽, 4) 的 uint8 数组
+    :return: QPixmap
     '''
-    X_train, y_train, X_valid, y_valid, X_test, y_test = training_stage_prepro(data_path, signal_length, signal_number,
-                                                                               normal, rate, enhance=False)
-    model, score, X_train_feature_extraction, X_test_feature_extraction = training_with_random_forest(X_train, y_train,
-                                                                                                      X_valid, y_valid,
-                                                                                                      X_test, y_test)
-    # plot_history_curcvs(history, save_path, model_name)  # 绘制 训练集合验证集 损失曲线和正确率曲线 --- 随机森林没有
-    plot_confusion_matrix(model, model_name, save_path, X_test_feature_extraction, y_test)  # 绘制混淆矩阵
-    classification_report = brief_classification_report(model, model_name, X_test_feature_extraction, y_test)  # 计算分类报告
-    plot_metrics(model, model_name, save_path, X_test_feature_extraction, y_test)  # 绘制 召回率曲线和精确度曲线
-    # sleep(3)
-
-    # 发送信号通知主线程训练完成，让主线程发个弹窗，通知用户
-    # training_end_signal.run()
-    msg = {'model': model, 'classification_report': classification_report, 'score': str(score)}
-    training_end_signal.send_msg.emit(msg)
+    image = np.ascontiguousarray(image)
+    height, width = image.shape[:2]
+    # QImage 不会复制数据，先 copy() 一份，避免数组被释放后图片失效
+    img = QImage(image.data, width, height, 4 * width, QImage.Format_RGBA8888).copy()
+    return QPixmap.fromImage(img)
 
 
 def fault_diagnosis(model_file_path, real_time_data_path):
     '''
-    使用模型进行故障诊断
+    使用模型进行故障诊断（在子线程中运行），无论成功还是出错都会发送 diagnosis_end_signal，界面收到后恢复按钮
     :param model_file_path: 模型路径
     :param real_time_data_path: 数据路径
     :return:
     '''
-    suffix = model_file_path.split('/')[-1].split('.')[-1]  # 获得所选模型的后缀名
-    if 'm' == suffix:  # 说明是随机森林
-        diagnosis_samples = diagnosis_stage_prepro(real_time_data_path, 500, 500, False)
-        pred_result = diagnosis(diagnosis_samples, model_file_path)
-    else:
-        diagnosis_samples = diagnosis_stage_prepro(real_time_data_path, 2048, 500, True)
-        pred_result = diagnosis(diagnosis_samples, model_file_path)
-
-    # 诊断完成，将结果发送回去
-    msg = {'pred_result': pred_result}
-    diagnosis_end_signal.send_msg.emit(msg)
+    msg = {'type': 'error', 'error': '诊断没有完成'}
+    try:
+        bundle = model_registry.get_bundle(model_file_path)  # 使用与训练时相同的 信号长度、是否标准化 和 标准化参数
+        diagnosis_samples = diagnosis_stage_prepro(real_time_data_path, bundle.signal_length, 500, bundle.normal,
+                                                   bundle.scaler_stats, channels=bundle.channels,
+                                                   sample_rate=bundle.sample_rate)
+        # 按文件记录的转速计算频域特征
+        pred_result = diagnosis(diagnosis_samples, model_file_path, load_rpm(real_time_data_path))
+        msg = {'type': 'end', 'pred_result': pred_result}
+    except Exception:  # 子线程中的异常不会传到界面，发送回去显示
+        msg = {'type': 'error', 'error': traceback.format_exc()}
+    finally:
+        # 诊断完成（或出错），将结果发送回去
+        diagnosis_end_signal.send_msg.emit(msg)
+
+
+def real_time_fault_diagnosis(model_file_path, real_time_data_path, report_every=20):
+    '''
+    流式实时诊断：按采样频率回放数据，每到达 hop 个新数据诊断一次（在子线程中运行），
+    无论成功还是出错都会发送 diagnosis_end_signal，界面收到后恢复按钮
+    :param model_file_path: 模型路径
+    :param real_time_data_path: 回放的数据路径
+    :param report_every: 每诊断多少个窗口，向界面发送一次滚动诊断结果
+    :return:
+    '''
+    msg = {'type': 'error', 'error': '诊断没有完成'}
+    try:
+        # 处理不过来时跳过旧窗口，保证延迟有上限
+        diagnoser = StreamingDiagnoser(model_file_path, max_backlog=4, rpm=load_rpm(real_time_data_path))
+        for result in diagnoser.stream(file_replay_source(real_time_data_path, diagnoser.sample_rate)):
+            if 0 == result['index'] % report_every:
+                real_time_diagnosis_signal.send_msg.emit(result)
+
+        # 数据回放结束，将最终结果和统计信息发送回去
+        summary = diagnoser.summary()
+        pred_result = summary['pred_result'] + '\n平均延迟：%.2f ms，吞吐量：%.0f 窗口/s' % (summary['latency_mean_ms'],
+                                                                                  summary['windows_per_second'])
+        msg = {'type': 'end', 'pred_result': pred_result}
+    except Exception:  # 子线程中的异常不会传到界面，发送回去显示
+        msg = {'type': 'error', 'error': traceback.format_exc()}
+    finally:
+        diagnosis_end_signal.send_msg.emit(msg)
 
 
 if __name__ == '__main__':
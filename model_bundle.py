@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:14
+
+@Author: Sun Jiahua
+
+@File  : model_bundle.py
+
+@Desc  : 模型包：把模型和诊断时需要的预处理信息保存在一起
+            模型本身仍然保存为 .m（随机森林）或 .h5（keras），旁边再保存一个 <模型文件名>.bundle.npz，
+            其中包括 训练集的标准化参数（均值、标准差）、信号长度、是否标准化、类别对应的文件、使用的通道、采样频率、转速。
+            诊断时直接使用训练时的标准化参数，不再对诊断数据重新拟合 StandardScaler。
+            训练时在测试集上的预测结果（真实类别、各类别概率、预测类别）保存在 <模型文件名>.evaluation.npz 中，
+            以后查看分类报告、混淆矩阵等时不需要重新预测
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+import joblib
+
+from dataset_catalog import DEFAULT_SAMPLE_RATE
+from spectral_features import RPM
+
+BUNDLE_SUFFIX = '.bundle.npz'
+EVALUATION_SUFFIX = '.evaluation.npz'
+BUNDLE_VERSION = 1
+N_JOBS = int(os.environ.get('BEARING_N_JOBS', -1))  # 随机森林训练和预测使用的线程数，-1 表示使用所有 CPU 核
+
+
+def model_type(model_file_path):
+    '''
+    根据后缀名判断模型的类型
+    :param model_file_path: 模型路径
+    :return: 'random_forest'、'numpy'（导出的 .npz 模型，见 numpy_runtime.py） 或 'keras'
+    '''
+    suffix = model_file_path.split('/')[-1].split('.')[-1]  # 获得所选模型的后缀名
+    if 'm' == suffix:
+        return 'random_forest'
+    return 'numpy' if 'npz' == suffix else 'keras'
+
+
+def load_model_file(model_file_path, n_jobs=None):
+    '''
+    从文件加载模型
+    :param model_file_path: 模型路径，.m 为随机森林，.npz 为导出的 NumPy 模型，其余为 keras 模型
+    :param n_jobs: 随机森林预测使用的线程数，默认为 N_JOBS（旧模型训练时没有设置，加载后也使用多核预测）
+    :return: model：模型
+    '''
+    if 'random_forest' == model_type(model_file_path):
+        model = joblib.load(model_file_path)
+        model.n_jobs = N_JOBS if n_jobs is None else n_jobs
+        return model
+    if 'numpy' == model_type(model_file_path):
+        from numpy_runtime import NumpyModel
+        return NumpyModel.load(model_file_path)
+
+    # 只有 keras 模型才导入 keras（TensorFlow 导入很慢，诊断随机森林和 NumPy 模型时不需要）
+    from keras.utils import CustomObjectScope
+    from keras.initializers import glorot_uniform
+    from keras.models import load_model
+
+    # 加载模型 --- 这里要用这种方法加载，不然加载有的模型会报错，我也不知道为什么
+    with CustomObjectScope({'GlorotUniform': glorot_uniform()}):
+        model = load_model(model_file_path)
+    if hasattr(model, '_make_predict_function'):
+        model._make_predict_function()  # 提前构建预测函数，这样在其他线程中也可以直接使用该模型进行预测
+    return model
+
+
+def default_meta(model_file_path):
+    '''
+    没有模型包文件的旧模型，使用与训练时相同的默认设置（旧模型的频域特征都是按 48kHz、1797 转/分 计算的）
+    :param model_file_path: 模型路径
+    :return: meta：字典
+    '''
+    if 'random_forest' == model_type(model_file_path):
+        return {'signal_length': 500, 'normal': False, 'classes': None, 'sample_rate': DEFAULT_SAMPLE_RATE, 'rpm': RPM}
+    return {'signal_length': 2048, 'normal': True, 'classes': None, 'sample_rate': DEFAULT_SAMPLE_RATE, 'rpm': RPM}
+
+
+class ModelBundle(object):
+    """
+    模型包：模型 + 标准化参数 + 信号长度 + 是否标准化 + 各标签对应的类别 + 通道 + 采样频率 + 转速
+    """
+
+    def __init__(self, model, signal_length, normal, scaler_mean=None, scaler_scale=None, classes=None,
+                 channels=('DE',), sample_rate=DEFAULT_SAMPLE_RATE, rpm=RPM):
+        self.model = model
+        self.signal_length = int(signal_length)
+        self.normal = bool(normal)
+        self.scaler_mean = scaler_mean  # 训练集每个位置的均值，(signal_length,) 或 (通道数, signal_length)
+        self.scaler_scale = scaler_scale  # 训练集每个位置的标准差，形状同上
+        self.classes = classes  # 第 i 个元素是标签 i 对应的类别（更早的模型记录的是训练文件名）
+        self.channels = tuple(channels)  # 使用的通道，旧模型只有 DE
+        # 训练数据的采样频率，诊断时其他采样频率的数据先重采样到这个频率，频域特征也按这个频率计算
+        self.sample_rate = int(sample_rate)
+        self.rpm = float(rpm)  # 训练数据的转速（各文件的中位数），诊断没有记录转速的数据时，频域特征按这个转速计算
+
+    @property
+    def scaler_stats(self):
+        '''
+        标准化参数 (均值, 标准差)。不需要标准化时返回 None；旧模型没有保存标准化参数时也返回 None（诊断时会重新拟合）
+        '''
+        if not self.normal or self.scaler_mean is None:
+            return None
+        return self.scaler_mean, self.scaler_scale
+
+    def meta(self):
+        return {'version': BUNDLE_VERSION, 'signal_length': self.signal_length, 'normal': self.normal,
+                'classes': self.classes, 'channels': list(self.channels), 'sample_rate': self.sample_rate,
+                'rpm': self.rpm}
+
+    def save(self, model_file_path):
+        '''
+        保存模型和模型包文件
+        :param model_file_path: 模型路径
+        :return:
+        '''
+        if 'random_forest' == model_type(model_file_path):
+            joblib.dump(self.model, model_file_path)  # 存储
+        else:
+            self.model.save(model_file_path)
+        arrays = {'meta': np.array(json.dumps(self.meta(), ensure_ascii=False))}
+        if self.scaler_mean is not None:
+            arrays['scaler_mean'] = np.asarray(self.scaler_mean, dtype=np.float64)
+            arrays['scaler_scale'] = np.asarray(self.scaler_scale, dtype=np.float64)
+        with open(model_file_path + BUNDLE_SUFFIX, 'wb') as f:
+            np.savez(f, **arrays)
+
+
+def copy_bundle(model_file_path, save_path):
+    '''
+    复制模型文件和模型包文件（模型在训练子进程中保存，主进程保存时直接复制，不需要加载模型）
+    :param model_file_path: 已保存的模型路径
+    :param save_path: 新的模型路径，后缀名与原模型相同
+    :return:
+    '''
+    shutil.copyfile(model_file_path, save_path)
+    for suffix in (BUNDLE_SUFFIX, EVALUATION_SUFFIX):
+        if os.path.exists(model_file_path + suffix):
+            shutil.copyfile(model_file_path + suffix, save_path + suffix)
+
+
+def save_evaluation(model_file_path, evaluation):
+    '''
+    把测试集上的预测结果保存在模型旁边
+    :param model_file_path: 模型路径
+    :param evaluation: 预测结果，{'y_true': 真实类别, 'y_probas': 各类别概率, 'y_preds': 预测类别}
+    :return:
+    '''
+    with open(model_file_path + EVALUATION_SUFFIX, 'wb') as f:
+        np.savez(f, **evaluation)
+
+
+def load_evaluation(model_file_path):
+    '''
+    读取模型旁边保存的预测结果
+    :param model_file_path: 模型路径
+    :return: evaluation：字典，没有保存时（旧模型）返回 None
+    '''
+    path = model_file_path + EVALUATION_SUFFIX
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return dict((key, f[key]) for key in f.files)
+
+
+def load_bundle_meta(model_file_path):
+    '''
+    只读取模型包文件（信号长度、标准化参数、类别等），不加载模型，model 为 None。
+    没有模型包文件时（旧模型）使用默认设置。
+    主进程只需要这些设置时（例如批量诊断创建进程池之前），不需要加载模型、导入 TensorFlow
+    :param model_file_path: 模型路径
+    :return: bundle：ModelBundle（model 为 None）
+    '''
+    path = model_file_path + BUNDLE_SUFFIX
+    if not os.path.exists(path):
+        return ModelBundle(None, **default_meta(model_file_path))
+
+    with np.load(path) as f:
+        meta = json.loads(str(f['meta']))
+        scaler_mean = f['scaler_mean'] if 'scaler_mean' in f.files else None
+        scaler_scale = f['scaler_scale'] if 'scaler_scale' in f.files else None
+    # 更早的模型包没有记录采样频率、转速，这些模型训练时的频域特征都是按默认的 48kHz、1797 转/分 计算的
+    return ModelBundle(None, meta['signal_length'], meta['normal'], scaler_mean, scaler_scale, meta.get('classes'),
+                       meta.get('channels', ['DE']), meta.get('sample_rate', DEFAULT_SAMPLE_RATE),
+                       meta.get('rpm', RPM))
+
+
+def load_bundle(model_file_path):
+    '''
+    加载模型包。没有模型包文件时（旧模型）使用默认设置
+    :param model_file_path: 模型路径
+    :return: bundle：ModelBundle
+    '''
+    bundle = load_bundle_meta(model_file_path)
+    bundle.model = load_model_file(model_file_path)
+    return bundle
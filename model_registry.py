@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:09
+
+@Author: Sun Jiahua
+
+@File  : model_registry.py
+
+@Desc  : 模型注册表：
+            每个模型文件只加载一次，之后保存在内存中（LRU缓存），再次诊断时直接取出使用。
+            缓存的是模型包（模型 + 标准化参数等，见 model_bundle.py），
+            以 模型路径 + 文件内容的哈希 为键，模型文件或模型包文件被覆盖后会重新加载。
+            只需要模型包中的设置（信号长度、类别等）时用 get_meta，不加载模型
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from model_bundle import BUNDLE_SUFFIX, load_bundle, load_bundle_meta, model_type
+
+
+def file_hash(model_file_path, block_size=1 << 20):
+    '''
+    计算文件内容的哈希值
+    :param model_file_path: 文件路径
+    :param block_size: 每次读取的字节数
+    :return: 哈希值（字符串）
+    '''
+    sha1 = hashlib.sha1()
+    with open(model_file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class ModelRegistry(object):
+    """
+    模型注册表：以 LRU 的方式缓存已经加载好的模型
+    """
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size  # 最多缓存的模型个数
+        self._models = OrderedDict()  # (模型路径, 文件哈希) --> 模型包，越靠后越是最近使用的
+        self._metas = {}  # (模型路径, 文件哈希) --> 没有加载模型的模型包（只有设置）
+        self._hashes = {}  # 模型路径 --> (各文件的(修改时间, 文件大小), 文件哈希)，文件没有变化时不需要重新计算哈希
+        self._lock = threading.RLock()
+
+    def key(self, model_file_path):
+        '''
+        获得模型的缓存键
+        :param model_file_path: 模型路径
+        :return: (模型路径, 文件哈希)
+        '''
+        model_file_path = os.path.abspath(model_file_path)
+        stats = []
+        for path in (model_file_path, model_file_path + BUNDLE_SUFFIX):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+        stats = tuple(stats)
+        cached = self._hashes.get(model_file_path)
+        if cached is None or cached[0] != stats:
+            digest = file_hash(model_file_path)
+            if len(stats) > 1:  # 有模型包文件时，把它也算进去
+                digest += file_hash(model_file_path + BUNDLE_SUFFIX)
+            cached = (stats, digest)
+            self._hashes[model_file_path] = cached
+        return model_file_path, cached[1]
+
+    def get_bundle(self, model_file_path):
+        '''
+        获得模型包，没有缓存时加载
+        :param model_file_path: 模型路径
+        :return: bundle：ModelBundle
+        '''
+        with self._lock:
+            key = self.key(model_file_path)
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            # 同一路径的旧版本模型已经没用了，先移除
+            for old_key in [k for k in self._models if k[0] == key[0]]:
+                del self._models[old_key]
+            bundle = load_bundle(key[0])
+            self._models[key] = bundle
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)  # 移除最久没有使用的模型
+            return bundle
+
+    def get_meta(self, model_file_path):
+        '''
+        获得模型包中的设置（信号长度、是否标准化、类别、通道、采样频率等），不加载模型。
+        模型已经加载时直接使用缓存的模型包
+        :param model_file_path: 模型路径
+        :return: bundle：ModelBundle，没有加载模型时 model 为 None
+        '''
+        with self._lock:
+            key = self.key(model_file_path)
+            if key in self._models:
+                return self._models[key]
+            if key not in self._metas:
+                for old_key in [k for k in self._metas if k[0] == key[0]]:
+                    del self._metas[old_key]
+                self._metas[key] = load_bundle_meta(key[0])
+            return self._metas[key]
+
+    def get(self, model_file_path):
+        '''
+        获得可以直接用来预测的模型，没有缓存时加载
+        :param model_file_path: 模型路径
+        :return: model：模型
+        '''
+        return self.get_bundle(model_file_path).model
+
+    def preload(self, model_file_paths):
+        '''
+        预先加载模型
+        :param model_file_paths: 模型路径列表
+        :return:
+        '''
+        for model_file_path in model_file_paths:
+            self.get_bundle(model_file_path)
+
+    def evict(self, model_file_path):
+        '''
+        从缓存中移除某个模型
+        :param model_file_path: 模型路径
+        :return: 是否移除了模型
+        '''
+        model_file_path = os.path.abspath(model_file_path)
+        with self._lock:
+            keys = [k for k in self._models if k[0] == model_file_path]
+            for key in keys:
+                del self._models[key]
+            for key in [k for k in self._metas if k[0] == model_file_path]:
+                del self._metas[key]
+            self._hashes.pop(model_file_path, None)
+            return len(keys) > 0
+
+    def evict_keras_models(self):
+        '''
+        移除所有 keras 模型。调用 K.clear_session() 之后，之前加载的 keras 模型就不能再用了
+        :return:
+        '''
+        with self._lock:
+            for key in [k for k in self._models if 'keras' == model_type(k[0])]:
+                del self._models[key]
+
+    def clear(self):
+        '''
+        清空缓存
+        :return:
+        '''
+        with self._lock:
+            self._models.clear()
+            self._metas.clear()
+            self._hashes.clear()
+
+    def __contains__(self, model_file_path):
+        model_file_path = os.path.abspath(model_file_path)
+        with self._lock:
+            return any(k[0] == model_file_path for k in self._models)
+
+    def __len__(self):
+        return len(self._models)
+
+
+# 全局的模型注册表，GUI 和 命令行 共用
+model_registry = ModelRegistry()
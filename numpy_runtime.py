@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:36
+
+@Author: Sun Jiahua
+
+@File  : numpy_runtime.py
+
+@Desc  : 轻量的推理运行时：把训练好的 keras 模型（1D_CNN、LSTM、GRU）导出为 .npz（各层的配置和权重），
+            诊断时只用 NumPy 计算前向传播，不需要导入 keras / TensorFlow，诊断进程可以很快启动。
+            支持的层：Conv1D、BatchNormalization、Activation、MaxPooling1D、Flatten、Dense、Dropout、LSTM、GRU
+            随机森林的 .m 模型本身就不依赖 TensorFlow，不需要导出
+
+            用法示例：
+                python numpy_runtime.py 1D_CNN.h5 1D_CNN.npz
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+EXPORT_VERSION = 1
+SUPPORTED_LAYERS = ('Conv1D', 'BatchNormalization', 'Activation', 'MaxPooling1D', 'Flatten', 'Dense', 'Dropout',
+                    'LSTM', 'GRU')
+# 导出时每种层保留的配置
+LAYER_CONFIG_KEYS = {'Conv1D': ('strides', 'padding', 'dilation_rate', 'activation', 'use_bias', 'data_format'),
+                     'BatchNormalization': ('axis', 'epsilon', 'center', 'scale'),
+                     'Activation': ('activation',),
+                     'MaxPooling1D': ('pool_size', 'strides', 'padding'),
+                     'Flatten': (),
+                     'Dense': ('activation', 'use_bias'),
+                     'Dropout': (),
+                     'LSTM': ('activation', 'recurrent_activation', 'use_bias', 'return_sequences', 'go_backwards'),
+                     'GRU': ('activation', 'recurrent_activation', 'use_bias', 'return_sequences', 'go_backwards',
+                             'reset_after')}
+
+
+def softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {'linear': lambda x: x,
+               'relu': lambda x: np.maximum(x, 0),
+               'tanh': np.tanh,
+               'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+               'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1),  # 与 keras 的定义相同
+               'softmax': softmax}
+
+
+def conv1d(x, kernel, bias, strides, padding):
+    '''
+    一维卷积（channels_last）
+    :param x: (N, L, 输入通道数)
+    :param kernel: (卷积核大小, 输入通道数, 卷积核个数)
+    :param bias: (卷积核个数,) 或 None
+    :param strides: 步长
+    :param padding: 'same' 或 'valid'，'same' 的补零方式与 TensorFlow 相同（多出来的一个补在右边）
+    :return: (N, 输出长度, 卷积核个数)
+    '''
+    size = kernel.shape[0]
+    length = x.shape[1]
+    if 'same' == padding:
+        out_length = -(-length // strides)
+        pad = max((out_length - 1) * strides + size - length, 0)
+        x = np.pad(x, ((0, 0), (pad // 2, pad - pad // 2), (0, 0)), mode='constant')
+    else:
+        out_length = (length - size) // strides + 1
+    x = np.ascontiguousarray(x)
+    n, _, channels = x.shape
+    # 每个输出位置对应的输入窗口 (N, 输出长度, 卷积核大小, 输入通道数)，不复制数据
+    windows = as_strided(x, shape=(n, out_length, size, channels),
+                         strides=(x.strides[0], strides * x.strides[1], x.strides[1], x.strides[2]))
+    y = np.tensordot(windows, kernel, axes=([2, 3], [0, 1]))
+    if bias is not None:
+        y += bias
+    return y
+
+
+def max_pooling1d(x, pool_size, strides, padding):
+    '''
+    一维最大池化（channels_last）
+    :param x: (N, L, 通道数)
+    :return: (N, 输出长度, 通道数)
+    '''
+    length = x.shape[1]
+    if 'same' == padding:
+        out_length = -(-length // strides)
+        pad = max((out_length - 1) * strides + pool_size - length, 0)
+        x = np.pad(x, ((0, 0), (pad // 2, pad - pad // 2), (0, 0)), mode='constant', constant_values=-np.inf)
+    else:
+        out_length = (length - pool_size) // strides + 1
+    x = np.ascontiguousarray(x)
+    n, _, channels = x.shape
+    windows = as_strided(x, shape=(n, out_length, pool_size, channels),
+                         strides=(x.strides[0], strides * x.strides[1], x.strides[1], x.strides[2]))
+    return np.max(windows, axis=2)
+
+
+def lstm(x, weights, config):
+    '''
+    LSTM（门的顺序与 keras 相同：输入门、遗忘门、候选状态、输出门）
+    :param x: (N, 时间步, 特征数)
+    :param weights: [kernel, recurrent_kernel, (bias)]
+    :param config: 层的配置
+    :return: 最后一个时刻的输出 (N, 单元数)，或 return_sequences 时 (N, 时间步, 单元数)
+    '''
+    kernel, recurrent_kernel = weights[0], weights[1]
+    bias = weights[2] if config['use_bias'] else 0
+    activation = ACTIVATIONS[config['activation']]
+    recurrent_activation = ACTIVATIONS[config['recurrent_activation']]
+    units = recurrent_kernel.shape[0]
+    if config['go_backwards']:
+        x = x[:, ::-1]
+
+    inputs = np.tensordot(x, kernel, axes=([2], [0])) + bias  # 所有时刻的输入部分一次算完
+    h = np.zeros(shape=[x.shape[0], units])
+    c = np.zeros(shape=[x.shape[0], units])
+    outputs = []
+    for t in range(x.shape[1]):
+        z = inputs[:, t] + h.dot(recurrent_kernel)
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units: 2 * units])
+        c = f * c + i * activation(z[:, 2 * units: 3 * units])
+        o = recurrent_activation(z[:, 3 * units:])
+        h = o * activation(c)
+        outputs.append(h)
+    return np.stack(outputs, axis=1) if config['return_sequences'] else h
+
+
+def gru(x, weights, config):
+    '''
+    GRU（门的顺序与 keras 相同：更新门、重置门、候选状态），支持 reset_after 的两种形式
+    :param x: (N, 时间步, 特征数)
+    :param weights: [kernel, recurrent_kernel, (bias)]，reset_after 时 bias 为 (2, 3 * 单元数)
+    :param config: 层的配置
+    :return: 最后一个时刻的输出 (N, 单元数)，或 return_sequences 时 (N, 时间步, 单元数)
+    '''
+    kernel, recurrent_kernel = weights[0], weights[1]
+    units = recurrent_kernel.shape[0]
+    input_bias, recurrent_bias = 0, 0
+    if config['use_bias']:
+        bias = weights[2]
+        if config.get('reset_after', False):
+            input_bias, recurrent_bias = bias[0], bias[1]
+        else:
+            input_bias = bias
+    activation = ACTIVATIONS[config['activation']]
+    recurrent_activation = ACTIVATIONS[config['recurrent_activation']]
+    if config['go_backwards']:
+        x = x[:, ::-1]
+
+    inputs = np.tensordot(x, kernel, axes=([2], [0])) + input_bias
+    h = np.zeros(shape=[x.shape[0], units])
+    outputs = []
+    for t in range(x.shape[1]):
+        x_t = inputs[:, t]
+        if config.get('reset_after', False):
+            inner = h.dot(recurrent_kernel) + recurrent_bias
+            z = recurrent_activation(x_t[:, :units] + inner[:, :units])
+            r = recurrent_activation(x_t[:, units: 2 * units] + inner[:, units: 2 * units])
+            hh = activation(x_t[:, 2 * units:] + r * inner[:, 2 * units:])
+        else:
+            z = recurrent_activation(x_t[:, :units] + h.dot(recurrent_kernel[:, :units]))
+            r = recurrent_activation(x_t[:, units: 2 * units] + h.dot(recurrent_kernel[:, units: 2 * units]))
+            hh = activation(x_t[:, 2 * units:] + (r * h).dot(recurrent_kernel[:, 2 * units:]))
+        h = z * h + (1 - z) * hh
+        outputs.append(h)
+    return np.stack(outputs, axis=1) if config['return_sequences'] else h
+
+
+def forward_layer(x, layer_type, config, weights):
+    '''
+    计算一层的前向传播
+    :param x: 输入
+    :param layer_type: 层的类型
+    :param config: 层的配置
+    :param weights: 层的权重
+    :return: 输出
+    '''
+    if 'Conv1D' == layer_type:
+        if 1 != config['dilation_rate'][0] or 'channels_last' != config.get('data_format', 'channels_last'):
+            raise ValueError('不支持的 Conv1D 设置：%s' % config)
+        bias = weights[1] if config['use_bias'] else None
+        return ACTIVATIONS[config['activation']](conv1d(x, weights[0], bias, config['strides'][0], config['padding']))
+    if 'BatchNormalization' == layer_type:
+        axis = config['axis'][0] if isinstance(config['axis'], list) else config['axis']
+        if axis not in (-1, x.ndim - 1):
+            raise ValueError('不支持的 BatchNormalization 维度：%s' % axis)
+        weights = list(weights)
+        gamma = weights.pop(0) if config['scale'] else 1.0
+        beta = weights.pop(0) if config['center'] else 0.0
+        moving_mean, moving_variance = weights
+        return (x - moving_mean) / np.sqrt(moving_variance + config['epsilon']) * gamma + beta
+    if 'Activation' == layer_type:
+        return ACTIVATIONS[config['activation']](x)
+    if 'MaxPooling1D' == layer_type:
+        return max_pooling1d(x, config['pool_size'][0], config['strides'][0], config['padding'])
+    if 'Flatten' == layer_type:
+        return x.reshape([x.shape[0], -1])
+    if 'Dense' == layer_type:
+        y = np.tensordot(x, weights[0], axes=([x.ndim - 1], [0]))
+        if config['use_bias']:
+            y += weights[1]
+        return ACTIVATIONS[config['activation']](y)
+    if 'Dropout' == layer_type:  # 预测时不起作用
+        return x
+    if 'LSTM' == layer_type:
+        return lstm(x, weights, config)
+    if 'GRU' == layer_type:
+        return gru(x, weights, config)
+    raise ValueError('不支持的层：%s' % layer_type)
+
+
+class NumpyModel(object):
+    """
+    只用 NumPy 计算的模型，predict 的输入输出与 keras 模型相同
+    """
+
+    def __init__(self, input_shape, layers):
+        '''
+        :param input_shape: 输入的形状（不包括样本数）
+        :param layers: [(层的类型, 配置, 权重列表), ...]
+        '''
+        self.input_shape = tuple(input_shape)
+        self.layers = layers
+
+    def predict(self, x, batch_size=1024):
+        '''
+        预测每个样本属于各个类别的概率
+        :param x: 输入，形状与 keras 模型相同；形状不对时与 keras 一样抛出 ValueError
+        :param batch_size: 每批的样本数，限制中间结果占用的内存
+        :return: (N, 类别数)
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        if x.shape[1:] != self.input_shape:
+            raise ValueError('输入的形状 %s 与模型的输入形状 %s 不一致' % (x.shape[1:], self.input_shape))
+        outputs = []
+        for start in range(0, x.shape[0], batch_size):
+            y = x[start: start + batch_size]
+            for layer_type, config, weights in self.layers:
+                y = forward_layer(y, layer_type, config, weights)
+            outputs.append(y)
+        return np.vstack(outputs) if outputs else np.zeros(shape=[0, 0])
+
+    def predict_proba(self, x, batch_size=1024):
+        return self.predict(x, batch_size)
+
+    def predict_classes(self, x, batch_size=1024):
+        return np.argmax(self.predict(x, batch_size), axis=1)
+
+    def save(self, export_path):
+        '''
+        保存为 .npz：各层的类型和配置（JSON）、输入形状、各层的权重
+        :param export_path: 保存路径
+        :return:
+        '''
+        meta = {'version': EXPORT_VERSION, 'input_shape': list(self.input_shape),
+                'layers': [{'type': layer_type, 'config': config, 'weights': len(weights)}
+                           for layer_type, config, weights in self.layers]}
+        arrays = {'meta': np.array(json.dumps(meta))}
+        for i, (_, _, weights) in enumerate(self.layers):
+            for j, weight in enumerate(weights):
+                arrays['layer%d_%d' % (i, j)] = weight
+        with open(export_path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, export_path):
+        '''
+        读取 .npz 模型
+        :param export_path: 模型路径
+        :return: NumpyModel
+        '''
+        with np.load(export_path) as f:
+            meta = json.loads(str(f['meta']))
+            layers = [(layer['type'], layer['config'], [f['layer%d_%d' % (i, j)] for j in range(layer['weights'])])
+                      for i, layer in enumerate(meta['layers'])]
+        return cls(meta['input_shape'], layers)
+
+
+def from_keras(model):
+    '''
+    把 keras 的 Sequential 模型转换为 NumpyModel
+    :param model: keras 模型
+    :return: NumpyModel
+    '''
+    layers = []
+    for layer in model.layers:
+        layer_type = layer.__class__.__name__
+        if layer_type not in SUPPORTED_LAYERS:
+            raise ValueError('不支持的层：%s' % layer_type)
+        config = layer.get_config()
+        config = dict((key, config[key]) for key in LAYER_CONFIG_KEYS[layer_type] if key in config)
+        weights = [np.asarray(weight, dtype=np.float64) for weight in layer.get_weights()]
+        layers.append((layer_type, config, weights))
+    return NumpyModel(model.input_shape[1:], layers)
+
+
+def export_model(model_file_path, export_path):
+    '''
+    把保存的 keras 模型导出为 .npz，模型包（标准化参数等）和测试集预测结果一起复制过去
+    :param model_file_path: keras 模型路径（.h5）
+    :param export_path: 导出路径（.npz）
+    :return: NumpyModel
+    '''
+    from model_bundle import BUNDLE_SUFFIX, EVALUATION_SUFFIX, load_model_file  # model_bundle 读取 .npz 时也会用到本模块
+
+    numpy_model = from_keras(load_model_file(model_file_path))
+    numpy_model.save(export_path)
+    for suffix in (BUNDLE_SUFFIX, EVALUATION_SUFFIX):
+        if os.path.exists(model_file_path + suffix):
+            shutil.copyfile(model_file_path + suffix, export_path + suffix)
+    return numpy_model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='把 keras 模型导出为只用 NumPy 计算的 .npz 模型')
+    parser.add_argument('model', help='keras 模型路径（.h5）')
+    parser.add_argument('output', help='导出路径（.npz）')
+    args = parser.parse_args(argv)
+
+    if not args.output.endswith('.npz'):
+        parser.error('导出路径的后缀名应为 .npz')
+    numpy_model = export_model(args.model, args.output)
+    print('导出完成：%s（%d 层，输入形状 %s）' % (args.output, len(numpy_model.layers), numpy_model.input_shape))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:49
+
+@Author: Sun Jiahua
+
+@File  : online_features.py
+
+@Desc  : 在线（增量）特征提取：
+            数据流上的滑动窗口每前进 hop 个数据，不再对整个窗口重新调用 feature_extraction，
+            而是只用进入和离开窗口的数据更新 x、x^2、x^3、x^4、|x|、sqrt(|x|) 的累加和，
+            最大值、最小值用单调队列维护（每段新数据一次性向量化地并入队列），
+            所以每次更新的计算量只与 hop 有关，16 个时域特征由累加和直接算出，与 feature_extraction 的结果相同（误差在 1e-9 量级）。
+            累加和每隔一段时间在整个窗口上重新计算一次，加减带来的舍入误差不会累积
+"""
+
+import numpy as np
+
+FEATURE_NUMBER = 16  # 时域特征的个数，顺序与 feature_extraction 相同
+
+
+class RingBuffer(object):
+    """
+    固定长度的环形缓冲区。数据写两份（长度为 2 * size 的数组），这样最新的 size 个数据总是一段连续的内存，取窗口时不需要复制
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = np.zeros(2 * size)
+        self.count = 0  # 一共写入过的数据个数
+
+    def extend(self, data):
+        '''
+        写入一段数据
+        :param data: 一维数据
+        :return:
+        '''
+        skipped = max(len(data) - self.size, 0)  # 超过缓冲区长度的部分会被覆盖，不需要写入，但也要计入写入过的数据个数
+        self.count += skipped
+        data = data[skipped:]
+        start = self.count % self.size
+        first = min(len(data), self.size - start)  # 写到缓冲区末尾的部分，其余的从头开始写
+        self.buffer[start: start + first] = data[:first]
+        self.buffer[start + self.size: start + self.size + first] = data[:first]
+        self.buffer[:len(data) - first] = data[first:]
+        self.buffer[self.size: self.size + len(data) - first] = data[first:]
+        self.count += len(data)
+
+    def full(self):
+        return self.count >= self.size
+
+    def window(self):
+        '''
+        按时间顺序取出最新的 size 个数据（视图）。没有填满时，前面是 0
+        :return: 一维数组
+        '''
+        start = self.count % self.size
+        return self.buffer[start: start + self.size]
+
+
+def push_maximum(positions, values, chunk, first_position, window_start):
+    '''
+    单调队列：把一段新数据并入滑动窗口最大值的候选队列，并去掉已经离开窗口的候选。
+    队列中的值严格递减，队首就是窗口的最大值
+    :param positions: 队列中候选的位置（递增）
+    :param values: 队列中候选的值（严格递减）
+    :param chunk: 新数据
+    :param first_position: 新数据第一个数在整个数据流中的位置
+    :param window_start: 窗口的起始位置，之前的候选会被去掉
+    :return: positions, values：新的队列
+    '''
+    # 新数据中的候选：比它后面的所有数都大的数（后面有更大或相等的数时，它不可能再成为最大值）
+    suffix_max = np.maximum.accumulate(chunk[::-1])[::-1]
+    rows = np.flatnonzero(chunk[:-1] > suffix_max[1:])
+    rows = np.concatenate([rows, [len(chunk) - 1]])  # 最后一个数后面没有数，总是候选
+    # 队列中不大于新数据最大值的候选都要出队，队列递减，出队的是队尾的一段
+    keep = np.searchsorted(-values, -suffix_max[0], side='left')
+    positions = np.concatenate([positions[:keep], first_position + rows])
+    values = np.concatenate([values[:keep], chunk[rows]])
+    start = np.searchsorted(positions, window_start, side='left')  # 离开窗口的候选在队首
+    return positions[start:], values[start:]
+
+
+class OnlineFeatures(object):
+    """
+    数据流最新 signal_length 个数据的 16 个时域特征，随数据到达增量更新
+    """
+
+    def __init__(self, signal_length, refresh_interval=None):
+        '''
+        :param signal_length: 窗口长度
+        :param refresh_interval: 每写入多少个数据在整个窗口上重新计算一次累加和，默认为 64 个窗口长度
+        '''
+        self.signal_length = signal_length
+        self.refresh_interval = refresh_interval or 64 * signal_length
+        self.ring = RingBuffer(signal_length)
+        self.refreshed = 0  # 上一次重新计算累加和时写入过的数据个数
+        self.offset = 0.0  # 计算标准差时先减去这个数（上一次重新计算时窗口的均值），避免大数相减损失精度
+        self.sums = np.zeros(8)  # x、x^2、x^3、x^4、|x|、sqrt(|x|)、(x - offset)^2、(x - offset) 的累加和
+        # 最大值、最小值的单调队列（最小值的队列保存的是 -x）
+        self.max_positions, self.max_values = np.empty(0, dtype=np.int64), np.empty(0)
+        self.min_positions, self.min_values = np.empty(0, dtype=np.int64), np.empty(0)
+
+    @property
+    def count(self):
+        return self.ring.count
+
+    def full(self):
+        return self.ring.full()
+
+    def power_sums(self, block):
+        '''
+        计算各个累加和（所有中间结果写在一个数组中，进入和离开窗口的数据一起计算，减少小数组上的函数调用）
+        :param block: (k, n) 的数据，每一行分别计算
+        :return: (8, k) 的累加和，顺序同 self.sums
+        '''
+        terms = np.empty((8,) + block.shape)
+        terms[0] = block
+        np.multiply(block, block, out=terms[1])
+        np.multiply(terms[1], block, out=terms[2])
+        np.multiply(terms[1], terms[1], out=terms[3])
+        np.abs(block, out=terms[4])
+        np.sqrt(terms[4], out=terms[5])
+        np.subtract(block, self.offset, out=terms[7])
+        np.multiply(terms[7], terms[7], out=terms[6])
+        return terms.sum(axis=-1)
+
+    def refresh(self):
+        '''
+        在整个窗口上重新计算累加和
+        :return:
+        '''
+        window = self.ring.window()
+        self.offset = float(np.mean(window)) if self.full() else 0.0  # 没有填满时窗口前面的 0 也要计入，不能平移
+        self.sums = self.power_sums(window[np.newaxis, :])[:, 0]
+        self.refreshed = self.count
+
+    def push(self, data):
+        '''
+        写入一段新数据，更新累加和与单调队列
+        :param data: 一维数据
+        :return:
+        '''
+        data = np.asarray(data, dtype=np.float64).ravel()
+        if 0 == len(data):
+            return
+        first_position = self.count
+        if len(data) >= self.signal_length:  # 整个窗口都被替换，直接重新计算
+            self.ring.extend(data)
+            self.refresh()
+            chunk = data[-self.signal_length:]
+            first_position = self.count - self.signal_length
+            empty_positions, empty_values = np.empty(0, dtype=np.int64), np.empty(0)
+            self.max_positions, self.max_values = push_maximum(empty_positions, empty_values, chunk,
+                                                               first_position, first_position)
+            self.min_positions, self.min_values = push_maximum(empty_positions, empty_values, -chunk,
+                                                               first_position, first_position)
+            return
+
+        # 离开窗口的数据。没有填满时包括前面补的 0，这时 offset 为 0，0 对所有累加和都没有贡献
+        block = np.empty(shape=[2, len(data)])
+        block[0] = data
+        block[1] = self.ring.window()[:len(data)]
+        was_full = self.full()
+        sums = self.power_sums(block)
+        self.sums += sums[:, 0] - sums[:, 1]
+        self.ring.extend(data)
+
+        window_start = self.count - self.signal_length
+        self.max_positions, self.max_values = push_maximum(self.max_positions, self.max_values, data,
+                                                           first_position, window_start)
+        self.min_positions, self.min_values = push_maximum(self.min_positions, self.min_values, -data,
+                                                           first_position, window_start)
+        if (self.full() and not was_full) or self.count - self.refreshed >= self.refresh_interval:
+            self.refresh()
+
+    def features(self):
+        '''
+        当前窗口的 16 个时域特征（没有填满时，窗口前面补 0）
+        :return: (16,) 的特征，顺序与 feature_extraction 相同
+        '''
+        size = self.signal_length
+        sum1, sum2, sum3, sum4, abs_sum, sqrt_abs_sum, shifted_square_sum, shifted_sum = self.sums
+        max1 = self.max_values[0] if len(self.max_values) else 0.0
+        min1 = -self.min_values[0] if len(self.min_values) else 0.0
+        if not self.full():  # 窗口前面补的 0 也参与最大值、最小值
+            max1, min1 = max(max1, 0.0), min(min1, 0.0)
+        absolute_mean_value = abs_sum / size  # 绝对平均值
+        root_mean_score = np.sqrt(sum2 / size)  # 均方根值
+        Kurtosis_value = sum4 / size  # 峭度值
+        shifted_mean = shifted_sum / size
+        Root_amplitude = np.square(sqrt_abs_sum / size)  # 方根幅值
+
+        out = np.empty(FEATURE_NUMBER)
+        out[0] = max1  # 最大值
+        out[1] = sum1 / size  # 平均值
+        out[2] = min1  # 最小值
+        out[3] = np.sqrt(max(shifted_square_sum / size - shifted_mean * shifted_mean, 0.0))  # 标准差
+        out[4] = max1 - min1  # 峰峰值
+        out[5] = absolute_mean_value  # 平均幅值
+        out[6] = root_mean_score  # 均方根值
+        out[7] = sum3 / size  # 歪度值
+        out[8] = Kurtosis_value  # 峭度值
+        out[9] = root_mean_score / absolute_mean_value  # 波形指标
+        out[10] = max1 / absolute_mean_value  # 脉冲指标
+        out[11] = Kurtosis_value / root_mean_score  # 歪度指标
+        out[12] = max1 / root_mean_score  # 峰值指标
+        out[13] = max1 / Root_amplitude  # 裕度指标
+        out[14] = Kurtosis_value / np.power(root_mean_score, 4)  # 峭度指标
+        out[15] = Root_amplitude  # 方根幅值
+        return out
+
+
+def sliding_features(signal, signal_length, hop):
+    '''
+    用 OnlineFeatures 计算一段信号上所有滑动窗口（起始位置 0, hop, 2 * hop, ...）的特征，
+    结果与对每个窗口调用 feature_extraction 相同
+    :param signal: 一维信号
+    :param signal_length: 窗口长度
+    :param hop: 相邻两个窗口起始位置的间隔
+    :return: features：(窗口数, 16) 的特征矩阵
+    '''
+    signal = np.asarray(signal, dtype=np.float64)
+    engine = OnlineFeatures(signal_length)
+    ends = range(signal_length, len(signal) + 1, hop)
+    features = np.empty(shape=[len(ends), FEATURE_NUMBER])
+    written = 0
+    for i, end in enumerate(ends):
+        engine.push(signal[written: end])
+        written = end
+        features[i] = engine.features()
+    return features
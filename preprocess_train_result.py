@@ -12,24 +12,43 @@ Created on 2021/2/2 13:08
             绘制混淆矩阵
             分类报告
             绘制 ROC曲线，精度召回曲线
+            所有的图都在内存中绘制，返回 RGBA 数组，由界面直接显示；指定了保存路径时才另外保存为图片文件
+            测试集只预测一次（evaluate_model），混淆矩阵、分类报告、ROC曲线、精度召回曲线都由这一次的预测结果得到
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 import seaborn as sns
 from sklearn.metrics import confusion_matrix
 from sklearn import metrics
 import scikitplot as skplt
 
+from data_preprocess import channels_first, channels_last
+from visualization import figure_to_rgba
+
+
+def finish_figure(fig, save_path, file_name):
+    '''
+    在内存中绘制图片，指定了保存路径时同时保存为图片文件
+    :param fig: Figure
+    :param save_path: 图片的保存路径，None 表示不保存
+    :param file_name: 图片文件名
+    :return: image：RGBA 数组
+    '''
+    fig.tight_layout()
+    if save_path is not None:
+        fig.savefig(save_path + '/' + file_name, dpi=150, bbox_inches='tight')
+    return figure_to_rgba(fig)
+
 
 def plot_history_curcvs(history, save_path, model_name):
     '''
     绘制 训练集 和 验证集 的 损失 及 正确率 曲线
     :param history: 模型训练（fit)的返回参数
-    :param save_path: 生成图片的保存路径
+    :param save_path: 生成图片的保存路径，None 表示不保存
     :param model_name: 模型名称
-    :return:
+    :return: images：{'train_valid_acc': 正确率曲线, 'train_valid_loss': 损失曲线}
     '''
     acc = history.history['acc']  # 每一轮 在 训练集 上的 精度
     val_acc = history.history['val_acc']  # 每一轮 在 验证集 上的 精度
@@ -38,125 +57,146 @@ def plot_history_curcvs(history, save_path, model_name):
 
     epochs = range(len(acc))
 
-    plt.plot(epochs, acc, 'bo', label='Training acc')
-    plt.plot(epochs, val_acc, 'b', label='Validation acc')
-    plt.title('Training and validation accuracy')
-    plt.legend()
-    plt.savefig(save_path + '/' + model_name + '_train_valid_acc.png', dpi=150, bbox_inches='tight')
-    plt.close()
-
-    plt.figure()  # 再画一个图，显式 创建figure对象
-    plt.plot(epochs, loss, 'bo', label='Training loss')
-    plt.plot(epochs, val_loss, 'b', label='Validation loss')
-    plt.title('Training and validation loss')
-    plt.legend()
-    plt.savefig(save_path + '/' + model_name + '_train_valid_loss.png', dpi=150, bbox_inches='tight')
-    plt.close()
-    # plt.show()
-
-
-def plot_confusion_matrix(model, model_name, save_path, X_test, y_test):
+    images = {}
+    fig = Figure()
+    ax = fig.add_subplot(111)
+    ax.plot(epochs, acc, 'bo', label='Training acc')
+    ax.plot(epochs, val_acc, 'b', label='Validation acc')
+    ax.set_title('Training and validation accuracy')
+    ax.legend()
+    images['train_valid_acc'] = finish_figure(fig, save_path, model_name + '_train_valid_acc.png')
+
+    fig = Figure()  # 再画一个图，每个图都是独立的 Figure 对象
+    ax = fig.add_subplot(111)
+    ax.plot(epochs, loss, 'bo', label='Training loss')
+    ax.plot(epochs, val_loss, 'b', label='Validation loss')
+    ax.set_title('Training and validation loss')
+    ax.legend()
+    images['train_valid_loss'] = finish_figure(fig, save_path, model_name + '_train_valid_loss.png')
+    return images
+
+
+def evaluate_model(model, model_name, X_test, y_test):
     '''
-    绘制混淆矩阵
+    在测试集上预测一次，得到每个样本的 概率 和 类别，之后的各种报告都使用这个结果
     :param model: 模型
     :param model_name: 模型名称
-    :param save_path: 生成图片的保存路径
-    :param X_test: 测试集
-    :param y_test: 测试集标签
-    :return:
+    :param X_test: 测试集（随机森林为提取好的特征），神经网络也可以是流式数据 WindowSequence（不打乱顺序）
+    :param y_test: 测试集标签（one-hot编码），流式数据时为 None
+    :return: evaluation：字典
+                y_true：真实类别
+                y_probas：(N, 类别数) 每个类别的概率
+                y_preds：预测的类别（与 predict / predict_classes 的结果相同）
     '''
     if '1D_CNN' == model_name:
-        X_test = X_test[:, :, np.newaxis]  # 添加一个新的维度
+        layout = 'channels_last'  # 添加一个新的维度（多通道时把通道放到最后）
     elif 'LSTM' == model_name or 'GRU' == model_name:
-        X_test = X_test[:, np.newaxis, :]  # 添加一个新的维度
-    # 随机森林不需要添加维度
+        layout = 'channels_first'  # 添加一个新的维度
+    else:
+        layout = None  # 随机森林不需要添加维度
+
+    if y_test is None:  # 流式数据：按批次预测，只有一个批次的样本在内存中
+        from training_model import GENERATOR_WORKERS, GENERATOR_QUEUE_SIZE
+        X_test = X_test.with_layout(layout)
+        y_probas = model.predict_generator(X_test, workers=GENERATOR_WORKERS, max_queue_size=GENERATOR_QUEUE_SIZE)
+        y_preds = np.argmax(y_probas, axis=1)
+        return {'y_true': np.asarray(X_test.labels), 'y_probas': np.asarray(y_probas), 'y_preds': y_preds}
+
+    if 'channels_last' == layout:
+        X_test = channels_last(X_test)
+    elif 'channels_first' == layout:
+        X_test = channels_first(X_test)
 
     # 这里两种的 预测函数 不同
     if 'random_forest' == model_name:
-        y_preds = model.predict(X_test)
+        y_probas = model.predict_proba(X_test)
+        y_preds = model.classes_[np.argmax(y_probas, axis=1)]
     else:
-        y_preds = model.predict_classes(X_test)
+        y_probas = model.predict(X_test)
+        y_preds = np.argmax(y_probas, axis=1)
+
+    y_true = np.argmax(y_test, axis=1)  # one-hot解码
+    return {'y_true': y_true, 'y_probas': np.asarray(y_probas), 'y_preds': np.asarray(y_preds)}
 
-    y_test = [np.argmax(item) for item in y_test]  # one-hot解码
 
+def plot_confusion_matrix(evaluation, model_name, save_path):
+    '''
+    绘制混淆矩阵
+    :param evaluation: evaluate_model 的结果
+    :param model_name: 模型名称
+    :param save_path: 生成图片的保存路径，None 表示不保存
+    :return: images：{'confusion_matrix': 混淆矩阵}
+    '''
     # 绘制混淆矩阵
-    con_mat = confusion_matrix(y_test, y_preds)
+    con_mat = confusion_matrix(evaluation['y_true'], evaluation['y_preds'])
 
     con_mat_norm = con_mat.astype('float') / con_mat.sum(axis=1)[:, np.newaxis]  # 归一化
     con_mat_norm = np.around(con_mat_norm, decimals=2)  # np.around(): 四舍五入
 
-    plt.figure(figsize=(8, 8))
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot(111)
     sns.heatmap(con_mat_norm,
                 annot=True,  # annot: 默认为False，为True的话，会在格子上显示数字
-                cmap='Blues'  # 热力图颜色
+                cmap='Blues',  # 热力图颜色
+                ax=ax
                 )
 
-    plt.ylim(0, 10)
-    plt.xlabel('Predicted labels')
-    plt.ylabel('True labels')
-    plt.savefig(save_path + '/' + model_name + '_confusion_matrix.png', dpi=150, bbox_inches='tight')
-    plt.close()
-    # plt.show()
+    ax.set_ylim(0, con_mat.shape[0])  # 行数与类别数相同（类别数由数据集决定，不一定是 10 类）
+    ax.set_xlabel('Predicted labels')
+    ax.set_ylabel('True labels')
+    return {'confusion_matrix': finish_figure(fig, save_path, model_name + '_confusion_matrix.png')}
 
 
-def brief_classification_report(model, model_name, X_test, y_test):
+def brief_classification_report(evaluation):
     '''
     计算 分类报告
-    :param model: 模型
-    :param model_name:  模型名称
-    :param X_test: 测试集
-    :param y_test: 测试集标签
+    :param evaluation: evaluate_model 的结果
     :return: classification_report：分类报告
     '''
-    if '1D_CNN' == model_name:
-        X_test = X_test[:, :, np.newaxis]  # 添加一个新的维度
-    elif 'LSTM' == model_name or 'GRU' == model_name:
-        X_test = X_test[:, np.newaxis, :]  # 添加一个新的维度
-    # 随机森林不需要添加维度
-
-    # 这里两种的 预测函数 不同
-    if 'random_forest' == model_name:
-        y_preds = model.predict(X_test)
-    else:
-        y_preds = model.predict_classes(X_test)
-
-    y_test = [np.argmax(item) for item in y_test]  # one-hot解码
-    classification_report = metrics.classification_report(y_test, y_preds)
+    classification_report = metrics.classification_report(evaluation['y_true'], evaluation['y_preds'])
 
     return classification_report
 
 
-def plot_metrics(model, model_name, save_path, X_test, y_test):
+def plot_metrics(evaluation, model_name, save_path):
     '''
     绘制 ROC曲线 和 精度召回曲线
-    :param model: 模型
+    :param evaluation: evaluate_model 的结果
     :param model_name: 模型名称
-    :param save_path: 生成图片的保存路径
-    :param X_test: 测试集
-    :param y_test: 测试集标签
-    :return:
+    :param save_path: 生成图片的保存路径，None 表示不保存
+    :return: images：{'ROC_Curves': ROC曲线, 'Precision_Recall_Curves': 精度召回曲线}
     '''
-    if '1D_CNN' == model_name:
-        X_test = X_test[:, :, np.newaxis]  # 添加一个新的维度
-    elif 'LSTM' == model_name or 'GRU' == model_name:
-        X_test = X_test[:, np.newaxis, :]  # 添加一个新的维度
-    # 随机森林不需要添加维度
-
-    y_probas = model.predict_proba(X_test)
-    y_test = [np.argmax(item) for item in y_test]  # one-hot解码
+    y_test, y_probas = evaluation['y_true'], evaluation['y_probas']
 
+    images = {}
     # 绘制“ROC曲线”
-    skplt.metrics.plot_roc(y_test, y_probas, title=model_name+' ROC Curves', figsize=(7, 7),
+    fig = Figure(figsize=(7, 7))
+    skplt.metrics.plot_roc(y_test, y_probas, title=model_name+' ROC Curves', ax=fig.add_subplot(111),
                            # title_fontsize = 24, text_fontsize = 16
                            )
-    plt.savefig(save_path + '/' + model_name + '_ROC_Curves.png', dpi=150, bbox_inches='tight')
-    # plt.show()
-    plt.close()
+    images['ROC_Curves'] = finish_figure(fig, save_path, model_name + '_ROC_Curves.png')
 
     # 绘制“精度召回曲线”
-    skplt.metrics.plot_precision_recall(y_test, y_probas, title=model_name+' Precision-Recall Curves', figsize=(7, 7),
+    fig = Figure(figsize=(7, 7))
+    skplt.metrics.plot_precision_recall(y_test, y_probas, title=model_name+' Precision-Recall Curves',
+                                        ax=fig.add_subplot(111),
                                         # title_fontsize = 24, text_fontsize = 16
                                         )
-    plt.savefig(save_path + '/' + model_name + '_Precision_Recall_Curves.png', dpi=150, bbox_inches='tight')
-    # plt.show()
-    plt.close()
+    images['Precision_Recall_Curves'] = finish_figure(fig, save_path, model_name + '_Precision_Recall_Curves.png')
+    return images
+
+
+def evaluation_report(evaluation, model_name, save_path=None):
+    '''
+    由一次预测的结果得到所有的报告（训练完成后，或者以后读取模型旁边保存的预测结果时使用）
+    :param evaluation: evaluate_model 的结果
+    :param model_name: 模型名称
+    :param save_path: 生成图片的保存路径，None 表示不保存
+    :return:
+            images：混淆矩阵、ROC曲线、精度召回曲线
+            classification_report：分类报告
+    '''
+    images = plot_confusion_matrix(evaluation, model_name, save_path)  # 绘制混淆矩阵
+    classification_report = brief_classification_report(evaluation)  # 计算分类报告
+    images.update(plot_metrics(evaluation, model_name, save_path))  # 绘制 召回率曲线和精确度曲线
+    return images, classification_report
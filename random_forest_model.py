@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:01
+
+@Author: Sun Jiahua
+
+@File  : random_forest_model.py
+
+@Desc  : 随机森林的训练（特征提取 + 训练），只依赖 NumPy 和 scikit-learn。
+            原来在 training_model.py 中，与 keras 模型放在一起，只训练随机森林、使用特征缓存、做随机森林的超参数搜索时
+            也要导入 keras 和 TensorFlow；单独放在这里之后不再需要（training_model 中仍然可以导入这些函数）
+"""
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from feature_extraction import extract_features
+from model_bundle import N_JOBS
+from spectral_features import RPM, SAMPLE_RATE
+
+# 随机森林的默认超参数
+RANDOM_FOREST_PARAMS = {'n_estimators': 17, 'max_depth': 21, 'criterion': 'gini', 'min_samples_split': 2,
+                        'max_features': 9}
+
+
+def random_forest_features(X_train, y_train, X_valid, y_valid, X_test, y_test, feature_set='time',
+                           sample_rate=SAMPLE_RATE, rpms=(RPM, RPM, RPM)):
+    '''
+    随机森林的特征提取：把训练集和验证集合并，全部用作训练集，然后批量提取特征
+    :param X_train: 训练集，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)
+    :param y_train: 训练集标签
+    :param X_valid: 验证集
+    :param y_valid: 验证集标签
+    :param X_test: 测试集
+    :param y_test: 测试集标签
+    :param feature_set: 特征组合：'time'（16个时域特征）、'spectral'（16个频域特征）、'time+spectral'
+    :param sample_rate: 样本的采样频率（频域特征使用，与模型包中记录的相同）
+    :param rpms: 训练集、验证集、测试集的转速（频域特征使用），每一个可以是一个数，也可以是每个样本的转速数组
+    :return:
+            X_train_feature_extraction：将原数据进行了特征提取过的训练集（包括验证集）
+            y_train：训练集标签（one-hot编码，包括验证集）
+            X_test_feature_extraction：将原数据进行了特征提取过的测试集
+            y_test：测试集标签（one-hot编码）
+    '''
+    # 把训练集和验证集合并，全部用作训练集
+    rpm_train = np.concatenate((np.broadcast_to(rpms[0], len(X_train)), np.broadcast_to(rpms[1], len(X_valid))))
+    X_train = np.vstack((X_train, X_valid))
+    y_train = np.vstack((y_train, y_valid))
+
+    # 批量提取特征
+    X_train_feature_extraction = extract_features(X_train, feature_set, sample_rate, rpm_train)
+    X_test_feature_extraction = extract_features(X_test, feature_set, sample_rate, rpms[2])
+    return X_train_feature_extraction, y_train, X_test_feature_extraction, y_test
+
+
+def fit_random_forest(X_train_feature_extraction, y_train, X_test_feature_extraction, y_test, feature_set='time',
+                      n_jobs=N_JOBS, params=None, model=None):
+    '''
+    在提取好的特征上训练随机森林
+    :param X_train_feature_extraction: 训练集特征
+    :param y_train: 训练集标签（one-hot编码）
+    :param X_test_feature_extraction: 测试集特征
+    :param y_test: 测试集标签（one-hot编码）
+    :param feature_set: 特征所用的特征组合，与模型一起保存
+    :param n_jobs: 训练和预测使用的线程数，-1 表示使用所有 CPU 核
+    :param params: 随机森林的超参数，没有给出的使用 RANDOM_FOREST_PARAMS 中的默认值
+    :param model: 在同样的数据上训练过的随机森林，给出时保留已有的树，只训练新增的树（warm_start）。
+                  与一次训练 params['n_estimators'] 棵树的结果相同
+    :return:
+            clf_rfc：训练完成的模型
+            score：模型在测试集上的得分
+    '''
+    # 将one-hot编码了的标签解码（这里不需要one-hot编码）
+    y_train = np.argmax(y_train, axis=1)
+    y_test = np.argmax(y_test, axis=1)
+
+    rf_params = dict(RANDOM_FOREST_PARAMS)
+    rf_params.update(params or {})
+    rf_params['max_features'] = min(rf_params['max_features'], X_train_feature_extraction.shape[1])
+    if model is None:
+        clf_rfc = RandomForestClassifier(random_state=60, n_jobs=n_jobs, **rf_params)
+    else:
+        clf_rfc = model
+        clf_rfc.set_params(warm_start=True, n_jobs=n_jobs, **rf_params)
+    clf_rfc.fit(X_train_feature_extraction, y_train)
+    clf_rfc.feature_set = feature_set  # 与模型一起保存，诊断时提取同样的特征
+    score = clf_rfc.score(X_test_feature_extraction, y_test)
+    return clf_rfc, score
+
+
+def training_with_random_forest(X_train, y_train, X_valid, y_valid, X_test, y_test, feature_set='time', n_jobs=N_JOBS,
+                                sample_rate=SAMPLE_RATE, rpms=(RPM, RPM, RPM)):
+    '''
+    使用 随机森林 进行训练（特征提取 + 训练）
+    :param X_train: 训练集，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)
+    :param y_train: 训练集标签
+    :param X_valid: 验证集
+    :param y_valid: 验证集标签
+    :param X_test: 测试集
+    :param y_test: 测试集标签
+    :param feature_set: 特征组合：'time'（16个时域特征）、'spectral'（16个频域特征）、'time+spectral'
+    :param n_jobs: 训练和预测使用的线程数，-1 表示使用所有 CPU 核
+    :param sample_rate: 样本的采样频率（频域特征使用）
+    :param rpms: 训练集、验证集、测试集的转速（频域特征使用），见 random_forest_features
+    :return:
+            clf_rfc：训练完成的模型
+            score：模型在验证集上的得分
+            X_train_feature_extraction：将原数据进行了特征提取过的训练集
+            X_test_feature_extraction：将原数据进行了特征提取过的测试集
+    '''
+    X_train_feature_extraction, y_train, X_test_feature_extraction, y_test = random_forest_features(
+        X_train, y_train, X_valid, y_valid, X_test, y_test, feature_set, sample_rate, rpms)
+    clf_rfc, score = fit_random_forest(X_train_feature_extraction, y_train, X_test_feature_extraction, y_test,
+                                       feature_set, n_jobs)
+    return clf_rfc, score, X_train_feature_extraction, X_test_feature_extraction
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:38
+
+@Author: Sun Jiahua
+
+@File  : sample_sequence.py
+
+@Desc  : 流式的训练数据：训练集、验证集、测试集只保存样本的位置 (文件序号, 起始位置)，
+            每个批次需要时才从缓存的信号（内存映射）中取出样本、标准化、编码标签，
+            由 keras 的 fit_generator 用多个线程并行取批次并预先放入队列，
+            占用的内存只与批次大小有关，与数据集的大小无关，可以用很多文件（各种负载、采样频率、现场采集的数据）训练。
+            标准化参数也按块计算（data_preprocess.streaming_scaler，与 StandardScaler 的结果相同），不需要把训练集全部取出
+"""
+
+import numpy as np
+from keras.utils import Sequence
+
+from data_preprocess import streaming_scaler, training_stage_index
+from dataset_catalog import DEFAULT_SAMPLE_RATE
+
+LAYOUTS = ('channels_last', 'channels_first', None)
+
+
+class WindowSequence(Sequence):
+    """
+    按批次生成样本的 keras Sequence。样本按 layout 排列：
+        'channels_last'：(batch, signal_length, 通道数)，1D_CNN 的输入
+        'channels_first'：(batch, 通道数, signal_length)，LSTM、GRU 的输入
+        None：(batch, signal_length) 或 多通道的 (batch, 通道数, signal_length)
+    """
+
+    def __init__(self, store, index, batch_size=128, num_classes=None, mean=None, scale=None, layout=None,
+                 shuffle=False, seed=None):
+        '''
+        :param store: SampleStore
+        :param index: (N, 2) 的样本索引，标签为 store.label_of(index)
+        :param batch_size: 批次大小
+        :param num_classes: 分类数，默认为 store 的类别数
+        :param mean: 标准化的均值，为 None 时不标准化
+        :param scale: 标准化的标准差
+        :param layout: 样本的排列方式
+        :param shuffle: 每轮结束后是否打乱顺序（训练集）
+        :param seed: 打乱顺序的随机种子
+        '''
+        if layout not in LAYOUTS:
+            raise ValueError('layout 应为 %s 之一' % (LAYOUTS,))
+        self.store = store
+        self.index = np.asarray(index, dtype=np.int64).reshape([-1, 2])
+        self.batch_size = batch_size
+        self.num_classes = len(store.classes) if num_classes is None else num_classes
+        self.labels = store.label_of(self.index)  # 所有样本的标签（按索引的顺序，不打乱）
+        self.mean = mean
+        self.scale = scale
+        self.layout = layout
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        self.order = np.arange(len(self.index))
+        if shuffle:
+            self.rng.shuffle(self.order)
+
+    def __len__(self):
+        return int(np.ceil(len(self.index) / float(self.batch_size)))
+
+    @property
+    def sample_shape(self):
+        '''一个样本（按 layout 排列后）的形状'''
+        shape = self.store.sample_shape
+        if 1 == len(shape):
+            shape = (1,) + shape
+        if 'channels_last' == self.layout:
+            return shape[1], shape[0]
+        if 'channels_first' == self.layout:
+            return shape
+        return self.store.sample_shape
+
+    @property
+    def shape(self):
+        '''全部样本的形状（与取出为数组时相同，len() 则是批次数）'''
+        return (len(self.index),) + tuple(self.sample_shape)
+
+    def with_layout(self, layout):
+        '''
+        同样的数据，换一种排列方式（不复制数据）
+        :param layout: 样本的排列方式
+        :return: WindowSequence
+        '''
+        sequence = WindowSequence(self.store, self.index, self.batch_size, self.num_classes, self.mean, self.scale,
+                                  layout, self.shuffle)
+        sequence.rng, sequence.order = self.rng, self.order
+        return sequence
+
+    def samples(self, rows):
+        '''
+        取出样本：标准化、按 layout 排列
+        :param rows: 样本在索引中的行号
+        :return: 样本矩阵
+        '''
+        samples = self.store.gather(self.index[rows], mean=self.mean, scale=self.scale)
+        if 2 == samples.ndim:
+            samples = samples[:, np.newaxis, :]  # 单通道，添加一个新的维度
+        if 'channels_last' == self.layout:
+            return samples.transpose(0, 2, 1)
+        if 'channels_first' == self.layout:
+            return samples
+        return samples.reshape((len(samples),) + self.store.sample_shape)
+
+    def __getitem__(self, i):
+        rows = self.order[i * self.batch_size: (i + 1) * self.batch_size]
+        y = np.zeros(shape=[len(rows), self.num_classes], dtype=np.int32)
+        y[np.arange(len(rows)), self.labels[rows]] = 1  # one-hot编码
+        return self.samples(rows), y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
+def training_stage_sequences(data_path, signal_length=864, signal_number=1000, normal=True, rate=[0.7, 0.2, 0.1],
+                             enhance=True, enhance_step=28, seed=None, channels=('DE',),
+                             sample_rate=DEFAULT_SAMPLE_RATE, batch_size=128):
+    '''
+    训练阶段的流式数据，参数含义同 training_stage_prepro
+    :param batch_size: 批次大小
+    :return:
+            train_sequence：训练集（每轮打乱顺序）
+            valid_sequence：验证集
+            test_sequence：测试集
+            prepro_meta：预处理信息，同 training_stage_prepro
+    '''
+    store, train_index, valid_index, test_index = training_stage_index(data_path, signal_length, signal_number, rate,
+                                                                       enhance, enhance_step, seed, channels,
+                                                                       sample_rate)
+    prepro_meta = {'signal_length': store.signal_length, 'normal': normal, 'scaler_mean': None, 'scaler_scale': None,
+                   'classes': list(store.classes), 'channels': list(channels), 'sample_rate': store.sample_rate,
+                   'rpm': store.rpm}
+    mean, scale = None, None
+    if normal:
+        mean, scale = streaming_scaler(store, train_index)
+        prepro_meta['scaler_mean'], prepro_meta['scaler_scale'] = mean, scale
+
+    train_sequence = WindowSequence(store, train_index, batch_size, mean=mean, scale=scale, shuffle=True, seed=seed)
+    valid_sequence, test_sequence = [WindowSequence(store, index, batch_size, mean=mean, scale=scale)
+                                     for index in (valid_index, test_index)]
+    return train_sequence, valid_sequence, test_sequence, prepro_meta
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:09
+
+@Author: Sun Jiahua
+
+@File  : signal_cache.py
+
+@Desc  : .mat 文件的信号缓存：
+            第一次读取某个 .mat 文件时，将其中的 DE/FE/BA 通道解码后按通道分别保存为 .npy 文件，并附带一个 .json 元数据文件；
+            之后再读取时直接以内存映射的方式打开 .npy，不再解析 .mat。
+            多个通道一起使用时，合并后的 (通道数, 数据长度) 数组也保存为一个 .npy 文件。
+            缓存以 文件路径 + 修改时间 + 文件大小 为键，文件发生变化后会自动重新生成。
+            采样频率与模型不同的数据（例如 12kHz 的数据用于 48kHz 的模型）用多相滤波重采样，重采样的结果也缓存为 .npy 文件。
+            在磁盘缓存之上还有一层进程内的 LRU 缓存，重复诊断同一个文件时不需要任何解析时间
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from math import gcd
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+from scipy.io import loadmat
+
+CHANNELS = ('DE', 'FE', 'BA')  # DE: 驱动端加速度数据，FE: 风扇端加速度数据，BA: 基座加速度数据
+SIGNAL_CACHE_PATH = os.environ.get('BEARING_SIGNAL_CACHE',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'signal_cache'))
+MEMORY_CACHE_SIZE = 32  # 进程内最多缓存的文件个数
+
+
+def temp_path(path):
+    '''
+    写文件时使用的临时文件名（每个进程、每个线程不同）：先写临时文件再替换，
+    多个进程或线程同时转换同一个文件时，不会互相覆盖或替换掉别人还没写完的临时文件
+    :param path: 最终的文件路径
+    :return: tmp_path：临时文件路径
+    '''
+    return '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+
+
+@contextmanager
+def file_lock(path, timeout=60.0, poll=0.05):
+    '''
+    文件锁（在 path 旁边独占地创建 <path>.lock，不依赖 fcntl，Windows 上也可以使用）：
+    多个进程或线程 读取-修改-写回 同一个文件时，同一时间只有一个在修改。
+    持有锁的进程异常退出时锁文件会留下来，超过 timeout 秒的锁文件被认为已经失效，直接删除
+    :param path: 要保护的文件路径
+    :param timeout: 锁文件的有效时间（秒）
+    :param poll: 等待锁时检查的间隔（秒）
+    :return:
+    '''
+    lock_path = path + '.lock'
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:  # 锁刚好被释放
+                continue
+            time.sleep(poll)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def cache_key(data_path):
+    '''
+    计算文件的缓存键：文件路径 + 修改时间 + 文件大小
+    :param data_path: .mat 文件路径
+    :return: key：缓存键（字符串）
+    '''
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    text = '%s|%d|%d' % (data_path, stat.st_mtime_ns, stat.st_size)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def convert_mat(data_path, cache_path, key):
+    '''
+    解析 .mat 文件，将各个通道的数据保存为 .npy 文件，元数据保存为 .json 文件
+    :param data_path: .mat 文件路径
+    :param cache_path: 缓存文件夹
+    :param key: 缓存键
+    :return: meta：元数据
+    '''
+    os.makedirs(cache_path, exist_ok=True)
+    file = loadmat(data_path)  # 读取 .mat 文件，返回的是一个 字典
+
+    meta = {'source': os.path.abspath(data_path), 'channels': {}, 'rpm': None}
+    for name in file.keys():
+        if name.startswith('__'):  # 跳过 __header__ 等信息
+            continue
+        if 'RPM' in name:  # 转速
+            meta['rpm'] = float(np.ravel(file[name])[0])
+            continue
+        for channel in CHANNELS:
+            if channel in name:  # 同一通道有多个变量时，与原来的读取方式一样，以最后一个为准
+                data = np.ascontiguousarray(file[name].ravel(), dtype=np.float64)
+                npy_path = os.path.join(cache_path, key + '_' + channel + '.npy')
+                tmp_path = temp_path(npy_path)
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, data)
+                os.replace(tmp_path, npy_path)  # 先写临时文件再替换，防止其他线程读到写了一半的文件
+                meta['channels'][channel] = {'name': name, 'length': int(data.shape[0])}
+
+    # 元数据最后写入，它存在就说明所有通道都已经写好了
+    meta_path = os.path.join(cache_path, key + '.json')
+    tmp_path = temp_path(meta_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+    return meta
+
+
+@lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def _load(data_path, mtime_ns, size, cache_path):
+    '''
+    读取缓存（进程内 LRU 缓存的实际读取函数，修改时间和文件大小只作为缓存键使用）
+    :return: signals：通道名 --> 内存映射的数据
+             meta：元数据
+    '''
+    key = cache_key(data_path)
+    meta_path = os.path.join(cache_path, key + '.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    else:  # 第一次读取该文件
+        meta = convert_mat(data_path, cache_path, key)
+
+    signals = {}
+    for channel in meta['channels']:
+        signals[channel] = np.load(os.path.join(cache_path, key + '_' + channel + '.npy'), mmap_mode='r')
+    return signals, meta
+
+
+def load_signals(data_path, cache_path=None):
+    '''
+    读取 .mat 文件中所有通道的数据
+    :param data_path: .mat 文件路径
+    :param cache_path: 缓存文件夹，默认为 SIGNAL_CACHE_PATH
+    :return: signals：字典，通道名（DE/FE/BA） --> 一维只读数组（内存映射）
+    '''
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    signals, _ = _load(data_path, stat.st_mtime_ns, stat.st_size, cache_path or SIGNAL_CACHE_PATH)
+    return dict(signals)  # 返回一个新字典，防止调用者修改缓存中的内容
+
+
+def load_signal(data_path, channel='DE', cache_path=None):
+    '''
+    读取 .mat 文件中某一个通道的数据
+    :param data_path: .mat 文件路径
+    :param channel: 通道名，默认 DE
+    :param cache_path: 缓存文件夹，默认为 SIGNAL_CACHE_PATH
+    :return: signal：一维只读数组（内存映射）
+    '''
+    signals = load_signals(data_path, cache_path)
+    if channel not in signals:
+        raise KeyError('文件 %s 中没有 %s 通道的数据' % (data_path, channel))
+    return signals[channel]
+
+
+@lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def _load_stacked(data_path, mtime_ns, size, cache_path, channels):
+    '''
+    读取多个通道合并后的缓存，没有时由各通道的数据合并生成（进程内 LRU 缓存的实际读取函数）
+    :return: signals：(通道数, 数据长度) 的内存映射数组
+    '''
+    signals, _ = _load(data_path, mtime_ns, size, cache_path)
+    for channel in channels:
+        if channel not in signals:
+            raise KeyError('文件 %s 中没有 %s 通道的数据' % (data_path, channel))
+
+    if 1 == len(channels):  # 只有一个通道时不需要合并
+        return signals[channels[0]][np.newaxis, :]
+
+    npy_path = os.path.join(cache_path, cache_key(data_path) + '_' + '-'.join(channels) + '.npy')
+    if not os.path.exists(npy_path):
+        length = min(len(signals[channel]) for channel in channels)  # 各通道长度不同时，截取到最短的长度
+        stacked = np.empty(shape=[len(channels), length])
+        for i, channel in enumerate(channels):
+            stacked[i] = signals[channel][:length]
+        tmp_path = temp_path(npy_path)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, stacked)
+        os.replace(tmp_path, npy_path)
+    return np.load(npy_path, mmap_mode='r')
+
+
+def resample_signal(signal, source_rate, target_rate):
+    '''
+    多相滤波重采样（先插值 up 倍、抗混叠低通滤波、再抽取 down 倍，up/down 为两个采样频率之比的最简分数）
+    :param signal: 信号，沿最后一个轴重采样
+    :param source_rate: 信号的采样频率
+    :param target_rate: 目标采样频率
+    :return: resampled：重采样后的信号，长度约为 原长度 * target_rate / source_rate
+    '''
+    from scipy.signal import resample_poly  # 只有需要重采样时才导入
+    divisor = gcd(int(source_rate), int(target_rate))
+    return resample_poly(signal, int(target_rate) // divisor, int(source_rate) // divisor, axis=-1)
+
+
+@lru_cache(maxsize=MEMORY_CACHE_SIZE)
+def _load_resampled(data_path, mtime_ns, size, cache_path, channels, source_rate, target_rate):
+    '''
+    读取重采样后的多通道数据的缓存，没有时重采样后生成（进程内 LRU 缓存的实际读取函数）
+    :return: signals：(通道数, 数据长度) 的内存映射数组
+    '''
+    npy_path = os.path.join(cache_path, '%s_%s_%d-%d.npy' % (cache_key(data_path), '-'.join(channels), source_rate,
+                                                            target_rate))
+    if not os.path.exists(npy_path):
+        signals = _load_stacked(data_path, mtime_ns, size, cache_path, channels)
+        resampled = np.ascontiguousarray(resample_signal(np.asarray(signals), source_rate, target_rate))
+        tmp_path = temp_path(npy_path)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, resampled)
+        os.replace(tmp_path, npy_path)
+    return np.load(npy_path, mmap_mode='r')
+
+
+def load_resampled(data_path, channels, source_rate, target_rate, cache_path=None):
+    '''
+    读取 .mat 文件中多个通道的数据并重采样到目标采样频率
+    :param data_path: .mat 文件路径
+    :param channels: 通道名列表
+    :param source_rate: 文件的采样频率
+    :param target_rate: 目标采样频率
+    :param cache_path: 缓存文件夹，默认为 SIGNAL_CACHE_PATH
+    :return: signals：(通道数, 数据长度) 的只读数组（内存映射）
+    '''
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    return _load_resampled(data_path, stat.st_mtime_ns, stat.st_size, cache_path or SIGNAL_CACHE_PATH,
+                           tuple(channels), int(source_rate), int(target_rate))
+
+
+def load_channels(data_path, channels=CHANNELS, cache_path=None):
+    '''
+    读取 .mat 文件中多个通道的数据，合并为一个 (通道数, 数据长度) 的数组，一次读取就可以得到所有传感器的数据
+    :param data_path: .mat 文件路径
+    :param channels: 通道名列表，默认 DE、FE、BA
+    :param cache_path: 缓存文件夹，默认为 SIGNAL_CACHE_PATH
+    :return: signals：(通道数, 数据长度) 的只读数组（内存映射）
+    '''
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    return _load_stacked(data_path, stat.st_mtime_ns, stat.st_size, cache_path or SIGNAL_CACHE_PATH, tuple(channels))
+
+
+def signal_metadata(data_path, cache_path=None):
+    '''
+    读取 .mat 文件的元数据（各通道的变量名、长度，转速）
+    :param data_path: .mat 文件路径
+    :param cache_path: 缓存文件夹，默认为 SIGNAL_CACHE_PATH
+    :return: meta：元数据字典
+    '''
+    data_path = os.path.abspath(data_path)
+    stat = os.stat(data_path)
+    _, meta = _load(data_path, stat.st_mtime_ns, stat.st_size, cache_path or SIGNAL_CACHE_PATH)
+    return meta
+
+
+def clear_memory_cache():
+    '''
+    清空进程内的 LRU 缓存（磁盘上的缓存不受影响）
+    :return:
+    '''
+    _load.cache_clear()
+    _load_stacked.cache_clear()
+    _load_resampled.cache_clear()
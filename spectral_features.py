@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:23
+
+@Author: Sun Jiahua
+
+@File  : spectral_features.py
+
+@Desc  : 频域特征提取，对 (N, L) 的样本矩阵一次性提取16个频域特征：
+            频带能量（8个）：把 0 ~ 采样频率/2 等分为8个频带，每个频带的能量占总能量的比例
+            频谱重心、频谱标准差
+            包络谱特征（6个）：希尔伯特包络谱在 外圈、内圈、滚动体 故障特征频率（BPFO、BPFI、BSF）
+                            及其二倍频处的幅值（除以包络谱的平均幅值）
+            同一长度的样本共用窗函数、频率轴、希尔伯特变换系数、各频带和特征频率对应的频率点（lru_cache 缓存），
+            FFT 使用 scipy.fft，同一长度的 FFT 计划由 scipy 内部缓存
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy import fft as sp_fft
+
+# 默认的采样频率和转速（real_time_data 中 0HP 负载、48kHz 的数据）。训练和诊断时应当传入实际的采样频率（模型包中记录的）
+# 和转速（数据文件中记录的），只有没有记录这些信息的旧模型、没有记录转速的数据才使用这两个默认值
+SAMPLE_RATE = 48000
+RPM = 1797
+# 驱动端轴承（6205-2RS JEM SKF）的故障特征频率与转频的倍数
+BPFO = 3.5848  # 外圈
+BPFI = 5.4152  # 内圈
+BSF = 2.3568  # 滚动体
+BAND_NUMBER = 8  # 频带个数
+SPECTRAL_FEATURE_NUMBER = BAND_NUMBER + 2 + 6
+
+
+@lru_cache(maxsize=16)
+def fft_plan(signal_length, sample_rate=SAMPLE_RATE, rpm=RPM):
+    '''
+    同一长度的样本共用的计算参数
+    :param signal_length: 样本长度
+    :param sample_rate: 采样频率
+    :param rpm: 转速
+    :return: plan：字典
+                freqs：rfft 的频率轴
+                window：包络谱使用的汉宁窗
+                hilbert：由 rfft 结果得到解析信号频谱的系数
+                band_edges：各频带的频率点边界
+                fault_bins：各故障特征频率（及二倍频）附近的频率点范围 [(起点, 终点), ...]
+    '''
+    freqs = sp_fft.rfftfreq(signal_length, 1.0 / sample_rate)
+
+    # 解析信号：正频率加倍，负频率置零（直流分量和奈奎斯特频率不变）
+    hilbert = np.full(len(freqs), 2.0)
+    hilbert[0] = 1.0
+    if 0 == signal_length % 2:
+        hilbert[-1] = 1.0
+
+    band_edges = np.linspace(0, len(freqs), BAND_NUMBER + 1).astype(np.int64)
+
+    resolution = float(sample_rate) / signal_length  # 频率分辨率
+    shaft_frequency = rpm / 60.0  # 转频
+    fault_bins = []
+    for multiple in (BPFO, BPFI, BSF):
+        for harmonic in (1, 2):
+            frequency = multiple * shaft_frequency * harmonic
+            tolerance = max(resolution, 0.02 * frequency)  # 转速有波动，在特征频率附近取最大值
+            low = int(np.floor((frequency - tolerance) / resolution))
+            high = int(np.ceil((frequency + tolerance) / resolution)) + 1
+            fault_bins.append((max(low, 1), min(max(high, low + 1), len(freqs))))
+
+    return {'freqs': freqs, 'window': np.hanning(signal_length), 'hilbert': hilbert, 'band_edges': band_edges,
+            'fault_bins': fault_bins}
+
+
+def spectral_feature_extraction(samples, sample_rate=SAMPLE_RATE, rpm=RPM, chunk_size=1024):
+    '''
+    批量提取频域特征
+    :param samples: 样本矩阵 (N, L)，一维数组会被当作单个样本；(N, 通道数, L) 的多通道样本每个通道分别提取特征
+    :param sample_rate: 采样频率
+    :param rpm: 转速；也可以是 (N,) 的数组，每个样本的转速（例如多个负载的数据一起训练时）
+    :param chunk_size: 每次处理的样本行数，用来限制中间结果占用的内存
+    :return: features：(N, 16) 的特征矩阵；多通道时为 (N, 通道数 * 16)，按通道依次排列
+    '''
+    samples = np.asarray(samples, dtype=np.float64)
+    if 1 == samples.ndim:
+        samples = samples[np.newaxis, :]
+    if 0 != np.ndim(rpm):  # 每个样本的转速：按转速分组，同一转速的样本共用一个 fft_plan
+        rpm = np.asarray(rpm, dtype=np.float64)
+        channel_number = samples.shape[1] if 3 == samples.ndim else 1
+        features = np.empty(shape=[samples.shape[0], channel_number * SPECTRAL_FEATURE_NUMBER])
+        for value in np.unique(rpm):
+            rows = np.flatnonzero(rpm == value)
+            features[rows] = spectral_feature_extraction(samples[rows], sample_rate, float(value), chunk_size)
+        return features
+    if 3 == samples.ndim:  # 多通道：把每个通道当作一个样本，提取完再按样本合并
+        sample_number, channel_number, size = samples.shape
+        features = spectral_feature_extraction(samples.reshape([sample_number * channel_number, size]), sample_rate,
+                                               rpm, chunk_size)
+        return features.reshape([sample_number, channel_number * SPECTRAL_FEATURE_NUMBER])
+    sample_number, size = samples.shape
+    plan = fft_plan(size, sample_rate, rpm)
+    freqs = plan['freqs']
+
+    features = np.empty(shape=[sample_number, SPECTRAL_FEATURE_NUMBER])
+    for start in range(0, sample_number, chunk_size):
+        data = samples[start: start + chunk_size]
+        out = features[start: start + chunk_size]
+
+        spectrum = sp_fft.rfft(data, axis=1)  # 频带能量和包络共用一次 FFT
+        power = np.square(np.abs(spectrum))
+        total_power = np.maximum(np.sum(power, axis=1), 1e-300)
+
+        # 频带能量占比
+        band_power = np.add.reduceat(power, plan['band_edges'][:-1], axis=1)
+        out[:, :BAND_NUMBER] = band_power / total_power[:, np.newaxis]
+
+        # 频谱重心、频谱标准差
+        centroid = power.dot(freqs) / total_power
+        out[:, BAND_NUMBER] = centroid
+        out[:, BAND_NUMBER + 1] = np.sqrt(np.maximum(power.dot(np.square(freqs)) / total_power - np.square(centroid), 0))
+
+        # 希尔伯特包络：解析信号的幅值
+        analytic = sp_fft.ifft(spectrum * plan['hilbert'], n=size, axis=1)
+        envelope = np.abs(analytic)
+        envelope -= np.mean(envelope, axis=1, keepdims=True)  # 去掉直流分量
+        envelope_spectrum = np.abs(sp_fft.rfft(envelope * plan['window'], axis=1))
+        envelope_mean = np.maximum(np.mean(envelope_spectrum[:, 1:], axis=1), 1e-300)
+
+        # 故障特征频率处的幅值
+        for i, (low, high) in enumerate(plan['fault_bins']):
+            out[:, BAND_NUMBER + 2 + i] = np.max(envelope_spectrum[:, low: high], axis=1) / envelope_mean
+
+    return features
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:11
+
+@Author: Sun Jiahua
+
+@File  : stream_diagnosis.py
+
+@Desc  : 流式实时诊断：
+            从数据源（按 48kHz 实时回放的文件、Unix socket 或 管道、生成器）连续读取振动数据，
+            用固定长度（signal_length）的环形缓冲区保存最新的信号，每到达 hop 个新数据就诊断一次，
+            并给出最近若干次诊断结果的滚动投票结果，同时统计每个窗口的延迟和持续吞吐量。
+            不标准化的时域特征随机森林模型用 online_features 增量地更新特征，每次诊断不需要对整个窗口重新提取特征
+"""
+
+import os
+import sys
+import stat
+import time
+import socket
+import argparse
+from collections import deque
+
+import numpy as np
+
+from data_preprocess import load_data, load_rpm
+from dataset_catalog import DEFAULT_SAMPLE_RATE
+from diagnosis import model_classes, predict_classes, predict_feature_probabilities, result_decode
+from model_bundle import model_type
+from model_registry import model_registry
+from online_features import OnlineFeatures, RingBuffer
+
+
+def file_replay_source(data_path, sample_rate=DEFAULT_SAMPLE_RATE, chunk_size=1024, realtime=True, loop=False,
+                       channel='DE'):
+    '''
+    数据源：按照采样频率回放 .mat 文件，模拟实时采集
+    :param data_path: .mat 文件路径
+    :param sample_rate: 回放的采样频率（模型的采样频率），文件的采样频率（由文件名解析）与它不同时先重采样，默认 48kHz
+    :param chunk_size: 每次送出的数据个数
+    :param realtime: 是否按照墙上时间回放，False 时尽可能快地送出数据
+    :param loop: 是否循环回放
+    :param channel: 通道名
+    :return: 生成器，每次生成一段一维数据
+    '''
+    signal = load_data(data_path, (channel,), sample_rate)
+    start_time = time.perf_counter()
+    sent = 0  # 已经送出的数据个数
+    while True:
+        for start in range(0, len(signal), chunk_size):
+            chunk = np.asarray(signal[start: start + chunk_size])
+            sent += len(chunk)
+            if realtime:  # 等到这一段数据“采集”完成的时刻再送出
+                delay = start_time + sent / sample_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+        if not loop:
+            return
+
+
+def socket_source(address, dtype='<f8', chunk_size=4096):
+    '''
+    数据源：从 Unix socket 或者 管道（命名管道、普通文件，'-' 表示标准输入）读取原始的二进制数据
+    :param address: socket 文件路径 或 管道路径
+    :param dtype: 数据类型，默认小端 float64
+    :param chunk_size: 每次最多读取的数据个数
+    :return: 生成器，每次生成一段一维数据
+    '''
+    dtype = np.dtype(dtype)
+    if '-' != address and stat.S_ISSOCK(os.stat(address).st_mode):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        read = sock.recv
+        close = sock.close
+    else:
+        fd = sys.stdin.fileno() if '-' == address else os.open(address, os.O_RDONLY)
+        read = lambda n: os.read(fd, n)
+        close = (lambda: None) if '-' == address else (lambda: os.close(fd))
+
+    rest = b''  # 上一次读取时剩下的、不足一个数据的字节
+    try:
+        while True:
+            data = read(chunk_size * dtype.itemsize)
+            if not data:  # 对方关闭了连接
+                return
+            data = rest + data
+            usable = len(data) - len(data) % dtype.itemsize
+            rest = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=dtype).astype(np.float64)
+    finally:
+        close()
+
+
+def generator_source(generator):
+    '''
+    数据源：把任意生成器（每次生成一个数据或者一段数据）包装为数据源
+    :param generator: 生成器 或 可迭代对象
+    :return: 生成器，每次生成一段一维数据
+    '''
+    for data in generator:
+        yield np.atleast_1d(np.asarray(data, dtype=np.float64))
+
+
+class StreamingDiagnoser(object):
+    """
+    流式诊断器：每到达 hop 个新数据，就对最新的 signal_length 个数据诊断一次
+    """
+
+    def __init__(self, model_file_path, signal_length=None, hop=None, normal=None, vote_size=20, max_backlog=None,
+                 rpm=None):
+        '''
+        :param model_file_path: 模型路径
+        :param signal_length: 信号长度，默认与训练时一致
+        :param hop: 每次诊断之间的新数据个数，默认为 signal_length 的一半
+        :param normal: 是否标准化，默认与训练时一致
+        :param vote_size: 滚动投票使用的最近诊断次数
+        :param max_backlog: 处理不过来时，一段数据中最多诊断的窗口数，多余的旧窗口直接跳过，以保证延迟有上限。None 表示不跳过
+        :param rpm: 数据流的转速（频域特征使用），默认为训练数据的转速
+        '''
+        bundle = model_registry.get_bundle(model_file_path)
+        if len(bundle.channels) > 1:
+            raise ValueError('流式诊断只支持单通道模型，该模型使用了 %s 通道' % '、'.join(bundle.channels))
+        self.model_file_path = model_file_path
+        self.model = bundle.model
+        self.sample_rate = bundle.sample_rate  # 数据流的采样频率应当与训练时相同
+        self.rpm = bundle.rpm if rpm is None else rpm
+        self.classes = model_classes(model_file_path)
+        self.signal_length = signal_length or bundle.signal_length
+        self.hop = hop or self.signal_length // 2
+        self.normal = bundle.normal if normal is None else normal
+        self.max_backlog = max_backlog
+        # 训练时保存的标准化参数，只有信号长度与训练时相同才能使用
+        self.scaler_stats = bundle.scaler_stats if self.signal_length == bundle.signal_length else None
+
+        # 随机森林只使用时域特征、且不标准化时（标准化参数与窗口中的位置有关，不能增量计算），增量地更新特征
+        self.online_features = None
+        if 'random_forest' == model_type(model_file_path) and 'time' == getattr(self.model, 'feature_set', 'time') \
+                and not self.normal:
+            self.online_features = OnlineFeatures(self.signal_length)
+        self.ring = RingBuffer(self.signal_length) if self.online_features is None else self.online_features.ring
+        self.votes = deque(maxlen=vote_size)  # 最近的诊断结果
+        self.pending = 0  # 上一次诊断之后到达的新数据个数
+        # 没有训练时的标准化参数时，标准化使用整个数据流的均值和标准差
+        self.sum = 0.0
+        self.square_sum = 0.0
+
+        self.window_number = 0  # 诊断过的窗口数
+        self.dropped = 0  # 跳过的窗口数
+        self.sample_number = 0  # 收到的数据个数
+        self.latencies = deque(maxlen=10000)  # 每个窗口的延迟（秒）
+        self.start_time = None
+
+    def classify(self, window):
+        '''
+        诊断一个窗口
+        :param window: 一维数据
+        :return: 预测的类别
+        '''
+        if self.online_features is not None:  # 特征已经随数据到达更新好了
+            features = self.online_features.features()[np.newaxis, :]
+            return int(np.argmax(predict_feature_probabilities(self.model, self.model_file_path, features), axis=1)[0])
+        if self.normal and self.scaler_stats is not None:
+            window = (window - self.scaler_stats[0]) / self.scaler_stats[1]
+        elif self.normal:
+            mean = self.sum / self.sample_number  # sum、square_sum 累加了收到的所有数据
+            std = np.sqrt(max(self.square_sum / self.sample_number - mean * mean, 1e-12))
+            window = (window - mean) / std
+        return int(predict_classes(self.model, self.model_file_path, window[np.newaxis, :], self.rpm)[0])
+
+    def extend(self, data):
+        '''
+        把新数据写入缓冲区（增量计算特征时同时更新特征）
+        :param data: 一维数据
+        :return:
+        '''
+        if self.online_features is not None:
+            self.online_features.push(data)
+        else:
+            self.ring.extend(data)
+
+    def feed(self, chunk, arrival_time=None):
+        '''
+        送入一段新数据，返回这段数据触发的所有诊断结果
+        :param chunk: 一维数据
+        :param arrival_time: 这段数据到达的时刻（time.perf_counter()），用来计算延迟
+        :return: results：诊断结果的列表
+        '''
+        if arrival_time is None:
+            arrival_time = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = arrival_time
+        chunk = np.asarray(chunk, dtype=np.float64)
+        self.sample_number += len(chunk)
+        self.sum += float(np.sum(chunk))
+        self.square_sum += float(np.dot(chunk, chunk))
+
+        # 计算这段数据中每个窗口结束的位置
+        first = self.hop - self.pending
+        if not self.ring.full():  # 缓冲区还没有填满时，第一个窗口在填满的时刻
+            first = max(first, self.signal_length - self.ring.count)
+        ends = list(range(first, len(chunk) + 1, self.hop))
+        if self.max_backlog is not None and len(ends) > self.max_backlog:
+            self.dropped += len(ends) - self.max_backlog
+            ends = ends[-self.max_backlog:]
+
+        results = []
+        written = 0
+        for end in ends:
+            self.extend(chunk[written: end])
+            written = end
+            y_pred = self.classify(self.ring.window())
+            self.votes.append(y_pred)
+            rolling_pred = int(np.argmax(np.bincount(self.votes)))
+            latency = time.perf_counter() - arrival_time
+            self.latencies.append(latency)
+            self.window_number += 1
+            results.append({'index': self.window_number,
+                            'position': self.sample_number - len(chunk) + end,  # 窗口结束位置在整个数据流中的位置
+                            'pred': y_pred,
+                            'rolling_pred': rolling_pred,
+                            'pred_result': result_decode(rolling_pred, self.classes),
+                            'latency': latency})
+        self.extend(chunk[written:])
+        self.pending = (self.pending + len(chunk)) % self.hop if not ends else len(chunk) - ends[-1]
+        return results
+
+    def stream(self, source, max_windows=None):
+        '''
+        从数据源连续诊断
+        :param source: 数据源（生成器）
+        :param max_windows: 最多诊断的窗口数，None 表示直到数据源结束
+        :return: 生成器，生成每个窗口的诊断结果
+        '''
+        for chunk in source:
+            for result in self.feed(chunk, time.perf_counter()):
+                yield result
+                if max_windows is not None and self.window_number >= max_windows:
+                    return
+
+    def summary(self):
+        '''
+        统计延迟和吞吐量
+        :return: 统计结果字典
+        '''
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        latencies = np.asarray(self.latencies) * 1000
+        report = {'windows': self.window_number,
+                  'dropped': self.dropped,
+                  'samples': self.sample_number,
+                  'elapsed': elapsed,
+                  'windows_per_second': self.window_number / elapsed if elapsed > 0 else 0.0,
+                  'samples_per_second': self.sample_number / elapsed if elapsed > 0 else 0.0}
+        if len(latencies):
+            report.update({'latency_mean_ms': float(np.mean(latencies)),
+                           'latency_p50_ms': float(np.percentile(latencies, 50)),
+                           'latency_p95_ms': float(np.percentile(latencies, 95)),
+                           'latency_max_ms': float(np.max(latencies))})
+        if self.votes:
+            report['pred_result'] = result_decode(int(np.argmax(np.bincount(self.votes))), self.classes)
+        return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='流式实时诊断')
+    parser.add_argument('model', help='模型路径（.m 或 .h5）')
+    parser.add_argument('--file', default=os.path.join('real_time_data', '0HP', '48k_Drive_End_B007_0_122.mat'),
+                        help='回放的 .mat 文件')
+    parser.add_argument('--socket', help='从 Unix socket 或 管道 读取 float64 数据（- 表示标准输入），指定后忽略 --file')
+    parser.add_argument('--sample-rate', type=int, help='回放的采样频率，必须与模型的采样频率相同（文件的采样频率不同时先重采样）')
+    parser.add_argument('--no-realtime', action='store_true', help='不按采样频率回放，尽可能快地送出数据')
+    parser.add_argument('--hop', type=int, help='每次诊断之间的新数据个数')
+    parser.add_argument('--max-windows', type=int, help='最多诊断的窗口数')
+    parser.add_argument('--max-backlog', type=int, help='一段数据中最多诊断的窗口数')
+    parser.add_argument('--rpm', type=float, help='转速，默认为回放文件中记录的转速，没有时为训练数据的转速')
+    args = parser.parse_args()
+
+    rpm = args.rpm if args.rpm or args.socket else load_rpm(args.file)
+    diagnoser = StreamingDiagnoser(args.model, hop=args.hop, max_backlog=args.max_backlog, rpm=rpm)
+    if args.sample_rate and args.sample_rate != diagnoser.sample_rate:  # 窗口长度和频域特征都是按模型的采样频率计算的
+        parser.error('模型的采样频率为 %d Hz，数据流的采样频率必须与它相同' % diagnoser.sample_rate)
+    if args.socket:
+        source = socket_source(args.socket)
+    else:
+        source = file_replay_source(args.file, diagnoser.sample_rate, realtime=not args.no_realtime)
+    for result in diagnoser.stream(source, args.max_windows):
+        print('窗口 %d（位置 %d）：%s，延迟 %.2f ms' % (result['index'], result['position'], result['pred_result'],
+                                                result['latency'] * 1000))
+    for name, value in diagnoser.summary().items():
+        print('%s: %s' % (name, value))
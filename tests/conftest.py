@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:17
+
+@Author: Sun Jiahua
+
+@File  : conftest.py
+
+@Desc  : 测试的公共设置：项目的模块都在根目录下，把根目录加入 sys.path
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
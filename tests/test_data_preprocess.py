@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:20
+
+@Author: Sun Jiahua
+
+@File  : test_data_preprocess.py
+
+@Desc  : 数据预处理的测试：滑动窗口视图、样本仓库按索引取出样本
+"""
+
+import numpy as np
+
+from data_preprocess import SampleStore, window_view
+
+
+def test_window_view():
+    signal = np.arange(10, dtype=np.float64)
+    view = window_view(signal, 4)
+    assert view.shape == (7, 4)
+    np.testing.assert_array_equal(view[3], signal[3: 7])
+    assert window_view(signal[:3], 4).shape == (0, 4)  # 信号比窗口短时没有窗口
+
+    channels = np.vstack([signal, -signal])
+    np.testing.assert_array_equal(window_view(channels, 4)[2], channels[:, 2: 6])
+
+
+def test_gather_and_standardize():
+    store = SampleStore(4)
+    store.add('a', np.arange(10, dtype=np.float64), label=0, rpm=1797)
+    store.add('b', np.arange(100, 120, dtype=np.float64), label=1)
+    index = np.array([[1, 5], [0, 2], [1, 0]])
+    np.testing.assert_array_equal(store.gather(index), [[105, 106, 107, 108], [2, 3, 4, 5], [100, 101, 102, 103]])
+    np.testing.assert_array_equal(store.label_of(index), [1, 0, 1])
+    assert store.rpm_of(index)[1] == 1797
+
+    mean, scale = np.full(4, 2.0), np.full(4, 4.0)
+    np.testing.assert_allclose(store.gather(index, mean=mean, scale=scale), (store.gather(index) - 2.0) / 4.0)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:17
+
+@Author: Sun Jiahua
+
+@File  : test_diagnosis.py
+
+@Desc  : 诊断的测试：提前结束的诊断结论与所有样本投票的结论一致
+"""
+
+import numpy as np
+import pytest
+
+import diagnosis
+
+CLASSES = ['类别0', '类别1', '类别2']
+
+
+class FakeRegistry(object):
+    def get(self, model_file_path):
+        return None
+
+
+def fake_predict_probabilities(model, model_file_path, diagnosis_samples, chunk_size=1024, rpm=None):
+    '''样本本身就是模型给出的类别，返回对应的 one-hot 概率'''
+    return np.eye(len(CLASSES))[diagnosis_samples[:, 0]]
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(diagnosis, 'model_registry', FakeRegistry())
+    monkeypatch.setattr(diagnosis, 'model_classes', lambda model_file_path: CLASSES)
+    monkeypatch.setattr(diagnosis, 'predict_probabilities', fake_predict_probabilities)
+
+
+@pytest.mark.parametrize('p', [[0.8, 0.1, 0.1], [0.5, 0.3, 0.2], [0.45, 0.4, 0.15], [0.34, 0.33, 0.33]])
+def test_early_stop_matches_full_vote(fake_model, p):
+    rng = np.random.default_rng(0)
+    stopped = 0
+    for _ in range(200):
+        samples = rng.choice(len(CLASSES), size=[500, 1], p=p)
+        early = diagnosis.diagnose(samples, 'model.m', early_stop=True)
+        full = diagnosis.diagnose(samples, 'model.m', early_stop=False)
+        assert full.window_number == 500
+        assert early.pred == full.pred
+        stopped += early.window_number < 500
+    if p[0] >= 0.5:  # 差距明显时应当提前结束
+        assert stopped > 0
+
+
+def test_look_alpha_is_corrected(fake_model, monkeypatch):
+    alphas = []
+
+    def spy(votes, remaining, alpha):
+        alphas.append(alpha)
+        return False
+
+    monkeypatch.setattr(diagnosis, 'decided', spy)
+    diagnosis.diagnose(np.zeros([500, 1], dtype=np.int64), 'model.m', alpha=1e-3, min_windows=50)
+    # 第 50、100、……、500 个样本之后各检验一次，共 10 次
+    assert len(alphas) == 10
+    assert alphas[0] == pytest.approx(1e-4)
+
+
+def test_empty_samples_raise(fake_model):
+    with pytest.raises(ValueError):
+        diagnosis.diagnose(np.zeros([0, 1], dtype=np.int64), 'model.m')
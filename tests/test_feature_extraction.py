@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:20
+
+@Author: Sun Jiahua
+
+@File  : test_feature_extraction.py
+
+@Desc  : 特征提取的测试：批量提取、增量提取与逐个样本调用 feature_extraction 的结果相同
+"""
+
+import numpy as np
+import pytest
+
+from data_preprocess import window_view
+from feature_extraction import FEATURE_SETS, batch_feature_extraction, extract_features, feature_extraction
+from online_features import sliding_features
+
+
+def make_signal(size, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(size)
+    return np.sin(2 * np.pi * t / 37.0) + 0.3 * rng.standard_normal(size) + 0.05
+
+
+def test_batch_matches_feature_extraction():
+    samples = window_view(make_signal(3000), 256)[::97]
+    expected = np.array([feature_extraction(sample) for sample in samples])
+    np.testing.assert_allclose(batch_feature_extraction(samples, chunk_size=7), expected, rtol=1e-10)
+
+
+def test_batch_multichannel_is_per_channel():
+    samples = np.stack([window_view(make_signal(2000, seed), 128)[::50] for seed in (1, 2)], axis=1)
+    features = batch_feature_extraction(samples)
+    assert features.shape == (samples.shape[0], 32)
+    np.testing.assert_allclose(features[:, :16], batch_feature_extraction(samples[:, 0]))
+    np.testing.assert_allclose(features[:, 16:], batch_feature_extraction(samples[:, 1]))
+
+
+@pytest.mark.parametrize('signal_length, hop', [(256, 64), (256, 256), (100, 333), (500, 1)])
+def test_sliding_features_matches_batch(signal_length, hop):
+    signal = make_signal(4000)
+    expected = batch_feature_extraction(window_view(signal, signal_length)[::hop])
+    np.testing.assert_allclose(sliding_features(signal, signal_length, hop), expected, rtol=1e-7, atol=1e-9)
+
+
+def test_extract_features_sets():
+    samples = window_view(make_signal(5000), 1024)[::500]
+    time_features = extract_features(samples, 'time')
+    spectral = extract_features(samples, 'spectral', 48000, 1797)
+    both = extract_features(samples, 'time+spectral', 48000, 1797)
+    assert set(FEATURE_SETS) == {'time', 'spectral', 'time+spectral'}
+    np.testing.assert_array_equal(both, np.hstack([time_features, spectral]))
+    with pytest.raises(ValueError):
+        extract_features(samples, 'frequency')
+
+
+def test_spectral_per_sample_rpm():
+    samples = window_view(make_signal(5000), 1024)[::500]
+    rpms = np.where(np.arange(len(samples)) % 2, 1730.0, 1797.0)
+    expected = np.vstack([extract_features(sample[np.newaxis], 'spectral', 48000, rpm)
+                          for sample, rpm in zip(samples, rpms)])
+    np.testing.assert_allclose(extract_features(samples, 'spectral', 48000, rpms), expected)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 14:20
+
+@Author: Sun Jiahua
+
+@File  : test_online_features.py
+
+@Desc  : 环形缓冲区的测试：窗口按时间顺序排列，写入的数据个数正确
+"""
+
+import numpy as np
+
+from online_features import RingBuffer
+
+
+def test_window_is_in_time_order():
+    ring = RingBuffer(8)
+    data = np.arange(1, 30, dtype=np.float64)
+    written = 0
+    for size in (3, 5, 1, 7, 2, 6, 5):  # 各种长度的写入，包括跨过缓冲区末尾的写入
+        ring.extend(data[written: written + size])
+        written += size
+        window = ring.window()
+        expected = np.concatenate([np.zeros(max(8 - written, 0)), data[max(written - 8, 0): written]])
+        np.testing.assert_array_equal(window, expected)
+        assert ring.count == written
+        assert ring.full() == (written >= 8)
+
+
+def test_long_write_counts_every_sample():
+    ring = RingBuffer(8)
+    ring.extend(np.arange(3, dtype=np.float64))
+    ring.extend(np.arange(3, 23, dtype=np.float64))  # 比缓冲区长，只保留最后 8 个
+    assert ring.count == 23
+    np.testing.assert_array_equal(ring.window(), np.arange(15, 23))
+    ring.extend(np.array([23.0, 24.0]))
+    np.testing.assert_array_equal(ring.window(), np.arange(17, 25))
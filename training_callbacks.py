@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:30
+
+@Author: Sun Jiahua
+
+@File  : training_callbacks.py
+
+@Desc  : keras 模型训练的回调函数：
+            按验证集损失提前结束训练（EarlyStopping），保存验证集损失最小的模型（ModelCheckpoint），
+            每隔若干轮保存一次完整的模型（包括优化器状态）和训练状态（已训练的轮数、历史曲线、提前结束的计数），
+            训练中断后可以从最后一次保存的位置继续训练；
+            以及训练进度（每轮的损失、正确率、吞吐量、预计剩余时间）和取消训练
+
+            检查点文件（checkpoint_dir/<模型名>_<训练签名的前16位>/ 下，每次训练（数据 + 超参数）一个文件夹，
+            同时进行的不同训练（例如界面上的训练和超参数搜索）不会读到或覆盖别人的检查点）：
+                <模型名>_last.h5    最近一次保存的完整模型
+                <模型名>_best.h5    验证集损失最小的模型
+                <模型名>_state.json 训练状态
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+from keras.callbacks import Callback, EarlyStopping, ModelCheckpoint
+
+from signal_cache import temp_path
+
+
+def run_checkpoint_dir(checkpoint_dir, model_name, signature):
+    '''
+    一次训练的检查点文件夹：以模型名称和训练签名区分
+    :param checkpoint_dir: 检查点文件夹
+    :param model_name: 模型名称
+    :param signature: 训练的签名（见 training_signature）
+    :return: 文件夹路径
+    '''
+    return os.path.join(checkpoint_dir, '%s_%s' % (model_name, signature[:16]))
+
+
+def checkpoint_paths(checkpoint_dir, model_name):
+    '''
+    检查点文件路径
+    :param checkpoint_dir: 检查点文件夹
+    :param model_name: 模型名称
+    :return: last_path, best_path, state_path
+    '''
+    prefix = os.path.join(checkpoint_dir, model_name)
+    return prefix + '_last.h5', prefix + '_best.h5', prefix + '_state.json'
+
+
+def training_signature(X_train, y_train, config):
+    '''
+    训练的签名：数据（形状 + 抽样的部分数据的哈希）和超参数。签名不同的检查点不能用来继续训练
+    :param X_train: 训练集
+    :param y_train: 训练集标签
+    :param config: 超参数等设置（可以转为 JSON 的字典）
+    :return: signature：字符串
+    '''
+    sha1 = hashlib.sha1()
+    step = max(len(X_train) // 64, 1)
+    for array in (X_train, y_train):
+        sha1.update(str(array.shape).encode('utf-8'))
+        sha1.update(np.ascontiguousarray(array[::step]).tobytes())
+    sha1.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def load_training_state(checkpoint_dir, model_name, signature):
+    '''
+    读取训练状态，签名一致且最近一次的模型存在时才返回
+    :return: state：字典，没有可以继续的训练时返回 None
+    '''
+    last_path, _, state_path = checkpoint_paths(checkpoint_dir, model_name)
+    if not (os.path.exists(state_path) and os.path.exists(last_path)):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    return state if signature == state.get('signature') else None
+
+
+def clear_checkpoints(checkpoint_dir, model_name):
+    '''
+    删除检查点文件（训练正常完成后调用）
+    :return:
+    '''
+    for path in checkpoint_paths(checkpoint_dir, model_name):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class ResumableEarlyStopping(EarlyStopping):
+    """
+    可以继续的 EarlyStopping：继续训练时恢复 最小的验证集损失 和 没有改善的轮数
+    """
+
+    def __init__(self, state=None, **kwargs):
+        super(ResumableEarlyStopping, self).__init__(**kwargs)
+        self.state = state
+
+    def on_train_begin(self, logs=None):
+        super(ResumableEarlyStopping, self).on_train_begin(logs)
+        if self.state is not None and self.state.get('best') is not None:
+            self.best = self.state['best']
+            self.wait = self.state['wait']
+
+
+class TrainingState(Callback):
+    """
+    每隔 period 轮保存一次完整的模型和训练状态（先写临时文件再替换，保存到一半时中断也不会损坏之前的检查点）
+    """
+
+    def __init__(self, checkpoint_dir, model_name, signature, early_stopping, history=None, period=1):
+        super(TrainingState, self).__init__()
+        self.last_path, _, self.state_path = checkpoint_paths(checkpoint_dir, model_name)
+        self.signature = signature
+        self.early_stopping = early_stopping
+        self.history = history or {}  # 之前各轮的历史曲线
+        self.period = period
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        if 0 != (epoch + 1) % self.period:
+            return
+        self.save(epoch + 1)
+
+    def on_train_end(self, logs=None):
+        self.save(len(next(iter(self.history.values()), [])), stopped=self.early_stopping.stopped_epoch > 0)
+
+    def save(self, epoch, stopped=False):
+        tmp_path = temp_path(self.last_path)
+        self.model.save(tmp_path)
+        os.replace(tmp_path, self.last_path)
+        best = self.early_stopping.best
+        state = {'signature': self.signature, 'epoch': epoch, 'history': self.history, 'stopped': stopped,
+                 'best': None if np.isinf(best) else float(best), 'wait': int(self.early_stopping.wait)}
+        tmp_path = temp_path(self.state_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+
+class TrainingProgress(Callback):
+    """
+    训练进度：每轮结束后调用 report 发送 损失、正确率、吞吐量（样本/s）和预计剩余时间；
+    每个批次结束后调用 check_cancel，需要取消训练时由它抛出异常（已保存的检查点保留，下次可以继续训练）
+    """
+
+    def __init__(self, report, check_cancel=None):
+        super(TrainingProgress, self).__init__()
+        self.report = report
+        self.check_cancel = check_cancel
+        self.epoch_times = []
+        self.epoch_start = 0
+        self.epoch_samples = 0
+
+    def on_train_begin(self, logs=None):
+        self.epoch_times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.time()
+        self.epoch_samples = 0
+
+    def on_batch_end(self, batch, logs=None):
+        self.epoch_samples += (logs or {}).get('size', 0)  # fit_generator 的 params 中没有样本数，按批次累加
+        if self.check_cancel is not None:
+            self.check_cancel()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.time() - self.epoch_start
+        self.epoch_times.append(elapsed)
+        epochs = self.params['epochs']
+        samples = self.epoch_samples or self.params.get('samples')
+        self.report({'type': 'epoch', 'epoch': epoch + 1, 'epochs': epochs, 'elapsed': elapsed,
+                     'logs': dict((key, float(value)) for key, value in (logs or {}).items()),
+                     'samples_per_second': samples / elapsed if samples and elapsed > 0 else None,
+                     'eta': float(np.mean(self.epoch_times)) * (epochs - epoch - 1)})
+
+
+def training_callbacks(checkpoint_dir, model_name, signature, patience, state=None, period=1, verbose=1):
+    '''
+    创建训练使用的回调函数
+    :param checkpoint_dir: 检查点文件夹
+    :param model_name: 模型名称
+    :param signature: 训练的签名
+    :param patience: 验证集损失连续多少轮没有改善就提前结束
+    :param state: 继续训练时的训练状态
+    :param period: 每隔多少轮保存一次完整的模型
+    :param verbose: 提前结束时是否输出
+    :return: callbacks：回调函数列表
+    '''
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    _, best_path, _ = checkpoint_paths(checkpoint_dir, model_name)
+    early_stopping = ResumableEarlyStopping(state=state, monitor='val_loss', patience=patience,
+                                            verbose=verbose)
+    checkpoint = ModelCheckpoint(best_path, monitor='val_loss', save_best_only=True, verbose=0)
+    if state is not None and state.get('best') is not None:
+        checkpoint.best = state['best']  # 继续训练时，只有比之前最好的还要好才覆盖
+    history = dict((key, list(value)) for key, value in (state or {}).get('history', {}).items())
+    return [early_stopping, checkpoint,
+            TrainingState(checkpoint_dir, model_name, signature, early_stopping, history, period)]
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:33
+
+@Author: Sun Jiahua
+
+@File  : training_job.py
+
+@Desc  : 训练任务：在子进程中完成 预处理 → 训练 → 评估绘图（不与界面线程争抢 GIL），
+            各阶段和每轮的进度（耗时、吞吐量、损失、正确率、预计剩余时间）通过队列发回主进程，
+            主进程的转发线程再通过 MyMessageSignal 发给界面。
+            神经网络使用流式数据（sample_sequence），训练时占用的内存只与批次大小有关。
+            取消训练时设置事件，子进程在 每个批次 / 每个阶段 结束后检查并退出（神经网络的检查点保留，下次可以继续训练），
+            超过 CANCEL_TIMEOUT 秒仍未退出（例如随机森林的训练无法中途停止）时强制结束子进程。
+            训练好的模型由子进程保存到 model_file_path，主进程不需要加载模型
+"""
+
+import os
+import time
+import queue
+import threading
+import traceback
+import multiprocessing
+
+# 神经网络训练的检查点，训练中断后再次训练同样的数据时继续训练（与工作目录无关，默认在项目文件夹中）
+CHECKPOINT_PATH = os.environ.get('BEARING_CHECKPOINT_PATH',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints'))
+CANCEL_TIMEOUT = 30  # 取消后等待子进程退出的时间（秒）
+# 神经网络模型的训练函数和训练轮数
+KERAS_TRAINERS = {'1D_CNN': ('training_with_1D_CNN', 20),
+                  'LSTM': ('training_with_LSTM', 60),
+                  'GRU': ('training_with_GRU', 60)}
+
+
+class TrainingCancelled(Exception):
+    """
+    训练被取消
+    """
+
+
+def model_suffix(model_name):
+    '''
+    模型文件的后缀名
+    :param model_name: 模型名字
+    :return: '.m'（随机森林）或 '.h5'
+    '''
+    return '.m' if 'random_forest' == model_name else '.h5'
+
+
+def stage_message(stage, start, samples=None):
+    '''
+    阶段完成的进度消息
+    :param stage: 阶段名称
+    :param start: 阶段开始的时间
+    :param samples: 该阶段处理的样本数
+    :return: msg：字典
+    '''
+    elapsed = time.time() - start
+    return {'type': 'stage', 'stage': stage, 'elapsed': elapsed,
+            'samples_per_second': samples / elapsed if samples and elapsed > 0 else None}
+
+
+def format_progress(msg):
+    '''
+    把进度消息转为显示的文字
+    :param msg: 进度消息
+    :return: text：字符串
+    '''
+    if 'info' == msg['type']:
+        return msg['text']
+    speed = '' if msg['samples_per_second'] is None else '，%.0f 样本/s' % msg['samples_per_second']
+    if 'stage' == msg['type']:
+        return '%s完成：%.1f s%s' % (msg['stage'], msg['elapsed'], speed)
+    logs = msg['logs']
+    metrics = '，'.join('%s %.4f' % (key, logs[key]) for key in ('loss', 'acc', 'val_loss', 'val_acc') if key in logs)
+    return '第 %d/%d 轮：%s，%.1f s%s，预计剩余 %.0f s' % (msg['epoch'], msg['epochs'], metrics, msg['elapsed'], speed,
+                                                   msg['eta'])
+
+
+def run_training(model_name, data_path, signal_length, signal_number, normal, rate, model_file_path, report,
+                 check_cancel, checkpoint_dir=CHECKPOINT_PATH):
+    '''
+    训练模型（在子进程中执行）：预处理 → 训练 → 评估（测试集预测一次） → 绘图 → 保存模型
+    :param model_name: 模型名字：'1D_CNN'、'LSTM'、'GRU'、'random_forest'
+    :param data_path: 数据路径
+    :param signal_length: 信号长度
+    :param signal_number: 每个文件抽取的信号个数
+    :param normal: 是否标准化
+    :param rate: 训练集，验证集，测试集 划分比例
+    :param model_file_path: 训练好的模型（及模型包）的保存路径
+    :param report: 发送进度消息的函数
+    :param check_cancel: 检查是否取消的函数，取消时抛出 TrainingCancelled
+    :param checkpoint_dir: 神经网络训练的检查点文件夹
+    :return: msg：训练结果（模型名字、模型路径、分类报告、得分、预处理信息、各种图）
+    '''
+    # 在子进程中才导入 keras 等，主进程不需要
+    import training_model
+    from feature_cache import random_forest_dataset
+    from model_bundle import ModelBundle, save_evaluation
+    from preprocess_train_result import plot_history_curcvs, evaluate_model, evaluation_report
+    from sample_sequence import training_stage_sequences
+    from training_callbacks import TrainingProgress
+
+    if 'random_forest' != model_name:
+        from tensorflow import test
+        report({'type': 'info', 'text': '检测到GPU可用' if test.is_gpu_available() else '未检测到可用GPU'})
+
+    # 固定抽样的随机种子：随机森林可以直接读取缓存的特征矩阵，神经网络可以从检查点继续训练
+    start = time.time()
+    if 'random_forest' == model_name:
+        X_train, y_train, X_test, y_test, prepro_meta = random_forest_dataset(
+            data_path, signal_length, signal_number, normal, rate, enhance=False, seed=0)
+    else:  # 只划分样本的索引，训练时按批次取出样本
+        X_train, X_valid, X_test, prepro_meta = training_stage_sequences(
+            data_path, signal_length, signal_number, normal, rate, enhance=False, seed=0, batch_size=128)
+        y_train, y_valid, y_test = None, None, None
+    report(stage_message('预处理', start, X_train.shape[0] + X_test.shape[0]))
+    check_cancel()
+
+    start = time.time()
+    if 'random_forest' == model_name:
+        model, score = training_model.fit_random_forest(X_train, y_train, X_test, y_test)
+        history = None
+    else:
+        trainer, epochs = KERAS_TRAINERS[model_name]
+        model, history, score = getattr(training_model, trainer)(
+            X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=epochs,
+            num_classes=len(prepro_meta['classes']), checkpoint_dir=checkpoint_dir,
+            callbacks=[TrainingProgress(report, check_cancel)])
+    report(stage_message('训练', start, X_train.shape[0]))
+    check_cancel()
+
+    start = time.time()
+    evaluation = evaluate_model(model, model_name, X_test, y_test)  # 测试集只预测一次，所有报告共用
+    report(stage_message('评估', start, X_test.shape[0]))
+    check_cancel()
+
+    start = time.time()
+    # 随机森林没有 损失曲线和正确率曲线
+    figures = {} if history is None else plot_history_curcvs(history, None, model_name)
+    images, classification_report = evaluation_report(evaluation, model_name)
+    figures.update(images)
+    report(stage_message('绘图', start))
+
+    ModelBundle(model, **prepro_meta).save(model_file_path)
+    save_evaluation(model_file_path, evaluation)  # 与模型一起保存，以后查看时不需要重新预测
+    return {'model_name': model_name, 'model_file_path': model_file_path,
+            'classification_report': classification_report, 'score': str(score), 'prepro_meta': prepro_meta, 'figures': figures}
+
+
+def job_worker(args, result_queue, cancel_event, checkpoint_dir=CHECKPOINT_PATH):
+    '''
+    子进程的入口：训练结束、取消或出错时，向队列发送最后一条消息
+    :param args: run_training 的参数 (model_name, data_path, signal_length, signal_number, normal, rate, model_file_path)
+    :param result_queue: 进度和结果的队列
+    :param cancel_event: 取消事件
+    :param checkpoint_dir: 神经网络训练的检查点文件夹
+    :return:
+    '''
+    def check_cancel():
+        if cancel_event.is_set():
+            raise TrainingCancelled()
+
+    try:
+        msg = run_training(*args, report=result_queue.put, check_cancel=check_cancel, checkpoint_dir=checkpoint_dir)
+        msg['type'] = 'end'
+    except TrainingCancelled:
+        msg = {'type': 'cancelled'}
+    except Exception:
+        msg = {'type': 'error', 'error': traceback.format_exc()}
+    result_queue.put(msg)
+
+
+class TrainingJob(object):
+    """
+    训练任务：启动子进程，转发进度，取消
+    """
+
+    def __init__(self, progress_signal, end_signal, checkpoint_dir=CHECKPOINT_PATH):
+        '''
+        :param progress_signal: 进度信号（MyMessageSignal），每个阶段 / 每轮发送一次，msg['text'] 为显示的文字
+        :param end_signal: 结束信号（MyMessageSignal），msg['type'] 为 'end'、'cancelled' 或 'error'
+        :param checkpoint_dir: 神经网络训练的检查点文件夹，默认为 CHECKPOINT_PATH
+        '''
+        self.progress_signal = progress_signal
+        self.end_signal = end_signal
+        self.checkpoint_dir = checkpoint_dir
+        self.process = None
+        self.cancel_event = None
+        self.cancel_time = None
+
+    def start(self, model_name, data_path, signal_length, signal_number, normal, rate, model_file_path):
+        '''
+        启动训练子进程
+        :param model_file_path: 训练好的模型的保存路径
+        :return:
+        '''
+        context = multiprocessing.get_context('spawn')  # 不复制主进程的界面和 TensorFlow 状态
+        result_queue = context.Queue()
+        self.cancel_event = context.Event()
+        self.cancel_time = None
+        args = (model_name, data_path, signal_length, signal_number, normal, rate, model_file_path)
+        # 不使用守护进程，否则子进程中随机森林不能多进程并行；关闭窗口时由 terminate() 结束
+        self.process = context.Process(target=job_worker,
+                                       args=(args, result_queue, self.cancel_event, self.checkpoint_dir))
+        self.process.start()
+        relay_thread = threading.Thread(target=self.relay, args=(self.process, result_queue), daemon=True)
+        relay_thread.start()
+
+    def running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def cancel(self):
+        '''
+        请求取消训练（子进程在下一个检查点退出）
+        :return:
+        '''
+        if self.running() and self.cancel_time is None:
+            self.cancel_time = time.time()
+            self.cancel_event.set()
+
+    def terminate(self):
+        '''
+        强制结束训练子进程（关闭窗口时调用）
+        :return:
+        '''
+        if self.running():
+            self.process.terminate()
+            self.process.join()
+
+    def relay(self, process, result_queue):
+        '''
+        转发线程：把子进程的消息转发给界面，直到收到最后一条消息
+        :return:
+        '''
+        while True:
+            try:
+                msg = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.cancel_time is not None and time.time() - self.cancel_time > CANCEL_TIMEOUT:
+                    process.terminate()  # 无法中途停止的阶段，强制结束
+                    msg = {'type': 'cancelled'}
+                elif not process.is_alive():  # 子进程异常退出，没有发送最后一条消息
+                    msg = {'type': 'error', 'error': '训练进程异常退出，退出码：%s' % process.exitcode}
+                else:
+                    continue
+            if msg['type'] in ('info', 'stage', 'epoch'):
+                msg['text'] = format_progress(msg)
+                self.progress_signal.send_msg.emit(msg)
+                continue
+            process.join()
+            self.end_signal.send_msg.emit(msg)
+            return
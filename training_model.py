@@ -10,21 +10,144 @@ Created on 2021/2/2 11:36
 @Desc  : 训练模型的相关函数
 """
 
+import os
+import shutil
+import tempfile
+
+from keras.callbacks import History
 from keras.layers import Dense, Conv1D, BatchNormalization, MaxPooling1D, Activation, Flatten, LSTM, Dropout, GRU
-from keras.models import Sequential
+from keras.models import Sequential, load_model
 from keras.regularizers import l2
+from keras.utils import Sequence
 from keras import backend as K
-from sklearn.ensemble import RandomForestClassifier
-import numpy as np
 
-from feature_extraction import feature_extraction
+from data_preprocess import channels_first, channels_last
+from model_registry import model_registry
+# 随机森林的训练不需要 keras，放在 random_forest_model.py 中，这里导入是为了兼容原来的调用方式
+from random_forest_model import RANDOM_FOREST_PARAMS, random_forest_features, fit_random_forest, \
+    training_with_random_forest
+from sample_sequence import WindowSequence
+from training_callbacks import checkpoint_paths, clear_checkpoints, load_training_state, run_checkpoint_dir, \
+    training_callbacks, training_signature
+
+# 流式数据（Sequence）取批次的线程数和预先取出的批次数
+GENERATOR_WORKERS = 4
+GENERATOR_QUEUE_SIZE = 10
+
+
+def model_input(X, layout):
+    '''
+    把数据排列为模型的输入
+    :param X: 数组，或流式数据 WindowSequence
+    :param layout: 'channels_last'（1D_CNN）或 'channels_first'（LSTM、GRU）
+    :return: 排列后的数组 或 WindowSequence
+    '''
+    if isinstance(X, WindowSequence):
+        return X.with_layout(layout)
+    return channels_last(X) if 'channels_last' == layout else channels_first(X)
+
+
+def evaluate_keras(model, X_test, y_test):
+    '''
+    在测试集上评估 keras 模型
+    :param model: 模型
+    :param X_test: 测试集（数组 或 Sequence）
+    :param y_test: 测试集标签，Sequence 时为 None
+    :return: score：[损失, 正确率]
+    '''
+    if isinstance(X_test, Sequence):
+        return model.evaluate_generator(X_test, workers=GENERATOR_WORKERS, max_queue_size=GENERATOR_QUEUE_SIZE)
+    return model.evaluate(X_test, y_test, verbose=0)
 
 
-def training_with_1D_CNN(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=20, num_classes=10):
+def fit_with_checkpoints(build_model, model_name, config, X_train, y_train, X_valid, y_valid, batch_size, epochs,
+                         verbose=1, patience=10, checkpoint_dir=None, callbacks=None, keep_checkpoints=False):
+    '''
+    训练 keras 模型：验证集损失连续 patience 轮没有改善时提前结束，结束后恢复验证集损失最小的权重；
+    给出 checkpoint_dir 时每轮保存检查点（保存在以训练签名区分的子文件夹中），
+    训练中断后再次调用（数据和超参数相同）会从最后一次保存的位置继续训练，训练正常完成后删除检查点。
+    keep_checkpoints 为 True 时训练完成后保留检查点，之后用更大的 epochs 再次调用会接着训练（超参数搜索的逐次减半）
+    :param build_model: 创建并编译模型的函数（无参数）
+    :param model_name: 模型名称，即检查点文件名的前缀
+    :param config: 超参数等设置，与数据一起决定能否从检查点继续训练
+    :param X_train: 训练集，或流式数据（keras Sequence，每轮自己打乱顺序），
+                    Sequence 由 fit_generator 用 GENERATOR_WORKERS 个线程取批次，预先取出 GENERATOR_QUEUE_SIZE 个批次
+    :param y_train: 训练集标签，Sequence 时为 None
+    :param X_valid: 验证集（数组 或 Sequence）
+    :param y_valid: 验证集标签，Sequence 时为 None
+    :param batch_size: 模性训练的 批次大小（Sequence 的批次大小由它自己决定）
+    :param epochs: 模性训练的（最大）轮数
+    :param verbose: 训练时的输出模式
+    :param patience: 验证集损失连续多少轮没有改善就提前结束
+    :param checkpoint_dir: 检查点文件夹，为 None 时使用临时文件夹（不能继续训练）
+    :param callbacks: 额外的回调函数（例如训练进度）
+    :param keep_checkpoints: 训练完成后是否保留检查点（需要给出 checkpoint_dir）
+    :return:
+            model：训练完成的模型
+            history：History，history.history 包括之前中断的各轮
+    '''
+    K.clear_session()  # 清除会话，否则当执行完一个神经网络，接着执行下一个神经网络时可能会会报错
+    model_registry.evict_keras_models()  # 清除会话后，之前缓存的 keras 模型不能再使用
+
+    resumable = checkpoint_dir is not None
+    if not resumable:
+        checkpoint_dir = tempfile.mkdtemp(prefix='checkpoint_')
+    try:
+        streaming = isinstance(X_train, Sequence)
+        if streaming:  # 流式数据的签名：样本索引
+            signature = training_signature(X_train.index, X_train.labels, config)
+        else:
+            signature = training_signature(X_train, y_train, config)
+        if resumable:  # 数据或超参数不同的训练使用不同的文件夹，同时训练时互不干扰
+            checkpoint_dir = run_checkpoint_dir(checkpoint_dir, model_name, signature)
+        state = load_training_state(checkpoint_dir, model_name, signature) if resumable else None
+        last_path, best_path, _ = checkpoint_paths(checkpoint_dir, model_name)
+        if state is None:
+            clear_checkpoints(checkpoint_dir, model_name)  # 没有保存完整的检查点，不能继续训练
+            model = build_model()
+            initial_epoch = 0
+        else:
+            model = load_model(last_path)  # 包括优化器的状态
+            initial_epoch = state['epoch']
+            if verbose:
+                print('从第 %d 轮继续训练：%s' % (initial_epoch, last_path))
+
+        checkpoint_callbacks = training_callbacks(checkpoint_dir, model_name, signature, patience, state,
+                                                  verbose=verbose)
+        callbacks = checkpoint_callbacks + list(callbacks or [])
+        if not (state is not None and state['stopped']) and initial_epoch < epochs:
+            if streaming:
+                model.fit_generator(X_train, epochs=epochs, verbose=verbose,
+                                    validation_data=X_valid if isinstance(X_valid, Sequence) else (X_valid, y_valid),
+                                    shuffle=False, callbacks=callbacks, initial_epoch=initial_epoch,
+                                    workers=GENERATOR_WORKERS, max_queue_size=GENERATOR_QUEUE_SIZE)
+            else:
+                model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, verbose=verbose,
+                          validation_data=(X_valid, y_valid), shuffle=True,
+                          callbacks=callbacks, initial_epoch=initial_epoch)
+
+        history = History()
+        history.history = checkpoint_callbacks[-1].history
+        history.epoch = list(range(len(history.history.get('loss', []))))
+        if os.path.exists(best_path):
+            model.load_weights(best_path)  # 恢复验证集损失最小的权重
+        if not (resumable and keep_checkpoints):
+            clear_checkpoints(checkpoint_dir, model_name)
+        if resumable and not keep_checkpoints:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)  # 训练完成，删除这次训练的文件夹
+    finally:
+        if not resumable:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return model, history
+
+
+def training_with_1D_CNN(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=20, num_classes=10,
+                         filters=32, kernel_size=20, strides=8, dense_units=100, verbose=1, patience=5,
+                         checkpoint_dir=None, callbacks=None, keep_checkpoints=False):
     '''
     使用 1D_CNN 进行训练
-    :param X_train: 训练集
-    :param y_train: 训练集标签
+    :param X_train: 训练集，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)，也可以是流式数据 WindowSequence
+    :param y_train: 训练集标签，流式数据时为 None（下同）
     :param X_valid: 验证集
     :param y_valid: 验证集标签
     :param X_test: 测试集
@@ -32,51 +155,66 @@ def training_with_1D_CNN(X_train, y_train, X_valid, y_valid, X_test, y_test, bat
     :param batch_size: 模性训练的 批次大小
     :param epochs: 模性训练的轮数
     :param num_classes: 分类数
+    :param filters: 卷积核个数
+    :param kernel_size: 卷积核大小
+    :param strides: 卷积步长
+    :param dense_units: 全连接层的单元数
+    :param verbose: 训练时的输出模式
+    :param patience: 验证集损失连续多少轮没有改善就提前结束
+    :param checkpoint_dir: 检查点文件夹，给出时训练中断后可以继续训练
+    :param callbacks: 额外的回调函数（例如训练进度）
+    :param keep_checkpoints: 训练完成后是否保留检查点，之后用更大的 epochs 再次训练时接着训练
     :return:
             model：训练完成的模型
             history：模性训练(fit)的返回参数
             score：模型在验证集上的得分
     '''
-    X_train, X_valid, X_test = X_train[:, :, np.newaxis], X_valid[:, :, np.newaxis], X_test[:, :, np.newaxis]  # 添加一个新的维度
+    # (N, signal_length, 通道数)，单通道时添加一个新的维度
+    X_train, X_valid, X_test = [model_input(X, 'channels_last') for X in (X_train, X_valid, X_test)]
     # 输入数据的维度
     input_shape = X_train.shape[1:]
 
-    K.clear_session()  # 清除会话，否则当执行完一个神经网络，接着执行下一个神经网络时可能会会报错
-
-    # 实例化一个Sequential
-    model = Sequential()
-
-    # 第一层卷积
-    model.add(Conv1D(filters=32, kernel_size=20, strides=8, padding='same', kernel_regularizer=l2(1e-4),
-                     input_shape=input_shape))
-    model.add(BatchNormalization())
-    model.add(Activation('relu'))
-    model.add(MaxPooling1D(pool_size=4, strides=4, padding='valid'))
-    # 从卷积到全连接需要展平
-    model.add(Flatten())
-    # 添加全连接层
-    model.add(Dense(units=100, activation='relu', kernel_regularizer=l2(1e-4)))
-    # 增加输出层，共num_classes个单元
-    model.add(Dense(units=num_classes, activation='softmax', kernel_regularizer=l2(1e-4)))
-
-    # 编译模型
-    model.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
-    # model.summary()
+    def build_model():
+        # 实例化一个Sequential
+        model = Sequential()
+
+        # 第一层卷积
+        model.add(Conv1D(filters=filters, kernel_size=kernel_size, strides=strides, padding='same',
+                         kernel_regularizer=l2(1e-4), input_shape=input_shape))
+        model.add(BatchNormalization())
+        model.add(Activation('relu'))
+        model.add(MaxPooling1D(pool_size=4, strides=4, padding='valid'))
+        # 从卷积到全连接需要展平
+        model.add(Flatten())
+        # 添加全连接层
+        model.add(Dense(units=dense_units, activation='relu', kernel_regularizer=l2(1e-4)))
+        # 增加输出层，共num_classes个单元
+        model.add(Dense(units=num_classes, activation='softmax', kernel_regularizer=l2(1e-4)))
+
+        # 编译模型
+        model.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        # model.summary()
+        return model
 
     # 开始模型训练
-    history = model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, verbose=1,
-                        validation_data=(X_valid, y_valid), shuffle=True)
+    config = {'filters': filters, 'kernel_size': kernel_size, 'strides': strides, 'dense_units': dense_units,
+              'num_classes': num_classes, 'batch_size': batch_size}
+    model, history = fit_with_checkpoints(build_model, '1D_CNN', config, X_train, y_train, X_valid, y_valid,
+                                          batch_size, epochs, verbose, patience, checkpoint_dir, callbacks,
+                                          keep_checkpoints)
     # 评估模型
-    score = model.evaluate(X_test, y_test, verbose=0)
+    score = evaluate_keras(model, X_test, y_test)
 
     return model, history, score
 
 
-def training_with_LSTM(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=60, num_classes=10):
+def training_with_LSTM(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=60, num_classes=10,
+                       units=(64, 128, 256), dropout=0.5, verbose=1, patience=10, checkpoint_dir=None,
+                       callbacks=None, keep_checkpoints=False):
     '''
     使用 LSTM 进行训练
-    :param X_train: 训练集
-    :param y_train: 训练集标签
+    :param X_train: 训练集，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)，也可以是流式数据 WindowSequence
+    :param y_train: 训练集标签，流式数据时为 None（下同）
     :param X_valid: 验证集
     :param y_valid: 验证集标签
     :param X_test: 测试集
@@ -84,48 +222,59 @@ def training_with_LSTM(X_train, y_train, X_valid, y_valid, X_test, y_test, batch
     :param batch_size: 模性训练的 批次大小
     :param epochs: 模性训练的轮数
     :param num_classes: 分类数
+    :param units: 每一层 LSTM 的单元数
+    :param dropout: 每一层之后 Dropout 的比例
+    :param verbose: 训练时的输出模式
+    :param patience: 验证集损失连续多少轮没有改善就提前结束
+    :param checkpoint_dir: 检查点文件夹，给出时训练中断后可以继续训练
+    :param callbacks: 额外的回调函数（例如训练进度）
+    :param keep_checkpoints: 训练完成后是否保留检查点，之后用更大的 epochs 再次训练时接着训练
     :return:
             model：训练完成的模型
             history：模性训练(fit)的返回参数
             score：模型在验证集上的得分
     '''
-    X_train, X_valid, X_test = X_train[:, np.newaxis, :], X_valid[:, np.newaxis, :], X_test[:, np.newaxis, :]  # 添加一个新的维度
+    # (N, 通道数, signal_length)，单通道时添加一个新的维度
+    X_train, X_valid, X_test = [model_input(X, 'channels_first') for X in (X_train, X_valid, X_test)]
     # 输入数据的维度
     input_shape = X_train.shape[1:]
 
-    K.clear_session()  # 清除会话，否则当执行完一个神经网络，接着执行下一个神经网络时可能会会报错
-
-    model_LSTM = Sequential()
-    # LSTM 第一层
-    model_LSTM.add(LSTM(64, return_sequences=True, input_shape=input_shape))
-    model_LSTM.add(Dropout(0.5))
-    # LSTM 第二层
-    model_LSTM.add(LSTM(128, return_sequences=True))
-    model_LSTM.add(Dropout(0.5))
-    # LSTM 第三层
-    model_LSTM.add(LSTM(256))
-    model_LSTM.add(Dropout(0.5))
-    # Dense层
-    model_LSTM.add(Dense(num_classes, activation='sigmoid'))
-
-    # 编译模型
-    model_LSTM.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
-    # model.summary()
+    def build_model():
+        model_LSTM = Sequential()
+        # LSTM 层，默认三层：64、128、256，最后一层只输出最后一个时刻
+        for i, unit in enumerate(units):
+            last = len(units) - 1 == i
+            if 0 == i:
+                model_LSTM.add(LSTM(unit, return_sequences=not last, input_shape=input_shape))
+            else:
+                model_LSTM.add(LSTM(unit, return_sequences=not last))
+            model_LSTM.add(Dropout(dropout))
+        # Dense层
+        model_LSTM.add(Dense(num_classes, activation='sigmoid'))
+
+        # 编译模型
+        model_LSTM.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        # model.summary()
+        return model_LSTM
 
     # 开始模型训练
-    history = model_LSTM.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, verbose=1,
-                             validation_data=(X_valid, y_valid), shuffle=True)
+    config = {'units': list(units), 'dropout': dropout, 'num_classes': num_classes, 'batch_size': batch_size}
+    model_LSTM, history = fit_with_checkpoints(build_model, 'LSTM', config, X_train, y_train, X_valid, y_valid,
+                                               batch_size, epochs, verbose, patience, checkpoint_dir, callbacks,
+                                               keep_checkpoints)
     # 评估模型
-    score = model_LSTM.evaluate(X_test, y_test, verbose=0)
+    score = evaluate_keras(model_LSTM, X_test, y_test)
 
     return model_LSTM, history, score
 
 
-def training_with_GRU(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=60, num_classes=10):
+def training_with_GRU(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_size=128, epochs=60, num_classes=10,
+                      units=(64, 128), dropout=0.5, verbose=1, patience=10, checkpoint_dir=None,
+                      callbacks=None, keep_checkpoints=False):
     '''
     使用 GRU 进行训练
-    :param X_train: 训练集
-    :param y_train: 训练集标签
+    :param X_train: 训练集，(N, signal_length) 或 多通道的 (N, 通道数, signal_length)，也可以是流式数据 WindowSequence
+    :param y_train: 训练集标签，流式数据时为 None（下同）
     :param X_valid: 验证集
     :param y_valid: 验证集标签
     :param X_test: 测试集
@@ -133,74 +282,46 @@ def training_with_GRU(X_train, y_train, X_valid, y_valid, X_test, y_test, batch_
     :param batch_size: 模性训练的 批次大小
     :param epochs: 模性训练的轮数
     :param num_classes: 分类数
+    :param units: 每一层 GRU 的单元数
+    :param dropout: 每一层之后 Dropout 的比例
+    :param verbose: 训练时的输出模式
+    :param patience: 验证集损失连续多少轮没有改善就提前结束
+    :param checkpoint_dir: 检查点文件夹，给出时训练中断后可以继续训练
+    :param callbacks: 额外的回调函数（例如训练进度）
+    :param keep_checkpoints: 训练完成后是否保留检查点，之后用更大的 epochs 再次训练时接着训练
     :return:
             model：训练完成的模型
             history：模性训练(fit)的返回参数
             score：模型在验证集上的得分
     '''
-    X_train, X_valid, X_test = X_train[:, np.newaxis, :], X_valid[:, np.newaxis, :], X_test[:, np.newaxis, :]  # 添加一个新的维度
+    # (N, 通道数, signal_length)，单通道时添加一个新的维度
+    X_train, X_valid, X_test = [model_input(X, 'channels_first') for X in (X_train, X_valid, X_test)]
     # 输入数据的维度
     input_shape = X_train.shape[1:]
 
-    K.clear_session()  # 清除会话，否则当执行完一个神经网络，接着执行下一个神经网络时可能会会报错
-
-    model_GRU = Sequential()
-    model_GRU.add(GRU(64, return_sequences=True, input_shape=input_shape, activation='tanh'))
-    model_GRU.add(Dropout(0.5))
-    model_GRU.add(GRU(128, activation='tanh'))
-    model_GRU.add(Dropout(0.5))
-    model_GRU.add(Dense(num_classes, activation='sigmoid'))
-
-    # 编译模型
-    model_GRU.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
-    # model.summary()
+    def build_model():
+        model_GRU = Sequential()
+        # GRU 层，默认两层：64、128，最后一层只输出最后一个时刻
+        for i, unit in enumerate(units):
+            last = len(units) - 1 == i
+            if 0 == i:
+                model_GRU.add(GRU(unit, return_sequences=not last, input_shape=input_shape, activation='tanh'))
+            else:
+                model_GRU.add(GRU(unit, return_sequences=not last, activation='tanh'))
+            model_GRU.add(Dropout(dropout))
+        model_GRU.add(Dense(num_classes, activation='sigmoid'))
+
+        # 编译模型
+        model_GRU.compile(optimizer='Adam', loss='categorical_crossentropy', metrics=['accuracy'])
+        # model.summary()
+        return model_GRU
 
     # 开始模型训练
-    history = model_GRU.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, verbose=1,
-                             validation_data=(X_valid, y_valid), shuffle=True)
+    config = {'units': list(units), 'dropout': dropout, 'num_classes': num_classes, 'batch_size': batch_size}
+    model_GRU, history = fit_with_checkpoints(build_model, 'GRU', config, X_train, y_train, X_valid, y_valid,
+                                              batch_size, epochs, verbose, patience, checkpoint_dir, callbacks,
+                                              keep_checkpoints)
     # 评估模型
-    score = model_GRU.evaluate(X_test, y_test, verbose=0)
+    score = evaluate_keras(model_GRU, X_test, y_test)
 
     return model_GRU, history, score
-
-
-def training_with_random_forest(X_train, y_train, X_valid, y_valid, X_test, y_test):
-    '''
-    使用 随机森林 进行训练
-    :param X_train: 训练集
-    :param y_train: 训练集标签
-    :param X_valid: 验证集
-    :param y_valid: 验证集标签
-    :param X_test: 测试集
-    :param y_test: 测试集标签
-    :return:
-            clf_rfc：训练完成的模型
-            score：模型在验证集上的得分
-            X_train_feature_extraction：将原数据进行了特征提取过的训练集
-            X_test_feature_extraction：将原数据进行了特征提取过的测试集
-    '''
-    # 把训练集和验证集合并，全部用作训练集
-    X_train = np.vstack((X_train, X_valid))
-    y_train = np.vstack((y_train, y_valid))
-
-    # 将one-hot编码了的标签解码（这里不需要one-hot编码）
-    y_train = [np.argmax(item) for item in y_train]
-    y_train = np.array(y_train)
-    y_test = [np.argmax(item) for item in y_test]
-    y_test = np.array(y_test)
-
-    loader = np.empty(shape=[X_train.shape[0], 16])
-    for i in range(X_train.shape[0]):
-        loader[i] = feature_extraction(X_train[i])
-    X_train_feature_extraction = loader
-
-    loader = np.empty(shape=[X_test.shape[0], 16])
-    for i in range(X_test.shape[0]):
-        loader[i] = feature_extraction(X_test[i])
-    X_test_feature_extraction = loader
-
-    clf_rfc = RandomForestClassifier(n_estimators=17, max_depth=21, criterion='gini', min_samples_split=2,
-                                       max_features=9, random_state=60 )
-    clf_rfc.fit(X_train_feature_extraction, y_train)
-    score = clf_rfc.score(X_test_feature_extraction, y_test)
-    return clf_rfc, score, X_train_feature_extraction, X_test_feature_extraction
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:19
+
+@Author: Sun Jiahua
+
+@File  : visualization.py
+
+@Desc  : 绘图相关的函数：
+            在内存中绘图（不再先保存图片文件再读取），
+            绘制长信号时按像素列抽取最小值、最大值（包络），不论信号多长，绘制的点数只与图片宽度有关，
+            以及已经绘制好的图片的缓存
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def figure_to_rgba(fig):
+    '''
+    在内存中绘制图片
+    :param fig: matplotlib 的 Figure
+    :return: image：(高, 宽, 4) 的 uint8 数组（RGBA）
+    '''
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.array(canvas.buffer_rgba())  # 复制一份，Figure 释放后也可以使用
+
+
+def minmax_decimate(data, columns):
+    '''
+    包络抽取：把信号分成 columns 段（每段对应图片上的一列像素），每段只保留最小值和最大值
+    :param data: 一维信号
+    :param columns: 段数，一般为图片的宽度（像素）
+    :return: x：横坐标（每段的中心位置，每段两个点）
+             y：每段的最小值和最大值
+    '''
+    data = np.asarray(data).ravel()
+    if len(data) <= 2 * columns:  # 信号比较短，不需要抽取
+        return np.arange(len(data)), data
+
+    edges = np.linspace(0, len(data), columns + 1).astype(np.int64)
+    starts = edges[:-1]
+    y = np.empty(shape=[columns, 2])
+    y[:, 0] = np.minimum.reduceat(data, starts)
+    y[:, 1] = np.maximum.reduceat(data, starts)
+    x = np.repeat((starts + edges[1:]) // 2, 2)
+    return x, y.ravel()
+
+
+def render_signal(data, width, height, dpi=100):
+    '''
+    绘制完整的信号（包络抽取后绘制），图片大小直接为显示区域的大小，不需要再缩放
+    :param data: 一维信号，或者 (通道数, 数据长度) 的多通道信号（每个通道画一行）
+    :param width: 图片宽度（像素）
+    :param height: 图片高度（像素）
+    :param dpi: 分辨率
+    :return: image：RGBA 数组
+    '''
+    data = np.atleast_2d(data)
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    axes = fig.subplots(len(data), 1, sharex=True, squeeze=False)[:, 0]
+    for ax, channel in zip(axes, data):
+        x, y = minmax_decimate(channel, columns=width)
+        ax.plot(x, y, linewidth=0.6)
+    axes[0].set_xlim(0, data.shape[1])
+    fig.tight_layout()
+    return figure_to_rgba(fig)
+
+
+class RenderCache(object):
+    """
+    绘制结果的缓存（LRU），切换显示时直接取出，不需要重新绘制
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def get(self, key, render):
+        '''
+        取出缓存的绘制结果，没有时调用 render() 绘制并缓存
+        :param key: 缓存键
+        :param render: 绘制函数（无参数）
+        :return: 绘制结果
+        '''
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        item = render()
+        self._items[key] = item
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return item
+
+    def clear(self):
+        self._items.clear()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 2026/10/18 13:15
+
+@Author: Sun Jiahua
+
+@File  : window_sampler.py
+
+@Desc  : 样本抽样器：
+            一次性为所有文件抽取样本的起始位置，得到 (N, 2) 的索引数组，每一行为 (文件序号, 起始位置)，
+            之后用一次花式索引取出所有样本。使用带种子的 np.random.Generator，相同的种子得到相同的样本。
+            支持三种方式：
+                random  : 在指定区间内随机抽取
+                enhance : 数据增强，随机抽取起始位置后，按 enhance_step 顺延连续取若干个样本
+                strided : 按固定的间隔取遍整个区间
+"""
+
+import numpy as np
+
+
+class WindowSampler(object):
+    """
+    样本抽样器。区间用 lows、highs 表示：第 i 个文件的样本必须完整地落在 [lows[i], highs[i]) 中
+    """
+
+    def __init__(self, signal_length, seed=None):
+        self.signal_length = signal_length
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def index(file_indexes, starts):
+        '''
+        把文件序号和起始位置合成 (N, 2) 的索引数组
+        :param file_indexes: 文件序号
+        :param starts: 起始位置
+        :return: index
+        '''
+        index = np.empty(shape=[len(starts), 2], dtype=np.int64)
+        index[:, 0] = file_indexes
+        index[:, 1] = starts
+        return index
+
+    def random(self, lows, highs, count):
+        '''
+        每个文件在区间内随机抽取 count 个样本（所有文件一次抽取）
+        :param lows: 每个文件区间的起点
+        :param highs: 每个文件区间的终点
+        :param count: 每个文件抽取的样本数
+        :return: index：(文件数 * count, 2) 的索引数组，按文件排列
+        '''
+        lows = np.asarray(lows, dtype=np.int64)
+        highs = np.asarray(highs, dtype=np.int64)
+        file_indexes = np.repeat(np.arange(len(lows)), count)
+        # high - signal_length：保证从任何一个位置开始都可以取到完整的数据长度
+        starts = self.rng.integers(lows[file_indexes], highs[file_indexes] - self.signal_length)
+        return self.index(file_indexes, starts)
+
+    def enhance(self, lows, highs, count, enhance_step):
+        '''
+        数据增强：随机抽取起始位置，然后每次顺延 enhance_step 连续取 signal_length // enhance_step 个样本，直到取够 count 个
+        :param lows: 每个文件区间的起点
+        :param highs: 每个文件区间的终点
+        :param count: 每个文件抽取的样本数
+        :param enhance_step: 顺延的间隔
+        :return: index：(文件数 * count, 2) 的索引数组，按文件排列
+        '''
+        lows = np.asarray(lows, dtype=np.int64)
+        highs = np.asarray(highs, dtype=np.int64)
+        enc_time = max(self.signal_length // enhance_step, 1)  # 每个随机起始位置顺延的次数
+        group_number = -(-count // enc_time)  # 向上取整
+        # 顺延最多 signal_length，所以起始位置要留出 2 * signal_length
+        group_starts = self.rng.integers(lows[:, np.newaxis], (highs - 2 * self.signal_length)[:, np.newaxis],
+                                         size=(len(lows), group_number))
+        starts = group_starts[:, :, np.newaxis] + enhance_step * np.arange(1, enc_time + 1)
+        starts = starts.reshape([len(lows), -1])[:, :count]
+        return self.index(np.repeat(np.arange(len(lows)), count), starts.ravel())
+
+    def strided(self, lows, highs, hop):
+        '''
+        按固定间隔取遍每个文件的区间
+        :param lows: 每个文件区间的起点
+        :param highs: 每个文件区间的终点
+        :param hop: 相邻两个样本起始位置的间隔
+        :return: index：索引数组，按文件排列
+        '''
+        starts = [np.arange(low, high - self.signal_length + 1, hop, dtype=np.int64) for low, high in zip(lows, highs)]
+        file_indexes = np.repeat(np.arange(len(starts)), [len(s) for s in starts])
+        return self.index(file_indexes, np.concatenate(starts) if starts else np.empty(0, dtype=np.int64))